@@ -0,0 +1,215 @@
+from flask import Flask, Response, request
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+import json
+import os
+import threading
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from util import access_token, badge, negative_cache, spotify_async, themes
+from util.cache_policy import get_cache_headers, get_policy
+from util.svg_writer import Segments, make_body
+from util.swr import make_swr_key, swr_cache
+
+# Many badges in one request, for org READMEs that show every member:
+#
+#   /api/batch?uids=a,b,c&theme=compact             one SVG grid
+#   /api/batch?uids=a,b,c&format=ndjson             {"uid", "svg"} per line,
+#                                                   streamed as each finishes
+#
+# Tokens for all uids come from one batched Firestore read; each badge is
+# built on a bounded per-process pool, behind the stale-while-revalidate
+# badge cache, through the async Spotify path (util/spotify_async.py). The
+# grid gets the cache policy (util/cache_policy.py) of its shortest-lived
+# badge; uids that failed keep their cell as a placeholder tile. Each cell is
+# an <image> with the badge as a data URI, not a nested <svg>: the themes'
+# <style> rules (.bar, div, keyframes) would otherwise apply to every cell.
+# The data URIs are base64-encoded segment by segment once per build and the
+# grid is written as segments too (util/svg_writer.py), so no badge body is
+# joined or decoded on the way.
+
+BATCH_MAX_UIDS = int(os.getenv("BATCH_MAX_UIDS", "50"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+BATCH_COLUMNS = 2
+
+app = Flask(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+
+    global _executor, _executor_pid
+
+    # Worker threads do not survive a fork
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(BATCH_WORKERS, thread_name_prefix="batch")
+                _executor_pid = os.getpid()
+
+    return _executor
+
+
+def get_uids(value):
+
+    uids = []
+    for uid in (value or "").split(","):
+        uid = uid.strip()
+        if uid and uid not in uids:
+            uids.append(uid)
+
+    return uids
+
+
+def render_uid(uid, token_info, options):
+
+    if token_info is None:
+        # Revoked uids are left out of the Firestore read
+        if negative_cache.get_invalid(uid) is not None:
+            return {"uid": uid, "error": "InvalidTokenError"}
+        return {"uid": uid, "error": "unknown uid"}
+
+    def build():
+        token = access_token.get_access_token(uid, token_info)
+        built = spotify_async.run_sync(badge.build_badge_async(token, options, uid))
+        # Encoded once per build, reused by every grid the badge appears in
+        return dict(built, data_uri=make_data_uri(built["body"]))
+
+    try:
+        built, age = swr_cache.get(make_swr_key(uid, options), build)
+    except Exception as e:
+        return {"uid": uid, "error": type(e).__name__}
+
+    # Throttled fallbacks are stale too, as in api/index.py
+    stale = built["stale"] or age >= swr_cache.fresh_for
+    policy = (built["is_playing"], built["progress_ms"], built["duration_ms"], stale, built["animated"])
+    return {"uid": uid, "svg": built["body"], "data_uri": built["data_uri"], "policy": policy}
+
+
+def get_policy_args(result):
+
+    # A failed uid gets the short stale policy, so it is retried soon
+    return result.get("policy", (False, None, None, True, False))
+
+
+def get_grid_cache_headers(results, now=None):
+
+    # The grid is cached no longer than its shortest-lived badge
+    is_playing, progress_ms, duration_ms, stale, animated = min(
+        (get_policy_args(result) for result in results), key=lambda args: get_policy(*args)
+    )
+    return get_cache_headers(is_playing, progress_ms, duration_ms, stale, now, animated)
+
+
+def make_data_uri(parts):
+
+    # base64 per segment, carrying the bytes short of a 3-byte group over to
+    # the next one; memoryview slices keep the cover segment from being copied
+    data_uri = Segments([b"data:image/svg+xml;base64,"])
+    carry = b""
+    for part in parts:
+        part = memoryview(part)
+        if carry:
+            head = carry + part[:3 - len(carry)].tobytes()
+            part = part[3 - len(carry):]
+            if len(head) < 3:
+                carry = head
+                continue
+            data_uri.append(b64encode(head))
+        cut = len(part) - len(part) % 3
+        data_uri.append(b64encode(part[:cut]))
+        carry = part[cut:].tobytes()
+    data_uri.append(b64encode(carry))
+
+    return data_uri
+
+
+def make_placeholder(width, height):
+
+    return (
+        f'<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">'
+        f'<rect x="0.5" y="0.5" width="{width - 1}" height="{height - 1}" rx="10" fill="none" '
+        f'stroke="#8b949e" stroke-dasharray="4 4"/>'
+        f'<text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" fill="#8b949e" '
+        f'font-family="sans-serif" font-size="14">Badge unavailable</text></svg>'
+    )
+
+
+def make_grid(results, theme, cover_image, columns=BATCH_COLUMNS):
+
+    width = themes.get_theme(theme)["width"]
+    height = themes.get_height(theme, cover_image)
+    columns = max(1, min(columns, len(results)))
+    rows = (len(results) + columns - 1) // columns
+
+    grid = Segments([
+        f'<svg width="{width * columns}" height="{height * rows}" xmlns="http://www.w3.org/2000/svg" '
+        f'xmlns:xlink="http://www.w3.org/1999/xlink">'
+    ])
+    placeholder = None
+    for i, result in enumerate(results):
+        x, y = (i % columns) * width, (i // columns) * height
+        data_uri = result.get("data_uri")
+        if data_uri is None:
+            # A failed uid keeps its cell, so the others stay in place
+            if placeholder is None:
+                placeholder = make_data_uri([make_placeholder(width, height).encode("utf-8")])
+            data_uri = placeholder
+        # A separate document per cell keeps each badge's CSS to itself
+        grid.append(f'<image x="{x}" y="{y}" width="{width}" height="{height}" xlink:href="')
+        for part in data_uri:
+            grid.append(part)
+        grid.append('"/>')
+    grid.append("</svg>")
+
+    return grid
+
+
+@app.route("/", defaults={"path": ""})
+@app.route("/<path:path>")
+def catch_all(path):
+
+    uids = get_uids(request.args.get("uids"))
+    if not uids:
+        return Response("uids is required", status=400)
+    if len(uids) > BATCH_MAX_UIDS:
+        return Response(f"at most {BATCH_MAX_UIDS} uids per request", status=400)
+
+    options = badge.get_options(request.args)
+    token_infos = access_token.load_token_infos(uids)
+
+    executor = get_executor()
+    futures = {executor.submit(render_uid, uid, token_infos.get(uid), options): uid for uid in uids}
+
+    if request.args.get("format") == "ndjson":
+
+        def generate():
+            for future in as_completed(futures):
+                result = future.result()
+                line = {key: result[key] for key in ("uid", "error") if key in result}
+                if "svg" in result:
+                    line["svg"] = result["svg"].getvalue().decode("utf-8")
+                yield json.dumps(line) + "\n"
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    results = {futures[future]: future.result() for future in as_completed(futures)}
+    try:
+        columns = int(request.args.get("columns", BATCH_COLUMNS))
+    except ValueError:
+        columns = BATCH_COLUMNS
+
+    grid = make_grid([results[uid] for uid in uids], options["theme"], options["cover_image"], columns)
+    headers = get_grid_cache_headers(list(results.values()))
+
+    return Response(make_body(grid, request, headers), mimetype="image/svg+xml", headers=headers)
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -1,28 +1,13 @@
 from flask import Flask, Response, jsonify, render_template, redirect, request
-from base64 import b64decode
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
-from firebase_admin import credentials
-from firebase_admin import firestore
-import firebase_admin
-
-import os
-import json
-from util import spotify
+from util import negative_cache, spotify
+from util.firestore import db
 
 print("Starting Server")
 
-firebase_config = os.getenv("FIREBASE")
-firebase_dict = json.loads(b64decode(firebase_config))
-
-cred = credentials.Certificate(firebase_dict)
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
-
-db = firestore.client()
-
 app = Flask(__name__)
 
 
@@ -43,6 +28,8 @@ def catch_all(path):
 
     doc_ref = db.collection("users").document(user_id)
     doc_ref.set(token_info)
+    # Logging in again brings a revoked badge back at once
+    negative_cache.clear_invalid(user_id)
 
     rendered_data = {
         "uid": user_id,
@@ -0,0 +1,57 @@
+from flask import Flask, Response, request
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+import os
+
+from util import themes
+from util.cover_cache import get_cover_hash, get_scdn_url, load_cover, parse_cover_name
+from util.render_cache import is_not_modified
+
+# Cover art referenced by badges rendered with cover_mode=external:
+#
+#   /api/cover/<i.scdn.co image id>-<size>-<hash>.jpg
+#
+# The hash is taken from the resized variant, so a URL always names the same
+# bytes and can be cached forever. Only the theme cover sizes are served.
+
+COVER_IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# A stale hash (the variant was re-encoded since) still gets the current cover
+COVER_MISMATCH_CACHE = "public, max-age=60"
+
+COVER_SIZES = frozenset(theme["cover_size"] for theme in themes.THEMES.values())
+
+app = Flask(__name__)
+
+
+@app.route("/", defaults={"path": ""})
+@app.route("/<path:path>")
+def catch_all(path):
+
+    parsed = parse_cover_name(os.path.basename(path))
+    if parsed is None:
+        return Response("not found", status=404)
+
+    cover_id, size, cover_hash = parsed
+    if size not in COVER_SIZES:
+        return Response("not found", status=404)
+
+    try:
+        data = load_cover(get_scdn_url(cover_id), size)
+    except Exception:
+        return Response("not found", status=404)
+
+    current_hash = get_cover_hash(data)
+    headers = {
+        "Cache-Control": COVER_IMMUTABLE_CACHE if current_hash == cover_hash else COVER_MISMATCH_CACHE,
+        "ETag": f'"{current_hash}"',
+    }
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status=304, headers=headers)
+
+    return Response(data, mimetype="image/jpeg", headers=headers)
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -1,9 +1,15 @@
 import os
 import base64
-import requests
 import html
 from flask import Flask, Response, request
 
+from util.cache_policy import NO_CACHE, get_cache_headers, is_animated
+from util.render_cache import is_not_modified, make_render_key, render_cache
+from util.snapshots import get_stale_now_playing, make_snapshot, set_snapshot
+from util.spotify import RateLimitedError, request_spotify
+from util.svg_writer import XML_DECLARATION, Segments, get_etag, make_body, negotiate_encoding
+from util.swr import make_swr_key, swr_cache
+
 app = Flask(__name__)
 
 # --- CONFIGURACIÓN ---
@@ -14,13 +20,18 @@ SPOTIFY_REFRESH_TOKEN = os.getenv("SPOTIFY_REFRESH_TOKEN")
 SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
 SPOTIFY_NOW_PLAYING_URL = "https://api.spotify.com/v1/me/player/currently-playing"
 
+# Última respuesta válida, para servirla (marcada como stale) si Spotify nos limita
+SNAPSHOT_UID = "index"
+
 def get_access_token():
     try:
         auth_header = base64.b64encode(f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()).decode()
         headers = {"Authorization": f"Basic {auth_header}", "Content-Type": "application/x-www-form-urlencoded"}
         data = {"grant_type": "refresh_token", "refresh_token": SPOTIFY_REFRESH_TOKEN}
-        response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data, timeout=2)
+        response = request_spotify("token", "POST", SPOTIFY_TOKEN_URL, headers=headers, data=data, timeout=2)
         return response.json().get("access_token")
+    except RateLimitedError:
+        raise
     except:
         return None
 
@@ -29,72 +40,132 @@ def get_now_playing():
         token = get_access_token()
         if not token:
             return None
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(SPOTIFY_NOW_PLAYING_URL, headers=headers, timeout=2)
-        if response.status_code == 204 or response.status_code > 400:
+        # Por el cliente asíncrono compartido (el mismo que /api/batch); se importa aquí para no cargar httpx en frío
+        from util import spotify_async
+
+        data = spotify_async.run_sync(spotify_async.get_json("now_playing", SPOTIFY_NOW_PLAYING_URL, token), timeout=2)
+        if data.get("error"):
             return None
-        return response.json()
+        # {} (204): no suena nada; None queda para los fallos
+        if data:
+            set_snapshot(SNAPSHOT_UID, make_snapshot(data))
+        return data
+    except RateLimitedError:
+        return get_stale_now_playing(SNAPSHOT_UID)
     except:
         return None
 
-@app.route('/api/spotify')
-def index():
-    # Headers optimizados
-    headers = {
-        'Content-Type': 'image/svg+xml; charset=utf-8',
-        'Cache-Control': 'no-cache, no-store, must-revalidate',
-        'Pragma': 'no-cache',
-        'Expires': '0'
-    }
-    
-    # SVG del Logo de Spotify (Dibujado en código, carga instantánea)
-    spotify_logo = """
+# SVG del Logo de Spotify (Dibujado en código, carga instantánea). Fragmentos
+# estáticos: se construyen una sola vez, no en cada petición
+SPOTIFY_LOGO = """
     <g transform="translate(10, 10)">
         <rect width="80" height="80" rx="5" fill="#1db954"/>
         <path d="M58.6 57.5c-.6.9-1.8 1.2-2.7.6-7.5-4.6-16.9-5.6-28-3.1-1 .2-2.1-.4-2.3-1.4-.2-1 .4-2.1 1.4-2.3 12.1-2.8 22.5-1.6 31 3.5.9.6 1.2 1.8.6 2.7zm3.7-8.3c-.8 1.2-2.4 1.6-3.6.8-9-5.5-22.6-7.1-33.2-3.9-1.4.4-2.8-.4-3.2-1.8-.4-1.4.4-2.8 1.8-3.2 12.1-3.6 27.2-1.8 37.4 4.5 1.2.7 1.5 2.3.8 3.6zm.5-8.5c-10.8-6.4-28.6-7-38.9-3.8-1.6.5-3.3-.4-3.8-2-.5-1.6.4-3.3 2-3.8 11.9-3.6 31.3-2.9 43.6 4.5 1.5.9 2 2.8 1.1 4.3-.9 1.5-2.8 2-4.3 1.1z" fill="#ffffff"/>
     </g>
     """
 
-    try:
-        bg_color = request.args.get('background_color', '18181b')
-        text_color = "ffffff"
-        bar_color = request.args.get('bar_color', '1db954')
-        
-        data = get_now_playing()
+def build_badge(args):
+    bg_color = args.get('background_color', '18181b')
+    text_color = "ffffff"
+    bar_color = args.get('bar_color', '1db954')
+    animated = is_animated(args.get('progress_animation'))
+
+    data = get_now_playing()
+    # Sin datos por un error (token, red, límite sin snapshot): se muestra la pausa, pero sin cachear
+    failed = data is None
+    item = data.get('item') if data else None
+    progress_ms = data.get('progress_ms') if item else None
 
+    def render():
         # Si no hay datos (Pausa o Error de conexión rápida), mostramos el estado "Pausa"
-        if not data or not data.get('item'):
+        if not item:
             xml_content = f"""<svg width="350" height="100" viewBox="0 0 350 100" xmlns="http://www.w3.org/2000/svg">
                 <rect x="0" y="0" width="350" height="100" rx="10" fill="#{bg_color}" stroke="rgba(255,255,255,0.1)" stroke-width="1"/>
                 <text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" fill="#{text_color}" font-family="sans-serif" font-size="14">
                     💤 Spotify en pausa
                 </text>
             </svg>"""
-            return Response('<?xml version="1.0" encoding="UTF-8"?>' + xml_content, headers=headers)
+            return Segments((XML_DECLARATION, xml_content))
 
         # REPRODUCIENDO (Versión Ligera)
-        item = data['item']
         track_name = html.escape(item['name'])
         artist_name = html.escape(item['artists'][0]['name'])
-        
-        progress_ms = data['progress_ms']
+
         duration_ms = item['duration_ms']
         progress_pct = min((progress_ms / duration_ms) * 100, 100)
         progress_width = 220 * (progress_pct / 100)
 
+        # La barra avanza sola hasta el final de la canción (SMIL), así el SVG cacheado sigue siendo correcto
+        progress_animation = ""
+        if animated:
+            remaining_s = max(duration_ms - progress_ms, 0) / 1000
+            progress_animation = f'<animate attributeName="width" from="{progress_width}" to="220" dur="{remaining_s}s" fill="freeze"/>'
+
         svg_content = f"""<svg width="350" height="100" viewBox="0 0 350 100" xmlns="http://www.w3.org/2000/svg">
             <rect x="0" y="0" width="350" height="100" rx="10" fill="#{bg_color}" stroke="rgba(255,255,255,0.1)" stroke-width="1"/>
-            
-            {spotify_logo}
-            
+
+            {SPOTIFY_LOGO}
+
             <text x="105" y="35" fill="#{text_color}" font-family="sans-serif" font-size="16" font-weight="bold">{track_name}</text>
             <text x="105" y="55" fill="#b3b3b3" font-family="sans-serif" font-size="14">{artist_name}</text>
-            
+
             <rect x="105" y="75" width="220" height="4" rx="2" fill="#404040"/>
-            <rect x="105" y="75" width="{progress_width}" height="4" rx="2" fill="#{bar_color}"/>
+            <rect x="105" y="75" width="{progress_width}" height="4" rx="2" fill="#{bar_color}">{progress_animation}</rect>
         </svg>"""
+        return Segments((XML_DECLARATION, svg_content))
+
+    # Mismo tema, canción y progreso aproximado: reutilizamos el SVG ya generado
+    cache_key = make_render_key(SNAPSHOT_UID, item, progress_ms, args)
+    body, etag, rendered_at = render_cache.get_or_render(cache_key, render)
+
+    return {
+        "body": body,
+        "etag": etag,
+        # Last-Modified: cuándo se generó este SVG, igual en cada acierto de caché
+        "last_modified": rendered_at if item else None,
+        "is_playing": bool(item),
+        "progress_ms": progress_ms,
+        "duration_ms": item.get('duration_ms') if item else None,
+        "stale": bool(data and data.get('stale')),
+        "failed": failed,
+        "animated": animated,
+    }
+
+@app.route('/api/spotify')
+def index():
+    # Headers optimizados
+    headers = {
+        'Content-Type': 'image/svg+xml; charset=utf-8',
+        'Cache-Control': NO_CACHE,
+    }
+    
+    try:
+        # Último badge generado al instante; si ya es viejo, se regenera en segundo plano
+        args = request.args.to_dict()
+        badge, age = swr_cache.get(make_swr_key(SNAPSHOT_UID, args), lambda: build_badge(args))
+        etag = badge['etag']
+
+        # Un fallo no es una pausa: no-store, para que camo/CDN no guarden un badge equivocado
+        if badge['failed']:
+            return Response(make_body(badge['body'], request, headers), headers=headers)
+
+        # Cacheable hasta que termine la canción; más tiempo si no suena nada
+        stale = badge['stale'] or age >= swr_cache.fresh_for
+        headers.update(get_cache_headers(
+            badge['is_playing'], badge['progress_ms'], badge['duration_ms'], stale, animated=badge['animated'],
+            last_modified=badge['last_modified'],
+        ))
+        if stale:
+            headers['Warning'] = '110 - "Response is Stale"'
+        # El 304 lleva el ETag de la codificación que se habría enviado
+        encoding = negotiate_encoding(request.accept_encodings, len(badge['body']))
+        if is_not_modified(request, get_etag(etag, encoding), badge['last_modified']):
+            headers['ETag'] = get_etag(etag, encoding)
+            return Response(status=304, headers=headers)
+        headers['ETag'] = etag
 
-        return Response('<?xml version="1.0" encoding="UTF-8"?>' + svg_content, headers=headers)
+        # Segmentos ya codificados, sin concatenar; gzip/brotli opcional
+        return Response(make_body(badge['body'], request, headers), headers=headers)
 
     except Exception as e:
         # SVG de Error ligero
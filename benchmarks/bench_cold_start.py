@@ -0,0 +1,145 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+API = os.path.join(ROOT, "api")
+
+# python benchmarks/bench_cold_start.py [runs]
+# python benchmarks/bench_cold_start.py --importtime callback [top]
+#
+# Starts each serverless entry point in a fresh interpreter, the way a cold
+# Vercel function or a new gunicorn worker does, and reports the median
+# import time, first-request latency, peak RSS and which heavy modules were
+# loaded on the way. Spotify is answered by a canned response so the first
+# request measures the app itself, not the network. --importtime prints the
+# slowest imports of one entry point from python -X importtime.
+
+ENTRY_POINTS = ("login", "callback", "index", "view")
+# Modules that should only load on the code paths that need them
+HEAVY_MODULES = ("PIL", "colorgram", "firebase_admin", "profanityfilter", "numpy", "httpx")
+# What an entry point paid up front when it initialised Firebase at import
+DEFERRED = ("firebase_admin.firestore",)
+
+PROBE = """
+import json, resource, sys, time
+from unittest.mock import MagicMock, patch
+
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter() - start
+
+response = MagicMock(status_code=200, headers={{}}, content=b"")
+response.json.return_value = {{"access_token": "token"}}
+with patch("util.session.request", return_value=response):
+    client = {module}.app.test_client()
+    start = time.perf_counter()
+    client.get("/")
+    first_request = time.perf_counter() - start
+
+print(json.dumps({{
+    "import": imported,
+    "first_request": first_request,
+    "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+IMPORT_PROBE = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def get_env():
+
+    env = dict(os.environ)
+    env.pop("TESTING", None)
+    env.setdefault("FIREBASE", "e30=")
+    env.setdefault("FIRESTORE_FAKE", "true")
+
+    return env
+
+
+def run(args):
+
+    result = subprocess.run([sys.executable] + args, cwd=API, env=get_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    return result
+
+
+def measure(module, runs):
+
+    samples = []
+    for _ in range(runs):
+        result = run(["-c", PROBE.format(module=module, heavy=HEAVY_MODULES)])
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    return {
+        "import": statistics.median(s["import"] for s in samples),
+        "first_request": statistics.median(s["first_request"] for s in samples),
+        "rss": max(s["rss"] for s in samples),
+        "heavy": samples[-1]["heavy"],
+    }
+
+
+def measure_import(module, runs):
+
+    samples = [float(run(["-c", IMPORT_PROBE.format(module=module)]).stdout.split()[-1]) for _ in range(runs)]
+
+    return statistics.median(samples)
+
+
+def importtime(module, top=15):
+
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    stderr = run(["-X", "importtime", "-c", f"import {module}"]).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    rows.sort(reverse=True)
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, name in rows[:top]:
+        print(f"{cumulative_us / 1000:9.1f} ms {self_us / 1000:7.1f} ms  {name}")
+
+
+def main():
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--importtime":
+        importtime(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 15)
+        return
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print(f"{'entry point':<12} {'import':>10} {'first request':>14} {'peak RSS':>10}  heavy modules loaded")
+    for module in ENTRY_POINTS:
+        if not os.path.exists(os.path.join(API, f"{module}.py")):
+            print(f"{module:<12} {'-':>10} {'-':>14} {'-':>10}  (missing)")
+            continue
+        try:
+            stats = measure(module, runs)
+        except RuntimeError as e:
+            print(f"{module:<12} failed: {e}")
+            continue
+        print(
+            f"{module:<12} {stats['import'] * 1000:7.1f} ms {stats['first_request'] * 1000:11.1f} ms "
+            f"{stats['rss'] / 1024:7.1f} MB  {', '.join(stats['heavy']) or '-'}"
+        )
+
+    print()
+    for module in DEFERRED:
+        print(f"deferred until first Firestore call: {module} {measure_import(module, runs) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
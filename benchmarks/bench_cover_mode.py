@@ -0,0 +1,89 @@
+import os
+import random
+import sys
+import timeit
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import badge, themes
+from util.cover_cache import COVER_QUALITY, CoverCache, resize_cover
+
+# python benchmarks/bench_cover_mode.py
+# Per theme: response size and render time of a badge with the cover inlined
+# as base64 (quality 85 everywhere vs the per-size quality) and with the cover
+# referenced from /api/cover. Covers are warm in the cache, as in production.
+
+
+def make_cover(size=640, seed=3):
+
+    rng = random.Random(seed)
+    image = Image.effect_noise((size, size), 40).convert("RGB")
+    for _ in range(30):
+        x, y = rng.randrange(size), rng.randrange(size)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        image.paste(color, (x, y, x + rng.randrange(40, 200), y + rng.randrange(40, 200)))
+
+    out = BytesIO()
+    image.filter(ImageFilter.GaussianBlur(2)).save(out, format="JPEG", quality=92)
+
+    return out.getvalue()
+
+
+ITEM = {
+    "name": "Song",
+    "id": "track",
+    "artists": [{"name": "Artist"}],
+    "duration_ms": 180000,
+    "album": {"images": [{"url": "https://i.scdn.co/image/ab67616d00001e02cover"}]},
+}
+SONG = (ITEM, True, 61000)
+
+
+def render(theme, cover_mode):
+    options = dict(badge.DEFAULT_OPTIONS, theme=theme, cover_mode=cover_mode)
+    return badge.render_badge_segments("token", options, SONG, "uid")
+
+
+def measure(theme, cover_mode):
+
+    size = len(render(theme, cover_mode))
+    seconds = min(timeit.repeat(lambda: render(theme, cover_mode), number=200, repeat=3)) / 200
+
+    return size, seconds
+
+
+def main():
+
+    source = make_cover()
+    totals = {"inline q85": [0, 0.0], "inline": [0, 0.0], "external": [0, 0.0]}
+
+    print(f"{'theme':<14} {'inline q85':>12} {'inline':>12} {'external':>12}   render inline / external")
+    for theme in themes.THEMES:
+        cover_size = themes.get_theme(theme)["cover_size"]
+
+        # Before: every size encoded at COVER_QUALITY
+        fixed = len(resize_cover(source, cover_size, quality=COVER_QUALITY))
+        inline_size, inline_s = measure(theme, "inline")
+        external_size, external_s = measure(theme, "external")
+        fixed_size = inline_size - len(resize_cover(source, cover_size)) * 4 // 3 + fixed * 4 // 3
+
+        for name, size, seconds in (("inline q85", fixed_size, inline_s), ("inline", inline_size, inline_s),
+                                    ("external", external_size, external_s)):
+            totals[name][0] += size
+            totals[name][1] += seconds
+        print(f"{theme:<14} {fixed_size / 1024:9.1f} KiB {inline_size / 1024:8.1f} KiB {external_size / 1024:8.1f} KiB"
+              f"   {inline_s * 1e6:6.0f} us / {external_s * 1e6:6.0f} us")
+
+    count = len(themes.THEMES)
+    print(f"{'average':<14} " + " ".join(f"{size / count / 1024:8.1f} KiB" for size, _ in totals.values())
+          + f"   {totals['inline'][1] / count * 1e6:6.0f} us / {totals['external'][1] / count * 1e6:6.0f} us")
+
+
+if __name__ == "__main__":
+    with patch("util.session.get", return_value=MagicMock(content=make_cover())), \
+         patch("util.cover_cache.cover_cache", CoverCache()):
+        main()
@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+import timeit
+from io import BytesIO
+
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import colorgram
+
+from util.palette import extract_colors, get_palette
+
+# python benchmarks/bench_palette.py
+# Compares colorgram.extract on a full-size cover with the vectorized
+# extractor on the same image and on the downsampled fast path.
+
+
+def make_cover(size=640, seed=7):
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (size, size))
+    for _ in range(40):
+        x, y = rng.randrange(size), rng.randrange(size)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        image.paste(color, (x, y, min(size, x + rng.randrange(40, 300)), min(size, y + rng.randrange(40, 300))))
+    image = image.filter(ImageFilter.GaussianBlur(4))
+
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def bench(name, fn, number):
+
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(f"{name:<40} {seconds * 1000:8.2f} ms")
+    return seconds
+
+
+def main():
+
+    data = make_cover()
+    image = Image.open(BytesIO(data))
+    image.load()
+
+    base = bench("colorgram.extract (640px)", lambda: colorgram.extract(image, 5), 1)
+    full = bench("extract_colors (640px)", lambda: extract_colors(image, 5), 5)
+    fast = bench("get_palette (decode + 64px thumbnail)", lambda: get_palette(data), 20)
+
+    print(f"{'speed-up, same pixels':<40} {base / full:8.1f}x")
+    print(f"{'speed-up, fast path':<40} {base / fast:8.1f}x")
+
+    expected = colorgram.extract(image, 5)
+    same = [c.rgb for c in extract_colors(image, 5)] == [c.rgb for c in expected]
+    print(f"{'parity on full image':<40} {same}")
+
+    dominant = get_palette(data)["colors"][0][:3]
+    drift = max(abs(a - b) for a, b in zip(dominant, expected[0].rgb))
+    print(f"{'fast path dominant colour drift':<40} {drift}")
+
+
+if __name__ == "__main__":
+    main()
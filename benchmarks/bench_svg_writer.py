@@ -0,0 +1,74 @@
+import os
+import sys
+import timeit
+import tracemalloc
+from base64 import b64encode
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.badge import make_svg
+from util.svg_writer import COVER_PLACEHOLDER, XML_DECLARATION, splice
+
+# python benchmarks/bench_svg_writer.py
+# Renders the default theme with an inlined cover two ways: the string path
+# (base64 str into the template, XML declaration concatenated, encoded for
+# the response) and the segment writer (cover bytes spliced in). Reports the
+# bytes allocated and the peak traced memory per render, and the time.
+
+
+def make_cover_b64(size=640):
+
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=90)
+
+    return b64encode(out.getvalue())
+
+
+ARGS = ("Artist", "Song", True, True, "default", "53b14f", "181414", "light")
+
+
+def render_string(cover):
+
+    svg = make_svg(ARGS[0], ARGS[1], cover.decode("ascii"), *ARGS[2:], bar_key="u:t")
+    return (XML_DECLARATION.decode() + svg).encode("utf-8")
+
+
+def render_segments(cover):
+
+    segments = splice(make_svg(ARGS[0], ARGS[1], COVER_PLACEHOLDER, *ARGS[2:], bar_key="u:t"), cover)
+    # What the WSGI server does with the iterable
+    return sum(len(part) for part in segments)
+
+
+def measure(name, fn, cover):
+
+    fn(cover)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    fn(cover)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = min(timeit.repeat(lambda: fn(cover), number=200, repeat=3)) / 200
+    print(f"{name:<28} peak {(peak - before) / 1024:8.1f} KiB {seconds * 1e6:9.1f} us")
+
+    return peak - before
+
+
+def main():
+
+    cover = make_cover_b64()
+    print(f"cover base64: {len(cover) / 1024:.1f} KiB")
+
+    string_peak = measure("string concat + encode", render_string, cover)
+    segment_peak = measure("segment writer", render_segments, cover)
+    print(f"{'peak memory saved per render':<28} {(string_peak - segment_peak) / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+from util import session, spotify_async
+
+# Local stand-in for the parts of the Spotify Web API the badges use:
+# accounts token endpoint, currently-playing, recently-played, profile and
+# the i.scdn.co image CDN. Access tokens are "token-<uid>" and refresh
+# tokens "refresh-<uid>", so every response is deterministic per uid.
+#
+#   server = FakeSpotifyServer(latency=0.03, playing_ratio=0.6).start()
+#   redirect_session(server.url)   # route util.session and util.spotify_async traffic to it
+#
+# Used by benchmarks/load_test.py; it can also run on its own:
+#
+#   python benchmarks/fake_spotify.py 8765
+
+
+def format_played_at(ms):
+
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ms / 1000)) + ".%03dZ" % (ms % 1000)
+
+
+class FakeSpotify:
+    def __init__(self, latency=0.0, jitter=0.0, playing_ratio=0.5, throttle_ratio=0.0, retry_after=1,
+                 track_duration_ms=180000, expires_in=3600, revoked_ratio=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.playing_ratio = playing_ratio
+        self.throttle_ratio = throttle_ratio
+        self.retry_after = retry_after
+        self.track_duration_ms = track_duration_ms
+        self.expires_in = expires_in
+        self.revoked_ratio = revoked_ratio
+        self.random = random.Random(seed)
+        self.started = time.time()
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._image = None
+
+    def count(self, endpoint):
+
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def get_calls(self):
+
+        with self._lock:
+            return dict(self.calls)
+
+    def reset_calls(self):
+
+        with self._lock:
+            self.calls = {}
+
+    def delay(self):
+
+        with self._lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+            throttled = self.throttle_ratio and self.random.random() < self.throttle_ratio
+        time.sleep(self.latency + extra)
+
+        return throttled
+
+    def is_playing(self, uid):
+
+        # Stable per uid, so a user is either a listener or mostly offline
+        return zlib.crc32(uid.encode()) % 1000 < self.playing_ratio * 1000
+
+    def is_revoked(self, uid):
+
+        # Users who removed the app: their refresh token is rejected
+        return zlib.crc32(b"revoked:" + uid.encode()) % 1000 < self.revoked_ratio * 1000
+
+    def get_track(self, uid, index=0):
+
+        track_id = f"{uid}-{index}"
+        return {
+            "id": track_id,
+            "name": f"Song {track_id}",
+            "artists": [{"name": f"Artist {uid}", "external_urls": {"spotify": "https://open.spotify.com/artist/x"}}],
+            "duration_ms": self.track_duration_ms,
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+            "album": {
+                "images": [
+                    {"url": f"https://i.scdn.co/image/{track_id}-640", "width": 640},
+                    {"url": f"https://i.scdn.co/image/{track_id}-300", "width": 300},
+                    {"url": f"https://i.scdn.co/image/{track_id}-64", "width": 64},
+                ],
+            },
+        }
+
+    def now_playing(self, uid):
+
+        if not self.is_playing(uid):
+            return None
+
+        # Every listener starts a new track each track_duration_ms
+        elapsed_ms = int((time.time() - self.started) * 1000) + zlib.crc32(uid.encode()) % self.track_duration_ms
+        index, progress_ms = divmod(elapsed_ms, self.track_duration_ms)
+
+        return {
+            "is_playing": True,
+            "progress_ms": progress_ms,
+            "currently_playing_type": "track",
+            "item": self.get_track(uid, index),
+        }
+
+    def recently_played(self, uid, limit=10, after=None):
+
+        # Offline users finished their last track before the server started
+        played_ms = [int(self.started * 1000) - (i + 1) * self.track_duration_ms for i in range(limit)]
+        items = [
+            {"track": self.get_track(uid, -i - 1), "played_at": format_played_at(ms)}
+            for i, ms in enumerate(played_ms) if after is None or ms > int(after)
+        ]
+        cursors = {"after": str(played_ms[0]), "before": str(played_ms[-1])} if items else None
+
+        return {"items": items, "cursors": cursors}
+
+    def image(self):
+
+        if self._image is None:
+            from PIL import Image
+
+            out = BytesIO()
+            Image.new("RGB", (300, 300), (29, 185, 84)).save(out, format="JPEG")
+            self._image = out.getvalue()
+
+        return self._image
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def get_uid(self):
+
+        authorization = self.headers.get("Authorization", "")
+        token = authorization.split(" ", 1)[-1]
+
+        return token[len("token-"):] if token.startswith("token-") else None
+
+    def send_json(self, status, payload=None, headers=None):
+
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        endpoints = {
+            ("POST", "/api/token"): "token",
+            ("GET", "/v1/me/player/currently-playing"): "now_playing",
+            ("GET", "/v1/me/player/recently-played"): "recently_played",
+            ("GET", "/v1/me"): "profile",
+        }
+        endpoint = endpoints.get((method, url.path))
+        if endpoint is None and method == "GET" and url.path.startswith("/image/"):
+            endpoint = "image"
+        if endpoint is None:
+            return self.send_json(404, {"error": "not found"})
+
+        fake.count(endpoint)
+        if fake.delay() and endpoint != "image":
+            fake.count("throttled")
+            return self.send_json(429, {"error": "rate limited"}, {"Retry-After": str(fake.retry_after)})
+
+        if endpoint == "image":
+            data = fake.image()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        if endpoint == "token":
+            form = parse_qs(body.decode())
+            code = (form.get("refresh_token") or form.get("code") or [""])[0]
+            uid = code.split("-", 1)[-1]
+            if "refresh_token" in form and fake.is_revoked(uid):
+                return self.send_json(400, {"error": "invalid_grant", "error_description": "Refresh token revoked"})
+            payload = {"access_token": f"token-{uid}", "token_type": "Bearer", "expires_in": fake.expires_in}
+            if "code" in form:
+                payload["refresh_token"] = f"refresh-{uid}"
+            return self.send_json(200, payload)
+
+        uid = self.get_uid()
+        if uid is None:
+            return self.send_json(401, {"error": {"status": 401, "message": "Invalid access token"}})
+
+        if endpoint == "profile":
+            return self.send_json(200, {"id": uid, "display_name": uid})
+
+        if endpoint == "now_playing":
+            data = fake.now_playing(uid)
+            return self.send_json(200, data) if data else self.send_json(204)
+
+        query = parse_qs(url.query)
+        limit = int(query.get("limit", ["10"])[0])
+        after = query.get("after", [None])[0]
+        return self.send_json(200, fake.recently_played(uid, limit, after))
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+class FakeSpotifyServer:
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        self.fake = FakeSpotify(**options)
+        self.httpd = ThreadingHTTPServer((host, port), FakeSpotifyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self.fake
+        self._thread = None
+
+    @property
+    def url(self):
+
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-spotify", daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RedirectAdapter(session.PooledAdapter):
+    """Sends every request to base_url, keeping path and query."""
+
+    def __init__(self, base_url, **kwargs):
+        self.base_url = urlsplit(base_url)
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+
+        url = urlsplit(request.url)
+        request.url = urlunsplit((self.base_url.scheme, self.base_url.netloc, url.path, url.query, ""))
+
+        return super().send(request, **kwargs)
+
+
+class RedirectTransport(httpx.AsyncHTTPTransport):
+    """The httpx counterpart of RedirectAdapter, for util.spotify_async."""
+
+    def __init__(self, base_url, **kwargs):
+        self.base_url = httpx.URL(base_url)
+        super().__init__(**kwargs)
+
+    async def handle_async_request(self, request):
+
+        request.url = request.url.copy_with(scheme=self.base_url.scheme, host=self.base_url.host,
+                                            port=self.base_url.port)
+
+        return await super().handle_async_request(request)
+
+
+def redirect_session(base_url):
+
+    adapter = RedirectAdapter(
+        base_url,
+        pool_connections=session.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=session.HTTP_POOL_MAXSIZE,
+        pool_block=session.HTTP_POOL_BLOCK,
+        max_retries=session.make_retry(),
+    )
+    current = session.get_session()
+    current.mount("https://", adapter)
+    current.mount("http://", adapter)
+    spotify_async.set_transport_factory(lambda: RedirectTransport(base_url, limits=spotify_async.make_limits()))
+
+    return current
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = FakeSpotifyServer(port=port, latency=0.03, jitter=0.02)
+    print(f"Fake Spotify listening on {server.url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,354 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+os.environ.pop("TESTING", None)
+os.environ["FIRESTORE_FAKE"] = "true"
+os.environ.setdefault("SPOTIFY_REFRESH_TOKEN", "refresh-index")
+
+from fake_spotify import FakeSpotifyServer, redirect_session
+
+# python benchmarks/load_test.py --target badge --users 2000 --requests 20000
+# python benchmarks/load_test.py --target index --latency 0.05 --throttle 0.01
+# python benchmarks/load_test.py --shared-cache policy     (vs --shared-cache no-cache)
+# python benchmarks/load_test.py --token-ttl 70 --refresh-ahead --requests 20000
+# python benchmarks/load_test.py --revoked 0.2 --token-ttl 60 --no-governor
+# RATE_LIMIT_GLOBAL=100 RATE_LIMIT_NOW_PLAYING=100 python benchmarks/load_test.py --requests 1000
+# python benchmarks/load_test.py --target index --jitter 0.5 --no-swr       (vs without --no-swr)
+# python benchmarks/load_test.py --playing 0.2 --no-recent-history          (vs without)
+#
+# Replays badge traffic against a local fake Spotify and the in-memory
+# Firestore: a Zipf-distributed mix of uids (a few READMEs are viewed all the
+# time, most rarely), and a share of camo revalidations that send back the
+# last ETag seen for that uid. Reports throughput, latency percentiles and
+# upstream Spotify calls per rendered badge. RateLimitedError counts the
+# requests the rate governor deferred with no snapshot to fall back on, which
+# /api/batch serves as "Badge unavailable" cells (see util/rate_limit.py).
+#
+# target "badge" runs the per-uid path of /api/batch (token cache and
+# Firestore, SWR, the async Spotify client, cover cache, theme registry);
+# target "index" drives the /api/spotify Flask app, where query variants
+# stand in for uids. Both reach the fake through the requests session and the
+# httpx client alike.
+
+
+def make_uids(count):
+    return [f"user{i:05d}" for i in range(count)]
+
+
+def make_weights(count, skew):
+
+    # Zipf: the uid of rank r is requested in proportion to 1 / r^skew
+    return [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def seed_users(uids, token_ttl=3600, seed=0):
+
+    from util.firestore import get_firestore_db
+
+    # Tokens part-way through their lifetime, as for users who logged in at random times
+    rng = random.Random(seed)
+    now = time.time()
+    users = get_firestore_db().collection("users")
+    for uid in uids:
+        expired_ts = int(now + rng.uniform(0, token_ttl))
+        users.document(uid).set({"access_token": f"token-{uid}", "refresh_token": f"refresh-{uid}", "expired_ts": expired_ts})
+
+
+class BadgeTarget:
+    def __init__(self):
+        self.rendered = 0
+        self._lock = threading.Lock()
+
+    def build(self, uid):
+
+        from util import badge, spotify_async
+        from util.access_token import get_access_token
+        from util.render_cache import make_etag
+
+        with self._lock:
+            self.rendered += 1
+
+        # As api/batch.py's render_uid builds each cell
+        access_token = get_access_token(uid)
+        built = spotify_async.run_sync(badge.build_badge_async(access_token, badge.DEFAULT_OPTIONS, uid))
+
+        return dict(built, etag=make_etag(built["body"].getvalue()))
+
+    def __call__(self, uid, if_none_match=None):
+
+        from util import badge
+        from util.cache_policy import get_cache_headers
+        from util.swr import make_swr_key, swr_cache
+
+        built, age = swr_cache.get(make_swr_key(uid, badge.DEFAULT_OPTIONS), lambda: self.build(uid))
+        cache_control = get_cache_headers(
+            built["is_playing"], built["progress_ms"], built["duration_ms"],
+            built["stale"] or age >= swr_cache.fresh_for, animated=built["animated"],
+        )["Cache-Control"]
+
+        return (304 if if_none_match == built["etag"] else 200), built["etag"], cache_control
+
+
+class IndexTarget:
+    def __init__(self):
+        from index import app
+
+        app.config.update({"TESTING": True})
+        self.app = app
+        self.local = threading.local()
+
+    def __call__(self, uid, if_none_match=None):
+
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+
+        headers = {"If-None-Match": if_none_match} if if_none_match else {}
+        response = client.get(f"/api/spotify?bar_color={uid[-6:]}", headers=headers)
+
+        return response.status_code, response.headers.get("ETag"), response.headers.get("Cache-Control")
+
+
+def get_max_age(cache_control):
+
+    for directive in (cache_control or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name == "s-maxage":
+            return int(value)
+        if name in ("no-cache", "no-store"):
+            return 0
+
+    return 0
+
+
+class SharedCache:
+    """A camo/CDN-like cache in front of a target.
+
+    Fresh entries are served without reaching the origin, expired ones are
+    revalidated with If-None-Match. With ignore_policy every request goes to
+    the origin, as with the old no-cache headers.
+    """
+
+    def __init__(self, target, ignore_policy=False, clock=time.monotonic):
+        self.target = target
+        self.ignore_policy = ignore_policy
+        self.clock = clock
+        self.hits = 0
+        self.origin = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, uid, if_none_match=None):
+
+        with self._lock:
+            entry = self._entries.get(uid)
+            fresh = entry is not None and self.clock() < entry[1]
+            if fresh:
+                self.hits += 1
+            else:
+                self.origin += 1
+
+        if fresh:
+            etag, cache_control = entry[0], entry[2]
+        else:
+            status, etag, cache_control = self.target(uid, entry[0] if entry else None)
+            if status == 304:
+                etag = entry[0]
+            max_age = 0 if self.ignore_policy else get_max_age(cache_control)
+            with self._lock:
+                self._entries[uid] = (etag, self.clock() + max_age, cache_control)
+
+        return (304 if if_none_match == etag else 200), etag, cache_control
+
+
+class Driver:
+    def __init__(self, target, uids, weights, revalidate_ratio, seed=0):
+        self.target = target
+        self.uids = uids
+        self.weights = weights
+        self.revalidate_ratio = revalidate_ratio
+        self.random = random.Random(seed)
+        self.etags = {}
+        self.latencies = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def pick(self):
+
+        with self._lock:
+            uid = self.random.choices(self.uids, self.weights)[0]
+            revalidate = self.random.random() < self.revalidate_ratio
+
+        return uid, self.etags.get(uid) if revalidate else None
+
+    def run_one(self):
+
+        uid, if_none_match = self.pick()
+        start = time.perf_counter()
+        try:
+            status, etag, _ = self.target(uid, if_none_match)
+        except Exception as e:
+            status, etag = type(e).__name__, None
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if etag:
+                self.etags[uid] = etag
+
+    def run(self, total, concurrency):
+
+        remaining = [total]
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                self.run_one()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return time.perf_counter() - start
+
+
+def percentile(samples, pct):
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(driver, elapsed, upstream, shared_cache=None, rendered=None):
+
+    from util import access_token, session
+    from util.render_cache import render_cache
+    from util.swr import swr_cache
+
+    latencies = driver.latencies
+    if rendered is None:
+        rendered = render_cache.get_stats()["misses"]
+    spotify_calls = sum(count for endpoint, count in upstream.items() if endpoint != "image")
+
+    print(f"requests        {len(latencies)} in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} req/s)")
+    print(f"latency         p50 {percentile(latencies, 50) * 1000:.1f} ms  p95 {percentile(latencies, 95) * 1000:.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms  mean {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"status          {', '.join(f'{k}: {v}' for k, v in sorted(driver.statuses.items(), key=str))}")
+    print(f"upstream        {', '.join(f'{k}: {v}' for k, v in sorted(upstream.items()))}")
+    print(f"rendered        {rendered} badges, {spotify_calls / max(rendered, 1):.2f} Spotify calls per render, "
+          f"{spotify_calls / len(latencies):.2f} per request")
+    connections = session.get_stats()
+    print(f"connections     {connections['connections']} for {connections['requests']} upstream requests "
+          f"(reuse rate {connections['reuse_rate']:.1%})")
+    swr = swr_cache.get_stats()
+    if swr["fresh"] or swr["stale"]:
+        print(f"swr             {swr['fresh']} fresh, {swr['stale']} stale, {swr['misses']} built in the request, "
+              f"{swr['refreshes']} refreshed in the background")
+    tokens = access_token.get_scheduler_stats()
+    if tokens["requests"]:
+        print(f"token lookups   {tokens['requests']}, {tokens['inline_refreshes']} refreshed inline "
+              f"(hit rate {tokens['hit_rate']:.1%}), {tokens['refreshed']} refreshed ahead, {tokens['failed']} failed")
+    if shared_cache is not None:
+        print(f"shared cache    {shared_cache.hits} hits, {shared_cache.origin} origin requests "
+              f"({shared_cache.origin / len(latencies):.0%} of traffic reached the origin)")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Badge load test against a local fake Spotify")
+    parser.add_argument("--target", choices=("badge", "index"), default="badge")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of uid popularity")
+    parser.add_argument("--revalidate", type=float, default=0.3, help="share of If-None-Match requests")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake Spotify latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--playing", type=float, default=0.5, help="share of uids currently playing")
+    parser.add_argument("--throttle", type=float, default=0.0, help="share of Spotify calls answered 429")
+    parser.add_argument("--no-governor", action="store_true", help="disable the local rate governor")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="expires_in of fake access tokens")
+    parser.add_argument("--refresh-ahead", action="store_true", help="refresh tokens in the background")
+    parser.add_argument("--revoked", type=float, default=0.0, help="share of uids whose refresh token is rejected")
+    parser.add_argument("--no-negative-cache", action="store_true", help="retry revoked uids on every request")
+    parser.add_argument("--no-swr", action="store_true", help="build every badge in the request")
+    parser.add_argument("--no-recent-history", action="store_true",
+                        help="ask Spotify for recently played tracks on every offline render")
+    parser.add_argument("--shared-cache", choices=("policy", "no-cache"),
+                        help="put a CDN-like cache in front, honouring the Cache-Control policy or not")
+    args = parser.parse_args()
+
+    server = FakeSpotifyServer(
+        latency=args.latency, jitter=args.jitter, playing_ratio=args.playing, throttle_ratio=args.throttle,
+        expires_in=args.token_ttl, revoked_ratio=args.revoked,
+    ).start()
+    redirect_session(server.url)
+
+    if args.no_governor:
+        from util import rate_limit, spotify, spotify_async
+
+        budgets = {endpoint: (1e9, 1e9) for endpoint in rate_limit.BUDGETS}
+        spotify.governor = spotify_async.governor = rate_limit.RateGovernor(budgets=budgets, reserve=0)
+
+    if args.refresh_ahead:
+        from util import access_token
+        from util.token_cache import get_token_cache
+
+        # Short test tokens: refresh just ahead of the token cache margin
+        scheduler = access_token.refresh_scheduler
+        scheduler.enabled = True
+        scheduler.lead = min(scheduler.lead, get_token_cache().margin + 5)
+        scheduler.jitter = min(scheduler.jitter, 2)
+
+    if args.no_recent_history:
+        from util import recent_history
+
+        # The stored buffer is never fresh, so every offline render asks Spotify
+        recent_history.RECENT_HISTORY_TTL = 0
+
+    if args.no_swr:
+        from util.swr import swr_cache
+
+        swr_cache.enabled = False
+
+    if args.no_negative_cache:
+        from util import negative_cache
+
+        negative_cache.get_invalid = lambda uid, now=None: None
+
+    uids = make_uids(args.users)
+    badge_target = None
+    if args.target == "badge":
+        seed_users(uids, args.token_ttl)
+        target = badge_target = BadgeTarget()
+    else:
+        target = IndexTarget()
+
+    shared_cache = None
+    if args.shared_cache:
+        target = shared_cache = SharedCache(target, ignore_policy=args.shared_cache == "no-cache")
+
+    driver = Driver(target, uids, make_weights(len(uids), args.skew), args.revalidate)
+    elapsed = driver.run(args.requests, args.concurrency)
+    report(driver, elapsed, server.fake.get_calls(), shared_cache, badge_target.rendered if badge_target else None)
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
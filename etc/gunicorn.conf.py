@@ -0,0 +1,11 @@
+# gunicorn -c etc/gunicorn.conf.py --chdir api view:app
+
+
+def post_fork(server, worker):
+
+    # Compile every theme template before the worker takes its first request
+    from util import fragments, themes
+
+    elapsed = themes.warm_up()
+    fragments.warm_up(theme["num_bar"] for theme in themes.THEMES.values())
+    server.log.info("Worker %s warmed %d themes in %.1f ms", worker.pid, len(themes.THEMES), elapsed * 1000)
@@ -0,0 +1,274 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import json
+import re
+from base64 import b64decode, b64encode
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.firestore_batch import BatchReader, WriteBehindQueue
+from util.firestore_fake import FakeFirestore
+from util.token_cache import MemorySharedCache, make_token_cache
+
+
+def get_cells(svg):
+
+    # (x, y, badge svg) of each <image> cell of a grid
+    return [(int(x), int(y), b64decode(data).decode("utf-8"))
+            for x, y, data in re.findall(r'<image x="(\d+)" y="(\d+)" [^>]*base64,([^"]+)"', svg)]
+
+
+def get_badges(response):
+
+    return "".join(cell for _, _, cell in get_cells(response.get_data(as_text=True)))
+
+
+def now_playing(access_token, max_wait=None):
+    uid = access_token.split("-", 1)[1]
+    if uid == "offline":
+        return {}
+    return {
+        "progress_ms": 1000,
+        "currently_playing_type": "track",
+        "item": {"name": f"Song {uid}", "artists": [{"name": "Artist"}], "duration_ms": 180000},
+    }
+
+
+@pytest.fixture
+def db():
+    from util import recent_history, snapshots, token_cache
+
+    db = FakeFirestore()
+    for uid in ("a", "b", "offline"):
+        db.collection("users").document(uid).set({"access_token": f"token-{uid}", "expired_ts": 2 ** 40})
+    db.rpcs = 0
+
+    token_cache.set_token_cache(make_token_cache("memory"))
+    recent_history.set_history_store(MemorySharedCache())
+    snapshots.set_snapshot_store(MemorySharedCache())
+    with patch("util.firestore_batch.reader", BatchReader(lambda: db, window=0)), \
+         patch("util.firestore_batch.writer", WriteBehindQueue(lambda: db)), \
+         patch("util.spotify_async.get_now_playing", side_effect=now_playing), \
+         patch("util.spotify_async.get_recently_play", return_value={"items": []}):
+        yield db
+    token_cache.set_token_cache(None)
+    recent_history.set_history_store(None)
+    snapshots.set_snapshot_store(None)
+
+
+@pytest.fixture
+def client():
+    from api.batch import app
+    from util.swr import swr_cache
+
+    app.config.update({"TESTING": True})
+    swr_cache.clear()
+    with app.test_client() as client:
+        yield client
+
+
+def test_grid_renders_every_uid(client, db):
+    """Test that one request renders a composite grid in uid order."""
+    response = client.get("/api/batch?uids=a,b,a,offline&theme=compact&cover_image=false")
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/svg+xml"
+    cells = get_cells(response.get_data(as_text=True))
+    # Repeated uids are rendered once
+    assert len(cells) == 3
+    assert "Song a" in cells[0][2] and "Song b" in cells[1][2]
+    assert cells[1][:2] == (320, 0)
+    assert db.rpcs == 1
+
+
+def test_grid_cells_do_not_share_css(client, db):
+    """Test that each badge's <style> stays inside its own cell document."""
+    svg = client.get("/api/batch?uids=a,b&theme=compact&cover_image=false").get_data(as_text=True)
+
+    assert "<style" not in svg
+    assert all("<style" in cell for _, _, cell in get_cells(svg))
+
+
+def test_failed_uid_keeps_its_cell(client, db):
+    """Test that a failed uid is drawn as a placeholder instead of shifting the grid."""
+    cells = get_cells(client.get("/api/batch?uids=missing,b&theme=compact&cover_image=false").get_data(as_text=True))
+
+    assert len(cells) == 2
+    assert cells[0][:2] == (0, 0) and "Badge unavailable" in cells[0][2]
+    assert cells[1][:2] == (320, 0) and "Song b" in cells[1][2]
+
+
+def test_grid_cache_control_follows_shortest_policy(client, db):
+    """Test that the grid is cached as briefly as its shortest-lived badge."""
+    from util import cache_policy
+
+    playing = client.get("/api/batch?uids=a,offline&cover_image=false")
+    offline = client.get("/api/batch?uids=offline&cover_image=false")
+    failed = client.get("/api/batch?uids=offline,missing&cover_image=false")
+
+    assert playing.headers["Cache-Control"] == cache_policy.make_cache_control(
+        *cache_policy.get_policy(True, 1000, 180000))
+    assert offline.headers["Cache-Control"] == cache_policy.make_cache_control(*cache_policy.get_policy(False))
+    assert failed.headers["Cache-Control"] == cache_policy.make_cache_control(*cache_policy.get_policy(False, stale=True))
+    assert "Expires" in playing.headers
+
+
+def test_ndjson_streams_per_uid_results(client, db):
+    """Test that ndjson returns one line per uid, unknown uids included."""
+    response = client.get("/api/batch?uids=a,b,missing&format=ndjson&cover_image=false")
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    results = {line["uid"]: line for line in lines}
+    assert response.mimetype == "application/x-ndjson"
+    assert "Song b" in results["b"]["svg"]
+    assert results["missing"]["error"] == "unknown uid"
+
+
+@pytest.mark.parametrize("query", ["", "?uids=", "?uids=" + ",".join(str(i) for i in range(51))])
+def test_invalid_uids(client, query):
+    """Test that a missing or oversized uid list is rejected."""
+    assert client.get("/api/batch" + query).status_code == 400
+
+
+def test_cached_tokens_skip_firestore(db):
+    """Test that load_token_infos only reads cache misses."""
+    from util.access_token import get_access_token, load_token_infos
+
+    get_access_token("a")
+    db.rpcs = 0
+
+    token_infos = load_token_infos(["a", "b"])
+    assert set(token_infos) == {"a", "b"}
+    assert db.rpcs == 1
+
+
+def test_grid_inlines_covers_through_the_cover_cache(client, db):
+    """Test that the async path splices the cached cover into the prepared SVG."""
+    item = {"name": "Song a", "id": "t1", "artists": [{"name": "Artist"}], "duration_ms": 180000,
+            "album": {"images": [{"url": "https://i.scdn.co/image/abc"}]}}
+
+    with patch("util.spotify_async.get_now_playing", return_value={"item": item, "progress_ms": 1000}), \
+         patch("util.badge.load_cover_b64_bytes", return_value=b"Y292ZXI=") as mock_b64:
+        svg = get_badges(client.get("/api/batch?uids=a"))
+
+    assert "Y292ZXI=" in svg
+    mock_b64.assert_called_once_with("https://i.scdn.co/image/abc", 300)
+
+
+def test_fresh_snapshot_skips_now_playing(client, db):
+    """Test that a uid the poller keeps fresh is rendered without a Spotify call."""
+    from util import snapshots
+
+    snapshots.set_snapshot("a", snapshots.make_snapshot(now_playing("token-b"), fresh_for=60))
+    with patch("util.spotify_async.get_now_playing") as mock_now_playing:
+        svg = get_badges(client.get("/api/batch?uids=a&cover_image=false"))
+
+    assert "Song b" in svg
+    mock_now_playing.assert_not_called()
+
+
+def test_throttled_uid_is_served_from_its_last_snapshot(client, db):
+    """Test that a throttled now-playing call falls back to the stale snapshot."""
+    from util.spotify import RateLimitedError
+    from util.swr import swr_cache
+
+    client.get("/api/batch?uids=a&cover_image=false")
+    swr_cache.clear()
+    with patch("util.spotify_async.get_now_playing", side_effect=RateLimitedError("now_playing")):
+        svg = get_badges(client.get("/api/batch?uids=a,b&cover_image=false"))
+
+    assert "Song a" in svg
+    assert "Song b" not in svg
+
+
+def test_data_uri_is_encoded_per_segment():
+    """Test that a badge's segments are base64-encoded without being joined."""
+    from api.batch import make_data_uri
+
+    parts = [b"<svg>", b"QUJD" * 1000, b"x", b"</svg>"]
+
+    assert make_data_uri(parts).getvalue() == b"data:image/svg+xml;base64," + b64encode(b"".join(parts))
+
+
+def test_throttled_snapshot_is_cached_as_stale(client, db):
+    """Test that a badge served from a throttled fallback gets the stale cache policy."""
+    from util import cache_policy
+    from util.spotify import RateLimitedError
+    from util.swr import swr_cache
+
+    client.get("/api/batch?uids=a&cover_image=false")
+    swr_cache.clear()
+    with patch("util.spotify_async.get_now_playing", side_effect=RateLimitedError("now_playing")):
+        response = client.get("/api/batch?uids=a&cover_image=false")
+
+    assert response.headers["Cache-Control"] == cache_policy.make_cache_control(
+        *cache_policy.get_policy(True, stale=True))
+
+
+def test_make_svg_progress_themes():
+    """Test that themes with a progress bar get progress data."""
+    from util.badge import make_svg
+
+    svg = make_svg("Artist", "Song", "", True, False, "spotify-embed", "53b14f", "181414", "dark", 61000, 180000)
+
+    assert "1:01" in svg
+    assert "-1:59" in svg
+
+
+def test_make_svg_animated_progress():
+    """Test that the animated mode emits a keyframe animation instead of a frozen bar."""
+    from util.badge import make_svg
+
+    svg = make_svg("Artist", "Song", "", True, False, "apple", "53b14f", "181414", "dark", 60000, 180000, True)
+
+    assert "@keyframes progress-fill" in svg
+    assert "animation:progress-fill 120.0s linear forwards" in svg
+    assert "3:00" in svg
+    # No elapsed label: it would stay at the render time while the bar moves
+    assert "0:00" not in svg and "1:00" not in svg
+
+
+def test_make_svg_animated_embed_has_no_elapsed_label():
+    """Test that the spotify-embed theme drops the elapsed time in animated mode."""
+    from util.badge import make_svg
+
+    svg = make_svg("Artist", "Song", "", True, False, "spotify-embed", "53b14f", "181414", "dark", 60000, 180000, True)
+
+    assert "<span>3:00</span>" in svg
+    assert "<span>0:00</span>" not in svg and "<span>1:00</span>" not in svg
+
+
+def test_external_cover_mode_links_cover():
+    """Test that cover_mode=external references the cover endpoint instead of inlining it."""
+    from util.badge import DEFAULT_OPTIONS, render_badge_segments
+
+    item = {"name": "Song", "id": "t1", "artists": [{"name": "Artist"}], "duration_ms": 180000,
+            "album": {"images": [{"url": "https://i.scdn.co/image/abc"}]}}
+    src = "https://example.com/api/cover/abc-300-0123456789abcdef.jpg"
+
+    with patch("util.badge.get_cover_src", return_value=src), \
+         patch("util.badge.load_cover_b64_bytes") as mock_b64:
+        svg = render_badge_segments(
+            "token", dict(DEFAULT_OPTIONS, cover_mode="external"), (item, True, 1000)
+        ).getvalue().decode("utf-8")
+
+    assert f'src="{src}"' in svg
+    assert "base64, " not in svg
+    mock_b64.assert_not_called()
+
+
+def test_profanity_option_censors_names(client, db):
+    """Test that profanity=true censors song and artist names, as the callback UI expects."""
+    from util.badge import get_names
+
+    item = {"name": "Shit Song", "artists": [{"name": "Fuck Band"}]}
+
+    assert get_names(item) == ("Fuck Band", "Shit Song")
+    assert get_names(item, profanity=True) == ("**** Band", "**** Song")
+
+    with patch("util.spotify_async.get_now_playing", return_value={"progress_ms": 1000, "item": item}):
+        svg = get_badges(client.get("/api/batch?uids=a&cover_image=false&profanity=true"))
+    assert "**** Song" in svg and "Shit" not in svg
@@ -0,0 +1,64 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from io import BytesIO
+
+from PIL import Image
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.cover_cache import CoverCache, get_cover_hash
+
+COVER_ID = "ab67616d0000b273abcdef"
+
+
+@pytest.fixture
+def cache():
+    out = BytesIO()
+    Image.new("RGB", (640, 640), (20, 120, 40)).save(out, format="JPEG")
+    with patch("util.session.get", return_value=MagicMock(content=out.getvalue())), \
+         patch("util.cover_cache.cover_cache", CoverCache()) as cache:
+        yield cache
+
+
+@pytest.fixture
+def client():
+    from api.cover import app
+
+    app.config.update({"TESTING": True})
+    with app.test_client() as client:
+        yield client
+
+
+def get_hash(cache, size):
+    return get_cover_hash(cache.get(f"https://i.scdn.co/image/{COVER_ID}", size)[0])
+
+
+def test_cover_is_immutable(client, cache):
+    """Test that a content-hash URL is served with an immutable Cache-Control."""
+    cover_hash = get_hash(cache, 64)
+    response = client.get(f"/api/cover/{COVER_ID}-64-{cover_hash}.jpg")
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert Image.open(BytesIO(response.data)).size == (64, 64)
+
+    response = client.get(f"/api/cover/{COVER_ID}-64-{cover_hash}.jpg", headers={"If-None-Match": f'"{cover_hash}"'})
+    assert response.status_code == 304
+
+
+def test_stale_hash_is_not_immutable(client, cache):
+    """Test that an outdated hash gets the current cover with a short TTL."""
+    response = client.get(f"/api/cover/{COVER_ID}-64-0000000000000000.jpg")
+
+    assert response.status_code == 200
+    assert "immutable" not in response.headers["Cache-Control"]
+
+
+@pytest.mark.parametrize("name", ["nope.jpg", f"{COVER_ID}-1000-abc.jpg", f"{COVER_ID}-64-abc.png"])
+def test_invalid_cover_names(client, cache, name):
+    """Test that unknown names and sizes outside the themes are rejected."""
+    assert client.get(f"/api/cover/{name}").status_code == 404
@@ -0,0 +1,32 @@
+import pytest
+import subprocess
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+API = os.path.join(os.path.dirname(__file__), "..", "api")
+
+HEAVY_MODULES = ("PIL", "colorgram", "firebase_admin", "profanityfilter", "numpy")
+
+PROBE = """
+import sys
+import {module}
+print("loaded:" + ",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+@pytest.mark.parametrize("module", ["login", "callback", "index"])
+def test_entry_point_defers_heavy_imports(module):
+    """Test that a cold import of an entry point loads none of the heavy modules."""
+    env = dict(os.environ, FIREBASE="e30=")
+    env.pop("TESTING", None)
+
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=API, env=env, capture_output=True, text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == "loaded:"
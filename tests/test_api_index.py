@@ -0,0 +1,198 @@
+import pytest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path to import the api module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+NOW_PLAYING = {
+    "progress_ms": 60000,
+    "item": {
+        "id": "track123",
+        "name": "Test Song",
+        "artists": [{"name": "Test Artist"}],
+        "duration_ms": 180000,
+    },
+}
+
+
+from util.cache_policy import NO_CACHE
+from util.swr import swr_cache
+
+
+@pytest.fixture
+def client():
+    """Create a test client for the index Flask application."""
+    from api.index import app
+    from util.render_cache import render_cache
+
+    app.config.update({"TESTING": True})
+    render_cache.clear()
+    swr_cache.clear()
+
+    with app.test_client() as client:
+        yield client
+
+
+@patch('api.index.get_now_playing')
+def test_now_playing(mock_get_now_playing, client):
+    """Test rendering the currently playing track."""
+    mock_get_now_playing.return_value = NOW_PLAYING
+
+    response = client.get('/api/spotify')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'image/svg+xml'
+    assert b'Test Song' in response.data
+    assert b'Test Artist' in response.data
+    assert response.headers['ETag']
+
+
+@patch('api.index.get_now_playing')
+def test_paused(mock_get_now_playing, client):
+    """Test rendering when nothing is playing."""
+    mock_get_now_playing.return_value = {}
+
+    response = client.get('/api/spotify')
+
+    assert response.status_code == 200
+    assert 'Spotify en pausa' in response.get_data(as_text=True)
+
+
+@patch('api.index.get_now_playing')
+def test_if_none_match_returns_304(mock_get_now_playing, client):
+    """Test that an unchanged badge is revalidated with 304."""
+    mock_get_now_playing.return_value = NOW_PLAYING
+
+    etag = client.get('/api/spotify').headers['ETag']
+    response = client.get('/api/spotify', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+@patch('api.index.get_now_playing')
+def test_changed_options_get_new_etag(mock_get_now_playing, client):
+    """Test that query options are part of the cached render."""
+    mock_get_now_playing.return_value = NOW_PLAYING
+
+    etag = client.get('/api/spotify').headers['ETag']
+    response = client.get('/api/spotify?bar_color=ff0000', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'#ff0000' in response.data
+
+
+@patch('api.index.get_now_playing')
+def test_error_svg(mock_get_now_playing, client):
+    """Test that malformed Spotify data renders the error badge."""
+    mock_get_now_playing.return_value = {"item": {"name": "Broken"}}
+
+    response = client.get('/api/spotify')
+
+    assert response.status_code == 200
+    assert b'Error' in response.data
+
+
+@patch('api.index.get_now_playing')
+def test_cache_headers_follow_playback(mock_get_now_playing, client):
+    """Test that a playing badge is cacheable until the track ends, an idle one longer."""
+    mock_get_now_playing.return_value = dict(NOW_PLAYING, progress_ms=170000)
+    playing = client.get('/api/spotify').headers
+
+    swr_cache.clear()
+    mock_get_now_playing.return_value = {}
+    paused = client.get('/api/spotify').headers
+
+    assert 'max-age=10,' in playing['Cache-Control']
+    assert 'no-store' not in playing['Cache-Control']
+    assert playing['Last-Modified']
+    assert 'max-age=300,' in paused['Cache-Control']
+    assert 'Last-Modified' not in paused
+
+
+@patch('api.index.get_now_playing')
+def test_if_modified_since_returns_304(mock_get_now_playing, client):
+    """Test revalidation with Last-Modified when no ETag is sent."""
+    mock_get_now_playing.return_value = NOW_PLAYING
+
+    last_modified = client.get('/api/spotify').headers['Last-Modified']
+    response = client.get('/api/spotify', headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 304
+
+
+@patch('api.index.get_now_playing')
+def test_last_modified_is_render_time(mock_get_now_playing, client):
+    """Test that Last-Modified stays the same while the cached SVG is served."""
+    mock_get_now_playing.return_value = NOW_PLAYING
+
+    with patch('util.render_cache.render_cache.clock', return_value=1000.0):
+        first = client.get('/api/spotify').headers['Last-Modified']
+    swr_cache.clear()
+    with patch('util.render_cache.render_cache.clock', return_value=1030.0):
+        second = client.get('/api/spotify').headers['Last-Modified']
+
+    assert first == second
+
+
+@patch('api.index.get_now_playing')
+def test_animated_progress(mock_get_now_playing, client):
+    """Test that the animated mode runs the bar to the end and caches longer."""
+    mock_get_now_playing.return_value = NOW_PLAYING
+
+    static = client.get('/api/spotify')
+    animated = client.get('/api/spotify?progress_animation=true')
+
+    assert b'<animate' not in static.data
+    assert b'dur="120.0s"' in animated.data
+    assert 'max-age=30,' in static.headers['Cache-Control']
+    assert 'max-age=120,' in animated.headers['Cache-Control']
+
+
+@patch('api.index.get_now_playing')
+def test_stale_badge_served_while_refreshing(mock_get_now_playing, client):
+    """Test that a badge past its freshness window is served at once and marked stale."""
+    mock_get_now_playing.return_value = NOW_PLAYING
+    client.get('/api/spotify')
+
+    with patch.object(swr_cache, 'clock', lambda: swr_cache._entries[next(iter(swr_cache._entries))][1] + 10), \
+         patch.object(swr_cache, 'revalidate') as mock_revalidate:
+        response = client.get('/api/spotify')
+
+    assert b'Test Song' in response.data
+    assert 'Stale' in response.headers['Warning']
+    mock_revalidate.assert_called_once()
+    mock_get_now_playing.assert_called_once()
+
+
+@patch('api.index.get_now_playing')
+def test_failed_fetch_is_not_cached_as_paused(mock_get_now_playing, client):
+    """Test that a failed Spotify fetch renders the paused badge with no-store, not the idle TTL."""
+    mock_get_now_playing.return_value = None
+    response = client.get('/api/spotify')
+
+    assert 'Spotify en pausa' in response.get_data(as_text=True)
+    assert response.headers['Cache-Control'] == NO_CACHE
+    assert 'ETag' not in response.headers
+
+
+def test_throttled_without_snapshot_is_a_failure(client):
+    """Test that a throttled call with no snapshot yet is reported as a failure."""
+    from api import index
+    from util import snapshots
+    from util.spotify import RateLimitedError
+    from util.token_cache import MemorySharedCache
+
+    snapshots.set_snapshot_store(MemorySharedCache())
+    try:
+        with patch('api.index.get_access_token', side_effect=RateLimitedError('token')):
+            assert index.get_now_playing() is None
+            response = client.get('/api/spotify')
+    finally:
+        snapshots.set_snapshot_store(None)
+
+    assert response.headers['Cache-Control'] == NO_CACHE
@@ -0,0 +1,64 @@
+import pytest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from fake_spotify import FakeSpotifyServer, redirect_session
+from util import session, spotify, spotify_async
+from util.rate_limit import RateGovernor
+
+
+@pytest.fixture
+def server():
+    server = FakeSpotifyServer(playing_ratio=0.5).start()
+    session.reset_session()
+    redirect_session(server.url)
+    with patch("util.spotify.governor", RateGovernor(reserve=0)):
+        yield server
+    session.reset_session()
+    spotify_async.set_transport_factory(None)
+    server.stop()
+
+
+def test_spotify_calls_reach_fake_server(server):
+    """Test that util.spotify is answered by the fake through the pooled session."""
+    fake = server.fake
+    playing = next(uid for uid in (f"user{i}" for i in range(100)) if fake.is_playing(uid))
+    offline = next(uid for uid in (f"user{i}" for i in range(100)) if not fake.is_playing(uid))
+
+    token = spotify.refresh_token(f"refresh-{playing}")["access_token"]
+    assert token == f"token-{playing}"
+    assert spotify.get_now_playing(token)["item"]["name"].startswith(f"Song {playing}")
+    assert spotify.get_now_playing(f"token-{offline}") == {}
+    assert len(spotify.get_recently_play(f"token-{offline}")["items"]) == 10
+
+    assert fake.get_calls() == {"token": 1, "now_playing": 2, "recently_played": 1}
+    assert session.get_stats()["connections"] == 1
+
+
+def test_async_client_reaches_fake_server(server):
+    """Test that util.spotify_async is redirected too and counted in the session stats."""
+    fake = server.fake
+    playing = next(uid for uid in (f"user{i}" for i in range(100)) if fake.is_playing(uid))
+
+    with patch("util.spotify_async.governor", RateGovernor(reserve=0)):
+        for _ in range(3):
+            data = spotify_async.run_sync(spotify_async.get_now_playing(f"token-{playing}"))
+            assert data["item"]["name"].startswith(f"Song {playing}")
+
+    assert fake.get_calls() == {"now_playing": 3}
+    stats = session.get_stats()
+    assert stats["hosts"]["api.spotify.com"] == {"connections": 1, "requests": 3}
+
+
+def test_fake_server_throttles(server):
+    """Test that throttle_ratio answers 429 with Retry-After."""
+    server.fake.throttle_ratio = 1.0
+
+    with pytest.raises(spotify.RateLimitedError):
+        spotify.get_now_playing("token-user0")
+    assert server.fake.get_calls()["throttled"] == 1
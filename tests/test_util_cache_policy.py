@@ -0,0 +1,50 @@
+import pytest
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.cache_policy import get_cache_headers, get_policy, make_cache_control
+
+
+@pytest.mark.parametrize("progress_ms, expected", [
+    (0, 30),
+    (170000, 10),
+    (179800, 1),
+    (None, 30),
+])
+def test_playing_ttl_ends_with_the_track(progress_ms, expected):
+    """Test that a playing badge is never cached past the end of the track."""
+    max_age, stale_while_revalidate = get_policy(True, progress_ms, 180000)
+
+    assert max_age == expected
+    assert stale_while_revalidate <= max_age
+
+
+def test_idle_and_stale_policies():
+    """Test the offline and stale-snapshot policies."""
+    assert get_policy(False) == (300, 600)
+    assert get_policy(True, 0, 180000, stale=True) == (5, 0)
+
+
+def test_make_cache_control():
+    """Test the Cache-Control header value."""
+    assert make_cache_control(30, 5) == "public, max-age=30, s-maxage=30, stale-while-revalidate=5"
+    assert make_cache_control(5) == "public, max-age=5, s-maxage=5"
+
+
+def test_get_cache_headers():
+    """Test the full header set for a playing badge."""
+    headers = get_cache_headers(True, 170000, 180000, now=0, last_modified=5.5)
+
+    assert headers["Cache-Control"].startswith("public, max-age=10,")
+    assert headers["Expires"] == "Thu, 01 Jan 1970 00:00:10 GMT"
+    assert headers["Last-Modified"] == "Thu, 01 Jan 1970 00:00:05 GMT"
+    assert "Last-Modified" not in get_cache_headers(True, 170000, 180000, now=0)
+
+
+def test_animated_ttl_runs_to_track_end():
+    """Test that an animated badge may be cached longer, still not past the track."""
+    assert get_policy(True, 0, 180000, animated=True)[0] == 120
+    assert get_policy(True, 120000, 180000, animated=True)[0] == 60
@@ -0,0 +1,157 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+import requests
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import circuit_breaker
+from util.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(autouse=True)
+def breakers():
+    circuit_breaker.reset()
+    yield
+    circuit_breaker.reset()
+
+
+def test_opens_after_consecutive_failures(clock):
+    """Test that the circuit opens at the threshold and rejects calls while open."""
+    breaker = CircuitBreaker("host", failure_threshold=3, reset_timeout=30, clock=clock)
+
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.get_stats()["rejected"] == 1
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    """Test that after the reset timeout one probe decides the next state."""
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=30, half_open_probes=1, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_lost_probe_does_not_stick_half_open(clock):
+    """Test that a released or unreported probe lets another one through."""
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=30, half_open_probes=1, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+    # Never reported: given up on after the reset timeout
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_cancelled_async_probe_is_released():
+    """Test that a cancelled get_json frees the half-open probe instead of blocking the host."""
+    import asyncio
+    from util import spotify_async
+
+    url = "https://api.spotify.com/v1/me/player/currently-playing"
+    breaker = circuit_breaker.get_breaker(url)
+    breaker.state, breaker.opened_at = OPEN, breaker.clock() - breaker.reset_timeout
+
+    class SlowClient:
+        async def get(self, url, **kwargs):
+            await asyncio.sleep(10)
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(spotify_async.get_json("now_playing", url, "token"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with patch("util.spotify_async.get_client", return_value=SlowClient()):
+        spotify_async.run_sync(cancel_probe())
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_breakers_are_per_host():
+    """Test that accounts and api hosts trip independently."""
+    accounts = circuit_breaker.get_breaker("https://accounts.spotify.com/api/token")
+    api = circuit_breaker.get_breaker("https://api.spotify.com/v1/me")
+
+    assert accounts is not api
+    assert accounts is circuit_breaker.get_breaker("https://accounts.spotify.com/authorize")
+
+
+@patch("util.session.request")
+def test_request_spotify_fails_fast_when_open(mock_request):
+    """Test that request_spotify stops calling a failing host and raises CircuitOpenError."""
+    from util import spotify
+    from util.rate_limit import RateGovernor
+
+    mock_request.side_effect = requests.ConnectionError
+    budgets = {"global": (1e9, 1e9), "now_playing": (1e9, 1e9)}
+    with patch("util.spotify.governor", RateGovernor(budgets=budgets, reserve=0)):
+        for _ in range(circuit_breaker.CIRCUIT_FAILURE_THRESHOLD):
+            with pytest.raises(requests.ConnectionError):
+                spotify.get_now_playing("token")
+
+        with pytest.raises(spotify.CircuitOpenError):
+            spotify.get_now_playing("token")
+
+    assert mock_request.call_count == circuit_breaker.CIRCUIT_FAILURE_THRESHOLD
+
+
+@patch("util.session.request")
+def test_server_errors_count_and_4xx_do_not(mock_request):
+    """Test that 5xx answers are failures while 4xx answers close the circuit."""
+    from util import spotify
+
+    breaker = circuit_breaker.get_breaker(spotify.SPOTIFY_URL_USER_INFO)
+    mock_request.return_value = MagicMock(status_code=503)
+    spotify.get_user_profile("token")
+    assert breaker.failures == 1
+
+    mock_request.return_value = MagicMock(status_code=401)
+    spotify.get_user_profile("token")
+    assert breaker.failures == 0
@@ -0,0 +1,117 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from base64 import b64decode
+from io import BytesIO
+
+from PIL import Image
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.cover_cache import CoverCache, get_cover_hash, get_cover_id, get_cover_name, parse_cover_name
+
+COVER_URL = "https://i.scdn.co/image/ab67616d0000b273abcdef"
+
+
+def make_jpeg(size=640, color=(200, 30, 30)):
+    out = BytesIO()
+    Image.new("RGB", (size, size), color).save(out, format="JPEG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def mock_get():
+    response = MagicMock(content=make_jpeg())
+    with patch("util.session.get", return_value=response) as mock_get:
+        yield mock_get
+
+
+def test_cover_id_from_scdn_url():
+    """Test that i.scdn.co URLs are keyed by their image id."""
+    assert get_cover_id(COVER_URL) == "ab67616d0000b273abcdef"
+    assert get_cover_id("http://example.com/a.jpg") == get_cover_id("http://example.com/a.jpg")
+    assert get_cover_id("http://example.com/a.jpg") != get_cover_id("http://example.com/b.jpg")
+
+
+def test_variant_is_resized_and_encoded_once(mock_get):
+    """Test that a cached variant costs no download or encoding."""
+    cache = CoverCache()
+
+    data, b64 = cache.get(COVER_URL, size=64)
+    assert Image.open(BytesIO(data)).size == (64, 64)
+    assert b64decode(b64) == data
+
+    assert cache.get(COVER_URL, size=64) == (data, b64)
+    mock_get.assert_called_once()
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_sizes_are_separate_variants(mock_get):
+    """Test that each theme size is stored as its own variant, from one download."""
+    cache = CoverCache()
+
+    small, _ = cache.get(COVER_URL, size=64)
+    large, _ = cache.get(COVER_URL, size=300)
+
+    assert Image.open(BytesIO(large)).size == (300, 300)
+    assert len(small) < len(large)
+    mock_get.assert_called_once()
+    assert cache.get_stats()["downloads"] == 1
+
+
+def test_disk_tier_survives_new_process(tmp_path, mock_get):
+    """Test that a fresh cache reads variants back from disk."""
+    data, _ = CoverCache(path=str(tmp_path)).get(COVER_URL, size=64)
+
+    cache = CoverCache(path=str(tmp_path))
+    assert cache.get(COVER_URL, size=64)[0] == data
+    assert cache.get_stats()["disk_hits"] == 1
+    mock_get.assert_called_once()
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+
+def test_memory_tier_is_bounded(mock_get):
+    """Test that memory use stays under max_bytes."""
+    cache = CoverCache(max_bytes=3000)
+
+    for i in range(5):
+        cache.get(f"https://i.scdn.co/image/cover{i}", size=64)
+
+    assert cache.size <= 3000
+    assert cache.get_stats()["entries"] < 5
+
+
+def test_small_covers_use_lower_quality(mock_get):
+    """Test that thumbnail-sized variants are encoded at the small-cover quality."""
+    from util.cover_cache import resize_cover
+
+    source = make_jpeg()
+    assert len(resize_cover(source, 64)) < len(resize_cover(source, 64, quality=85))
+
+
+def test_cover_name_round_trip(mock_get):
+    """Test that external cover names carry the id, size and content hash."""
+    get_cover_name.cache_clear()
+    with patch("util.cover_cache.cover_cache", CoverCache()) as cache:
+        name = get_cover_name(COVER_URL, 64)
+        data = cache.get(COVER_URL, 64)[0]
+
+    assert name == f"ab67616d0000b273abcdef-64-{get_cover_hash(data)}.jpg"
+    assert parse_cover_name(name) == ("ab67616d0000b273abcdef", 64, get_cover_hash(data))
+    assert get_cover_name("http://example.com/a.jpg") is None
+    assert parse_cover_name("../etc/passwd") is None
+
+
+def test_cover_name_memo_holds_no_images(mock_get):
+    """Test that a repeated cover name is served from the URL memo without reloading the image."""
+    get_cover_name.cache_clear()
+    with patch("util.cover_cache.cover_cache", CoverCache()) as cache:
+        first = get_cover_name(COVER_URL, 64)
+        cache.clear()
+        second = get_cover_name(COVER_URL, 64)
+
+    assert first == second
+    assert cache.get_stats()["misses"] == 1
+    assert not hasattr(get_cover_hash, "cache_info")
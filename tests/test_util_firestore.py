@@ -0,0 +1,71 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import firestore
+
+
+@pytest.fixture(autouse=True)
+def holder(monkeypatch):
+    monkeypatch.delenv("TESTING", raising=False)
+    monkeypatch.delenv("FIRESTORE_FAKE", raising=False)
+    firestore.reset_firestore_db()
+    yield
+    firestore.reset_firestore_db()
+
+
+def test_client_is_created_once_per_process():
+    """Test that the client is built lazily and then reused."""
+    with patch("util.firestore.make_firestore_db", side_effect=lambda: MagicMock()) as mock_make:
+        assert mock_make.call_count == 0
+        db = firestore.get_firestore_db()
+
+        assert firestore.get_firestore_db() is db
+        assert mock_make.call_count == 1
+
+
+def test_client_is_rebuilt_after_pid_change():
+    """Test that a forked process never reuses the parent's client."""
+    with patch("util.firestore.make_firestore_db", side_effect=lambda: MagicMock()):
+        parent = firestore.get_firestore_db()
+
+        with patch("os.getpid", return_value=os.getpid() + 1):
+            child = firestore.get_firestore_db()
+
+    assert child is not parent
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_resets_holder():
+    """Test that the at-fork hook drops the inherited client."""
+    with patch("util.firestore.make_firestore_db", side_effect=lambda: MagicMock()):
+        firestore.get_firestore_db()
+
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if firestore._db is None else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+
+def test_lazy_proxy_delegates():
+    """Test that the module-level db resolves the client on attribute access."""
+    client = MagicMock()
+    with patch("util.firestore.make_firestore_db", return_value=client):
+        firestore.db.collection("users")
+
+    client.collection.assert_called_once_with("users")
+
+
+def test_missing_config(monkeypatch):
+    """Test that a missing FIREBASE variable is reported on first use."""
+    monkeypatch.delenv("FIREBASE", raising=False)
+    monkeypatch.setattr(firestore, "_credential", None)
+
+    with pytest.raises(ValueError):
+        firestore.get_credential()
@@ -0,0 +1,106 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import threading
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.firestore_batch import BatchReader, WriteBehindQueue
+from util.firestore_fake import FakeFirestore
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    for uid in ("a", "b", "c"):
+        db.collection("users").document(uid).set({"access_token": uid})
+    db.rpcs = 0
+    return db
+
+
+def test_concurrent_reads_share_one_rpc(db):
+    """Test that reads arriving within the window become one get_all call."""
+    reader = BatchReader(lambda: db, window=0.05)
+    barrier = threading.Barrier(6)
+    results = {}
+
+    def worker(uid):
+        barrier.wait()
+        results.setdefault(uid, []).append(reader.get(uid))
+
+    threads = [threading.Thread(target=worker, args=(uid,)) for uid in ("a", "b", "c", "a", "b", "missing")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results["a"] == [{"access_token": "a"}] * 2
+    assert results["missing"] == [None]
+    assert reader.reads == 6
+    assert reader.rpcs == db.rpcs == 1
+
+
+def test_get_many(db):
+    """Test that get_many reads every uid in one call."""
+    reader = BatchReader(lambda: db, window=0)
+
+    assert reader.get_many(["a", "c"]) == {"a": {"access_token": "a"}, "c": {"access_token": "c"}}
+    assert db.rpcs == 1
+
+
+def test_read_errors_reach_every_caller():
+    """Test that a failed get_all raises in the waiting callers."""
+    db = MagicMock()
+    db.get_all.side_effect = RuntimeError("unavailable")
+    reader = BatchReader(lambda: db, window=0)
+
+    with pytest.raises(RuntimeError):
+        reader.get("a")
+
+
+def test_writes_are_coalesced_per_uid(db):
+    """Test that queued updates are merged and committed in one batch."""
+    writer = WriteBehindQueue(lambda: db, flush_interval=60)
+    writer.update("a", {"access_token": "a1", "expired_ts": 1})
+    writer.update("a", {"access_token": "a2"})
+    writer.update("b", {"access_token": "b1"})
+
+    assert db.rpcs == 0
+    assert writer.flush() == 2
+    assert db.commits == 1
+    assert db.collection("users").document("a").get().to_dict() == {"access_token": "a2", "expired_ts": 1}
+    assert writer.flush() == 0
+
+
+def test_urgent_update_is_written_immediately(db):
+    """Test that urgent updates do not wait for the flush thread."""
+    writer = WriteBehindQueue(lambda: db, flush_interval=60)
+    writer.update("a", {"refresh_token": "rotated"}, urgent=True)
+
+    assert db.collection("users").document("a").get().to_dict()["refresh_token"] == "rotated"
+
+
+def test_failed_flush_keeps_writes(db):
+    """Test that writes survive a failed commit without overwriting newer ones."""
+    writer = WriteBehindQueue(lambda: db, flush_interval=60)
+    writer.update("a", {"access_token": "old", "expired_ts": 1})
+
+    with patch.object(FakeFirestore, "batch", side_effect=RuntimeError("unavailable")):
+        with pytest.raises(RuntimeError):
+            writer.flush()
+
+    assert writer.pending("a") == {"access_token": "old", "expired_ts": 1}
+
+
+def test_get_user_reads_pending_writes(db):
+    """Test read-your-writes for updates still waiting in the queue."""
+    from util import firestore_batch
+
+    with patch("util.firestore_batch.reader", BatchReader(lambda: db, window=0)), \
+         patch("util.firestore_batch.writer", WriteBehindQueue(lambda: db, flush_interval=60)):
+        firestore_batch.update_user("a", {"access_token": "new"})
+
+        assert firestore_batch.get_user("a") == {"access_token": "new"}
+        assert db.collection("users").document("a").get().to_dict() == {"access_token": "a"}
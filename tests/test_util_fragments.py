@@ -0,0 +1,54 @@
+import pytest
+import re
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import fragments
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    fragments.reset()
+    yield
+    fragments.reset()
+
+
+def test_css_bar_matches_generate_css_bar_format():
+    """Test that pooled variants keep the per-bar rule layout."""
+    css_bar = fragments.get_css_bar(75, "uid:track")
+    rules = re.findall(r"\.bar:nth-child\((\d+)\)  \{ left: (\d+)px; animation-duration: (\d+)ms; \}", css_bar)
+
+    assert len(rules) == 75
+    assert [int(left) for _, left, _ in rules] == list(range(1, 300, 4))
+    assert all(350 <= int(duration) <= 500 for _, _, duration in rules)
+
+
+def test_css_bar_is_stable_per_key():
+    """Test that a uid and track always get the same variant."""
+    first = fragments.get_css_bar(75, "uid:track")
+    fragments.reset()
+
+    assert fragments.get_css_bar(75, "uid:track") == first
+    variants = {fragments.get_css_bar(75, f"uid{i}:track") for i in range(100)}
+    assert 1 < len(variants) <= fragments.CSS_BAR_POOL_SIZE
+
+
+def test_warm_up_builds_pools_once():
+    """Test that warm_up fills the pools used by later renders."""
+    fragments.warm_up([75, 100, 0, 75])
+
+    assert set(fragments._css_bar_pools) == {75, 100}
+    assert fragments.get_content_bar(100) is fragments._content_bars[100]
+    assert fragments.get_css_bar(0, "x") == ""
+
+
+def test_make_svg_is_deterministic():
+    """Test that a badge renders identical bytes for the same uid and track."""
+    from util.badge import make_svg
+
+    args = ("Artist", "Song", "", True, False, "default", "53b14f", "181414", "light")
+
+    assert make_svg(*args, bar_key="a:t") == make_svg(*args, bar_key="a:t")
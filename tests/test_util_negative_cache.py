@@ -0,0 +1,75 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import negative_cache
+from util.token_cache import MemorySharedCache
+
+
+@pytest.fixture(autouse=True)
+def store():
+    # Entries are timed by the tests' own now
+    store = MemorySharedCache(clock=lambda: 1000)
+    negative_cache.set_negative_store(store)
+    yield store
+    negative_cache.set_negative_store(None)
+
+
+def test_backoff_doubles_up_to_the_cap():
+    """Test that each rejection doubles the backoff until the maximum."""
+    assert negative_cache.get_backoff(1, 60, 86400) == 60
+    assert negative_cache.get_backoff(2, 60, 86400) == 120
+    assert negative_cache.get_backoff(5, 60, 86400) == 960
+    assert negative_cache.get_backoff(20, 60, 86400) == 86400
+
+
+def test_entry_expires_after_backoff():
+    """Test that a uid is only blocked until its backoff has passed."""
+    negative_cache.record_invalid("uid", "invalid_grant", now=1000)
+
+    assert negative_cache.get_invalid("uid", now=1059)["error"] == "invalid_grant"
+    assert negative_cache.get_invalid("uid", now=1060) is None
+
+
+def test_failures_are_remembered_past_the_backoff():
+    """Test that a rejection after the backoff continues the exponential sequence."""
+    negative_cache.record_invalid("uid", now=1000)
+    entry = negative_cache.record_invalid("uid", now=1100)
+
+    assert entry["failures"] == 2
+    assert entry["until"] == 1100 + 120
+
+
+def test_clear_invalid():
+    """Test that clearing a uid unblocks it immediately."""
+    negative_cache.record_invalid("uid")
+    negative_cache.clear_invalid("uid")
+
+    assert negative_cache.get_invalid("uid") is None
+
+
+def test_new_grant_clears_entry_on_recheck():
+    """Test that another process's entry is dropped once the uid has a new refresh token."""
+    entry = negative_cache.record_invalid("uid", "invalid_grant", "revoked", now=1000)
+
+    assert "revoked" not in str(entry)
+    assert not negative_cache.needs_recheck(entry, now=1029, recheck=30)
+    assert negative_cache.needs_recheck(entry, now=1030, recheck=30)
+
+    # Same grant: still blocked, and not read again for another recheck period
+    checked = negative_cache.check_grant("uid", entry, {"refresh_token": "revoked"}, now=1030)
+    assert not negative_cache.needs_recheck(checked, now=1040, recheck=30)
+    assert negative_cache.get_invalid("uid", now=1040) is not None
+
+    assert negative_cache.check_grant("uid", checked, {"refresh_token": "new"}, now=1040) is None
+    assert negative_cache.get_invalid("uid", now=1041) is None
+
+
+def test_unknown_backend():
+    """Test that an unknown backend is rejected."""
+    with pytest.raises(ValueError):
+        negative_cache.make_negative_store("memcached")
@@ -0,0 +1,86 @@
+import pytest
+import sys
+import os
+import random
+from io import BytesIO
+
+import colorgram
+from PIL import Image
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.palette import PaletteIndex, extract_colors, get_palette, isLightOrDark
+
+
+def make_image(width=80, height=60, seed=1):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height))
+    image.putdata([
+        (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        for _ in range(width * height)
+    ])
+    return image
+
+
+def make_cover(size=640):
+    image = Image.new("RGB", (size, size), (30, 120, 200))
+    image.paste((240, 200, 40), (0, 0, size // 2, size // 3))
+    image.paste((20, 20, 20), (size // 2, size // 2, size, size))
+    out = BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_parity_with_colorgram(seed):
+    """Test that the vectorized extractor matches colorgram exactly."""
+    image = make_image(seed=seed)
+
+    expected = colorgram.extract(image, 5)
+    result = extract_colors(image, 5)
+
+    assert [c.rgb for c in result] == [c.rgb for c in expected]
+    assert [c.proportion for c in result] == pytest.approx([c.proportion for c in expected])
+
+
+def test_parity_with_grey_and_rgba_pixels():
+    """Test hue edge cases (most == least) and alpha channels."""
+    image = Image.new("RGBA", (3, 2))
+    image.putdata([(0, 0, 0, 255), (128, 128, 128, 0), (255, 255, 255, 9),
+                   (255, 0, 0, 255), (255, 255, 0, 255), (0, 255, 255, 255)])
+
+    expected = colorgram.extract(image, 6)
+    result = extract_colors(image, 6)
+
+    assert [c.rgb for c in result] == [c.rgb for c in expected]
+
+
+def test_thumbnail_palette_keeps_dominant_colour():
+    """Test that the downsampled fast path finds the same dominant colour."""
+    data = make_cover()
+
+    palette = get_palette(data)
+    expected = colorgram.extract(Image.open(BytesIO(data)), 5)
+
+    # Resampling blends edge pixels, so allow a few units of drift
+    r, g, b, _ = palette["colors"][0]
+    assert [abs(x - y) <= 3 for x, y in zip((r, g, b), expected[0].rgb)] == [True] * 3
+    assert palette["mode"] == isLightOrDark(expected[0].rgb)
+
+
+def test_palette_index_persists(tmp_path):
+    """Test that palettes are memoized and read back from disk."""
+    data = make_cover()
+    palette = PaletteIndex(str(tmp_path)).get_or_extract("cover1", data)
+
+    index = PaletteIndex(str(tmp_path))
+    assert index.get("cover1") == palette
+    assert index.get_or_extract("cover1", b"not an image") == palette
+    assert index.get("missing") is None
+
+
+def test_is_light_or_dark():
+    """Test the HSP brightness threshold."""
+    assert isLightOrDark([255, 255, 255]) == "light"
+    assert isLightOrDark([0, 0, 0]) == "dark"
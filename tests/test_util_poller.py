@@ -0,0 +1,155 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import poller, snapshots
+from util.spotify import InvalidTokenError
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSpotify:
+    """Local stand-in for the currently-playing endpoint."""
+
+    def __init__(self):
+        self.playing = {}
+        self.calls = 0
+
+    def __call__(self, access_token):
+        self.calls += 1
+        return self.playing.get(access_token, {})
+
+
+def playing(progress_ms, duration_ms=180000):
+    return {
+        "is_playing": True,
+        "progress_ms": progress_ms,
+        "currently_playing_type": "track",
+        "item": {"id": "track", "name": "Test Song", "duration_ms": duration_ms},
+    }
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def fake_spotify():
+    return FakeSpotify()
+
+
+@pytest.fixture
+def store(clock):
+    store = snapshots.MemorySharedCache(clock=clock)
+    snapshots.set_snapshot_store(store)
+    yield store
+    snapshots.set_snapshot_store(None)
+
+
+@pytest.fixture
+def the_poller(clock, fake_spotify, store):
+    with patch("util.poller.get_access_token", side_effect=lambda uid: uid):
+        yield poller.Poller(clock=clock, get_now_playing=fake_spotify)
+
+
+def test_delay_while_playing_and_near_track_end():
+    """Test that playing users are polled often and right after the track ends."""
+    assert poller.next_poll_delay(snapshots.make_snapshot(playing(0), 0)) == poller.POLL_PLAYING_INTERVAL
+
+    near_end = snapshots.make_snapshot(playing(175000), 0)
+    assert poller.next_poll_delay(near_end) == pytest.approx(5 + poller.POLL_TRACK_END_SLACK)
+
+
+def test_idle_delay_backs_off():
+    """Test that idle users are polled less and less often."""
+    idle = snapshots.make_snapshot({}, 0)
+
+    delays = [poller.next_poll_delay(idle, n) for n in range(6)]
+
+    assert delays[0] == poller.POLL_IDLE_INTERVAL
+    assert delays == sorted(delays)
+    assert delays[-1] == poller.POLL_IDLE_MAX_INTERVAL
+
+
+def test_poll_writes_snapshot_read_by_view(the_poller, fake_spotify, clock):
+    """Test that the view can serve from the poller's snapshot."""
+    fake_spotify.playing["uid"] = playing(60000)
+    the_poller.add("uid")
+    the_poller.poll_due()
+
+    clock.now += 10
+    data = snapshots.get_fresh_now_playing("uid", clock.now)
+
+    assert data["item"]["name"] == "Test Song"
+    assert data["progress_ms"] == 70000
+
+
+def test_snapshot_is_fresh_until_the_next_poll(the_poller, fake_spotify, clock):
+    """Test that badges go back to Spotify once the poller is overdue."""
+    the_poller.add("uid")
+    the_poller.poll_due()
+
+    assert snapshots.get_fresh_now_playing("uid", clock.now) == {}
+
+    clock.now += poller.POLL_IDLE_INTERVAL + snapshots.SNAPSHOT_GRACE
+    assert snapshots.get_fresh_now_playing("uid", clock.now) is None
+
+    snapshots.set_snapshot("index", snapshots.make_snapshot(playing(0), clock.now))
+    assert snapshots.get_fresh_now_playing("index", clock.now) is None
+
+
+def test_schedule_follows_playback(the_poller, fake_spotify, clock):
+    """Test that the poller only calls Spotify when a poll is due."""
+    fake_spotify.playing["uid"] = playing(0)
+    the_poller.add("uid")
+
+    the_poller.poll_due()
+    the_poller.poll_due()
+    assert fake_spotify.calls == 1
+
+    clock.now += poller.POLL_PLAYING_INTERVAL
+    assert the_poller.poll_due() == ["uid"]
+    assert fake_spotify.calls == 2
+
+
+def test_finished_track_is_not_served(the_poller, fake_spotify, clock):
+    """Test that a snapshot past the end of its track is ignored."""
+    fake_spotify.playing["uid"] = playing(179000)
+    the_poller.add("uid")
+    the_poller.poll_due()
+
+    clock.now += 5
+    assert snapshots.get_fresh_now_playing("uid", clock.now) is None
+
+
+def test_revoked_user_is_dropped(fake_spotify, store, clock):
+    """Test that users with revoked tokens stop being polled."""
+    with patch("util.poller.get_access_token", side_effect=InvalidTokenError):
+        the_poller = poller.Poller(clock=clock, get_now_playing=fake_spotify)
+        the_poller.add("uid")
+        the_poller.poll_due()
+
+    assert "uid" not in the_poller
+    assert fake_spotify.calls == 0
+
+
+def test_discover_adds_connected_users(the_poller):
+    """Test that every Firestore user gets scheduled."""
+    db = MagicMock()
+    db.collection.return_value.stream.return_value = [MagicMock(id="a"), MagicMock(id="b")]
+
+    with patch("util.poller.get_firestore_db", return_value=db):
+        the_poller.discover()
+
+    assert "a" in the_poller and "b" in the_poller
@@ -23,3 +23,85 @@ def test_profanity_check_profane_text():
     # The exact censoring depends on the library, but should be different
     assert result != "fuck"
     assert "*" in result  # Should contain censoring characters
+
+
+NAMES = [
+    "Hello World",
+    "Fuck Tha Police",
+    "Bitches Ain't Shit",
+    "Shitsville",
+    "Classic",
+    "Assassin's Creed",
+    "S.O.B.",
+    "Mr. Brightside",
+    "ЗАВТРА",
+    "Señorita (feat. A$AP Rocky)",
+    "motherfucker_remix",
+    "FUCKS GIVEN",
+    "Scunthorpe",
+]
+
+
+def get_words():
+
+    from util.profanity import RE_ESCAPED_CHAR, get_filter
+
+    return [RE_ESCAPED_CHAR.sub(r"\1", word) for word in get_filter().get_profane_words()]
+
+
+def test_profanity_check_matches_profanityfilter_on_names():
+    """Test that profanity_check gives the same output as ProfanityFilter.censor."""
+    from util.profanity import get_filter, profanity_check
+
+    for name in NAMES:
+        assert profanity_check(name) == get_filter().censor(name), name
+
+
+def test_profanity_check_matches_profanityfilter_on_wordlist():
+    """Test parity on every listed word, in different cases and surroundings."""
+    from util.profanity import get_filter, get_matcher
+
+    words = get_words()
+    texts = [
+        " ".join(words),
+        " ".join(word.upper() for word in words),
+        "-".join(words),
+        "".join(words),
+        " ".join("x" + word + "x" for word in words),
+        " ".join(word + "_" for word in words),
+    ]
+
+    for text in texts:
+        assert get_matcher().censor(text) == get_filter().censor(text)
+
+
+def test_profanity_matcher_prefers_longer_overlapping_word():
+    """Test that a longer word is censored whole when a shorter one overlaps it."""
+    from util.profanity import ProfanityMatcher
+
+    matcher = ProfanityMatcher([r"ab\-", r"\-cde"])
+
+    assert matcher.censor("ab-cde") == "ab****"
+    assert matcher.censor("ab- -cde") == "*** ****"
+
+
+def test_profanity_matcher_word_boundaries():
+    """Test that word boundaries only apply on word-character sides of a word."""
+    from util.profanity import ProfanityMatcher
+
+    matcher = ProfanityMatcher(["bad", r"@\$\$"])
+
+    assert matcher.censor("bad, Bad!") == "***, ***!"
+    assert matcher.censor("badge") == "badge"
+    assert matcher.censor("a@$$hole") == "a***hole"
+
+
+def test_profanity_check_is_cached():
+    """Test that repeated names are served from the LRU."""
+    from util.profanity import profanity_check
+
+    profanity_check.cache_clear()
+    profanity_check("Repeated Song")
+    profanity_check("Repeated Song")
+
+    assert profanity_check.cache_info().hits == 1
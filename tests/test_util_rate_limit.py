@@ -0,0 +1,186 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.rate_limit import FileRateState, RateGovernor
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+BUDGETS = {
+    "global": (1.0, 4),
+    "now_playing": (1.0, 4),
+    "recently_played": (1.0, 4),
+}
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_bucket_defers_and_refills(clock):
+    """Test that calls over budget are deferred until tokens refill."""
+    governor = RateGovernor(clock=clock, budgets=BUDGETS, reserve=0)
+
+    assert [governor.acquire("now_playing") for _ in range(5)] == [True] * 4 + [False]
+
+    clock.now += 1
+    assert governor.acquire("now_playing") is True
+    assert governor.get_metrics() == {"allowed": 5, "deferred": 1, "throttled": 0, "waited": 0}
+
+
+def test_short_wait_for_a_token(clock):
+    """Test that a call waits for a token due within max_wait instead of being deferred."""
+    def sleep(seconds):
+        clock.now += seconds
+
+    budgets = {"global": (10.0, 1), "now_playing": (10.0, 1)}
+    governor = RateGovernor(clock=clock, budgets=budgets, reserve=0, max_wait=0.5, sleep=sleep)
+    start = clock.now
+
+    assert governor.acquire("now_playing") is True
+    assert governor.acquire("now_playing") is True
+    assert clock.now - start == pytest.approx(0.1)
+    assert governor.get_metrics()["waited"] == 1
+
+    governor.backoff("3")
+    assert governor.acquire("now_playing") is False
+    assert governor.get_metrics()["deferred"] == 1
+
+
+def test_now_playing_has_priority(clock):
+    """Test that recently-played leaves the reserve to now-playing."""
+    governor = RateGovernor(clock=clock, budgets=BUDGETS, reserve=2)
+
+    assert governor.acquire("recently_played") is True
+    assert governor.acquire("recently_played") is True
+    assert governor.acquire("recently_played") is False
+    assert governor.acquire("now_playing") is True
+    assert governor.acquire("now_playing") is True
+
+
+def test_retry_after_blocks_every_endpoint(clock):
+    """Test that a 429 pauses all calls for Retry-After seconds."""
+    governor = RateGovernor(clock=clock, budgets=BUDGETS, reserve=0)
+
+    governor.backoff("3")
+    assert governor.acquire("now_playing") is False
+    assert governor.blocked_for() == 3
+
+    clock.now += 3
+    assert governor.acquire("now_playing") is True
+    assert governor.get_metrics()["throttled"] == 1
+
+
+def test_invalid_retry_after_uses_default(clock):
+    """Test that a missing Retry-After still backs off."""
+    governor = RateGovernor(clock=clock, budgets=BUDGETS)
+
+    governor.backoff(None)
+    assert governor.blocked_for() > 0
+
+
+def test_file_state_is_shared(tmp_path, clock):
+    """Test that two governors on one file share a budget."""
+    path = str(tmp_path / "rate.json")
+    worker_a = RateGovernor(FileRateState(path), clock=clock, budgets=BUDGETS, reserve=0)
+    worker_b = RateGovernor(FileRateState(path), clock=clock, budgets=BUDGETS, reserve=0)
+
+    assert [worker_a.acquire("now_playing") for _ in range(2)] == [True, True]
+    assert [worker_b.acquire("now_playing") for _ in range(3)] == [True, True, False]
+
+    worker_a.backoff("5")
+    assert worker_b.blocked_for() == 5
+
+
+def test_spotify_429_raises_and_backs_off(clock):
+    """Test that util.spotify honours 429 Retry-After."""
+    from util import spotify
+
+    governor = RateGovernor(clock=clock, budgets=BUDGETS, reserve=0)
+    response = MagicMock(status_code=429, headers={"Retry-After": "7"})
+
+    with patch("util.spotify.governor", governor), \
+         patch("util.session.request", return_value=response) as mock_request:
+        with pytest.raises(spotify.RateLimitedError):
+            spotify.get_now_playing("token")
+        with pytest.raises(spotify.RateLimitedError):
+            spotify.get_now_playing("token")
+
+    mock_request.assert_called_once()
+    assert governor.blocked_for() == 7
+    assert governor.get_metrics()["deferred"] == 1
+
+
+def test_index_serves_stale_snapshot_while_throttled():
+    """Test that the badge falls back to the last good payload, marked stale."""
+    import httpx
+
+    from api.index import app
+    from util import snapshots, spotify_async
+    from util.render_cache import render_cache
+
+    snapshots.set_snapshot_store(snapshots.MemorySharedCache())
+    render_cache.clear()
+    app.config.update({"TESTING": True})
+
+    now_playing = {
+        "progress_ms": 1000,
+        "item": {"id": "t", "name": "Last Song", "artists": [{"name": "Artist"}], "duration_ms": 180000},
+    }
+    token = MagicMock(status_code=200)
+    token.json.return_value = {"access_token": "token"}
+    responses = [httpx.Response(200, json=now_playing), httpx.Response(429, headers={"Retry-After": "1"})]
+
+    def make_client():
+        return httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+
+    # Every request goes to Spotify, not to the stale-while-revalidate cache
+    spotify_async._clients.clear()
+    try:
+        with app.test_client() as client, patch("util.swr.swr_cache.enabled", False), \
+             patch("util.spotify_async.make_client", make_client), \
+             patch("util.session.request", return_value=token):
+            assert b"Last Song" in client.get("/api/spotify").data
+
+            with patch("util.spotify_async.governor", RateGovernor()):
+                response = client.get("/api/spotify")
+
+        assert b"Last Song" in response.data
+        assert "Stale" in response.headers["Warning"]
+        assert not responses
+    finally:
+        spotify_async._clients.clear()
+        snapshots.set_snapshot_store(None)
+
+
+def test_badge_serves_stale_snapshot_while_throttled():
+    """Test that badge.get_song falls back to the uid's last good payload."""
+    from util import badge, snapshots, spotify
+
+    now_playing = {"progress_ms": 1000, "item": {"id": "t", "name": "Last Song", "duration_ms": 180000}}
+    snapshots.set_snapshot_store(snapshots.MemorySharedCache())
+    try:
+        with patch("util.spotify.get_now_playing", return_value=now_playing):
+            badge.get_song("token", uid="uid")
+        with patch("util.spotify.get_now_playing", side_effect=spotify.RateLimitedError("now_playing")):
+            item, is_now_playing, progress_ms = badge.get_song("token", uid="uid")
+            with pytest.raises(spotify.RateLimitedError):
+                badge.get_song("token", uid="other")
+    finally:
+        snapshots.set_snapshot_store(None)
+
+    assert item["name"] == "Last Song"
+    assert is_now_playing is True
+    assert progress_ms >= 1000
@@ -0,0 +1,108 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import recent_history
+from util.spotify import RateLimitedError
+from util.token_cache import MemorySharedCache
+
+
+def play(track_id, minute):
+    return {"track": {"id": track_id, "name": f"Song {track_id}"}, "played_at": f"2024-05-01T10:{minute:02d}:00.000Z"}
+
+
+@pytest.fixture(autouse=True)
+def store():
+    store = MemorySharedCache(clock=lambda: 1000)
+    recent_history.set_history_store(store)
+    yield store
+    recent_history.set_history_store(None)
+
+
+@pytest.fixture
+def mock_recently_play():
+    with patch("util.spotify.get_recently_play") as mock:
+        mock.return_value = {"items": [play("a", 2), play("b", 1)], "cursors": {"after": "1714557720000"}}
+        yield mock
+
+
+def test_buffer_is_served_within_ttl(mock_recently_play):
+    """Test that the stored buffer answers until the TTL passes."""
+    items = recent_history.get_recent_items("uid", "token", now=1000)
+    assert recent_history.get_recent_items("uid", "token", now=1000 + recent_history.RECENT_HISTORY_TTL - 1) == items
+
+    mock_recently_play.assert_called_once_with("token", recent_history.RECENT_HISTORY_SIZE, after=None)
+    assert [item["track"]["id"] for item in items] == ["a", "b"]
+
+
+def test_refresh_uses_after_cursor_and_merges(mock_recently_play):
+    """Test that a refresh only asks for newer plays and keeps the buffer newest first."""
+    recent_history.get_recent_items("uid", "token", now=1000)
+    mock_recently_play.return_value = {"items": [play("c", 3)], "cursors": {"after": "1714557780000"}}
+
+    items = recent_history.get_recent_items("uid", "token", now=1000 + recent_history.RECENT_HISTORY_TTL)
+
+    mock_recently_play.assert_called_with("token", recent_history.RECENT_HISTORY_SIZE, after="1714557720000")
+    assert [item["track"]["id"] for item in items] == ["c", "a", "b"]
+    assert recent_history.get_entry("uid")["cursor"] == "1714557780000"
+
+
+def test_ring_buffer_keeps_newest(mock_recently_play):
+    """Test that the buffer holds at most RECENT_HISTORY_SIZE plays, dropping the oldest."""
+    old = [play(f"old{i}", i) for i in range(10)]
+    new = [play(f"new{i}", 20 + i) for i in range(3)]
+
+    merged = recent_history.merge_items(new, old, size=10)
+
+    assert len(merged) == 10
+    assert merged[0]["track"]["id"] == "new2"
+    assert "old0" not in [item["track"]["id"] for item in merged]
+    assert recent_history.merge_items(old[:2], old[:2]) == [old[1], old[0]]
+
+
+def test_full_page_of_new_plays_refetches_whole_buffer(mock_recently_play):
+    """Test that a full page after the cursor falls back to a plain fetch."""
+    recent_history.get_recent_items("uid", "token", now=1000)
+    full_page = {"items": [play(f"n{i}", 30 + i) for i in range(recent_history.RECENT_HISTORY_SIZE)]}
+    mock_recently_play.side_effect = [full_page, {"items": [play("latest", 59)]}]
+
+    items = recent_history.get_recent_items("uid", "token", now=1000 + recent_history.RECENT_HISTORY_TTL)
+
+    assert [item["track"]["id"] for item in items] == ["latest"]
+
+
+def test_throttled_refresh_serves_stored_buffer(mock_recently_play):
+    """Test that the stored buffer is served at any age while Spotify throttles us."""
+    items = recent_history.get_recent_items("uid", "token", now=1000)
+    mock_recently_play.side_effect = RateLimitedError("recently_played")
+
+    assert recent_history.get_recent_items("uid", "token", now=10 ** 6) == items
+    with pytest.raises(RateLimitedError):
+        recent_history.get_recent_items("other", "token", now=1000)
+
+
+def test_badge_picks_randomly_from_buffer(mock_recently_play):
+    """Test that badge.get_song keeps the random pick, now from the stored buffer."""
+    from util import badge
+
+    with patch("util.spotify.get_now_playing", return_value={}), patch("random.randint", return_value=1) as mock_randint:
+        item, is_now_playing, _ = badge.get_song("token", uid="uid")
+        badge.get_song("token", uid="uid")
+
+    mock_randint.assert_called_with(0, 1)
+    assert item["id"] == "b"
+    assert item["currently_playing_type"] == "track"
+    assert is_now_playing is False
+    mock_recently_play.assert_called_once()
+
+
+def test_recently_play_url():
+    """Test the limit and after query parameters."""
+    from util import spotify
+
+    assert spotify.get_recently_play_url() == spotify.SPOTIFY_URL_RECENTLY_PLAY
+    assert spotify.get_recently_play_url(50, "1714557720000").endswith("?limit=50&after=1714557720000")
@@ -0,0 +1,198 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.refresh_scheduler import RefreshScheduler
+from util.token_cache import make_token_cache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_scheduler(clock, refresh=None, **kwargs):
+    options = dict(enabled=True, lead=120, jitter=0, active_window=600, clock=clock)
+    options.update(kwargs)
+    return RefreshScheduler(refresh or MagicMock(return_value=None), **options)
+
+
+def test_uid_is_due_lead_seconds_before_expiry(clock):
+    """Test that a seen uid is refreshed lead seconds before its token expires."""
+    scheduler = make_scheduler(clock, active_window=10 ** 6)
+    with patch.object(scheduler, "start"):
+        scheduler.touch("uid", {"expired_ts": clock.now + 3600})
+
+    clock.now += 3600 - 121
+    assert scheduler.pop_due() == []
+
+    clock.now += 1
+    assert scheduler.pop_due() == [("uid", 1000 + 3600)]
+
+
+def test_jitter_spreads_refreshes(clock):
+    """Test that tokens expiring together are refreshed at different times."""
+    scheduler = make_scheduler(clock, jitter=60)
+    with patch.object(scheduler, "start"):
+        for i in range(20):
+            scheduler.touch(f"uid{i}", {"expired_ts": clock.now + 3600})
+
+    due = {when for when, _ in scheduler._heap}
+    assert len(due) > 1
+    assert all(clock.now + 3600 - 180 <= when <= clock.now + 3600 - 120 for when in due)
+
+
+def test_idle_uid_is_dropped(clock):
+    """Test that uids not seen within the active window are not refreshed."""
+    refresh = MagicMock()
+    scheduler = make_scheduler(clock, refresh)
+    with patch.object(scheduler, "start"):
+        scheduler.touch("uid", {"expired_ts": clock.now + 3600})
+
+    clock.now += 3600
+    assert scheduler.run_once() == []
+    refresh.assert_not_called()
+    assert scheduler.get_stats()["dropped"] == 1
+
+
+def test_refresh_reschedules_next_expiry(clock):
+    """Test that a refreshed token is scheduled again for its new expiry."""
+    refresh = MagicMock(side_effect=lambda uid, expired_ts: {"expired_ts": expired_ts + 3600})
+    scheduler = make_scheduler(clock, refresh, active_window=10 ** 6)
+    with patch.object(scheduler, "start"):
+        scheduler.touch("uid", {"expired_ts": clock.now + 3600})
+
+    clock.now += 3600 - 120
+    assert scheduler.run_once() == ["uid"]
+    refresh.assert_called_once_with("uid", 1000 + 3600)
+    assert scheduler._due["uid"][1] == 1000 + 7200
+    assert scheduler.get_stats()["refreshed"] == 1
+
+
+def test_failed_refresh_is_retried_later(clock):
+    """Test that a failing refresh is counted and retried after a delay, not on the next touch."""
+    refresh = MagicMock(side_effect=RuntimeError("boom"))
+    scheduler = make_scheduler(clock, refresh, retry=15)
+    with patch.object(scheduler, "start"):
+        scheduler.touch("uid", {"expired_ts": clock.now + 100})
+        assert scheduler.run_once() == ["uid"]
+        scheduler.touch("uid", {"expired_ts": clock.now + 100})
+
+    assert scheduler.get_stats()["failed"] == 1
+    assert scheduler.run_once() == []
+
+    clock.now += 15
+    assert scheduler.run_once() == ["uid"]
+    assert refresh.call_count == 2
+
+
+def test_disabled_scheduler_only_counts(clock):
+    """Test that a disabled scheduler records the hit rate but schedules nothing."""
+    scheduler = make_scheduler(clock, enabled=False)
+    scheduler.touch("uid", {"expired_ts": clock.now + 3600})
+    scheduler.record(True)
+    scheduler.record(False)
+
+    assert "uid" not in scheduler
+    assert scheduler.get_stats()["hit_rate"] == 0.5
+
+
+class TestRefreshAhead:
+    @pytest.fixture(autouse=True)
+    def token_cache(self):
+        from util import negative_cache, token_cache
+        from util.token_cache import MemorySharedCache
+
+        cache = make_token_cache("memory")
+        token_cache.set_token_cache(cache)
+        negative_cache.set_negative_store(MemorySharedCache())
+        yield cache
+        token_cache.set_token_cache(None)
+        negative_cache.set_negative_store(None)
+
+    @pytest.fixture
+    def db(self):
+        from util.firestore_batch import BatchReader, WriteBehindQueue
+        from util.firestore_fake import FakeFirestore
+
+        db = FakeFirestore()
+        with patch("util.firestore_batch.reader", BatchReader(lambda: db, window=0)), \
+             patch("util.firestore_batch.writer", WriteBehindQueue(lambda: db)):
+            yield db
+
+    @patch("util.spotify.refresh_token")
+    def test_cached_token_is_refreshed_ahead(self, mock_refresh, db, token_cache):
+        """Test that refresh_ahead replaces a still-valid cached token."""
+        import time
+        from util.access_token import get_access_token, refresh_ahead
+
+        expired_ts = int(time.time()) + 100
+        db.collection("users").document("uid").set(
+            {"access_token": "old", "refresh_token": "refresh", "expired_ts": expired_ts}
+        )
+        mock_refresh.return_value = {"access_token": "new", "expires_in": 3600}
+
+        assert get_access_token("uid") == "old"
+        assert refresh_ahead("uid", expired_ts)["access_token"] == "new"
+        assert get_access_token("uid") == "new"
+        mock_refresh.assert_called_once_with("refresh")
+
+        # Already refreshed by someone else: nothing to do
+        assert refresh_ahead("uid", expired_ts)["access_token"] == "new"
+        mock_refresh.assert_called_once()
+
+    @patch("util.spotify.refresh_token")
+    def test_revoked_token_is_unscheduled(self, mock_refresh, db):
+        """Test that a rejected refresh ahead is not retried and a revoked uid is skipped."""
+        import time
+        from util import negative_cache
+        from util.access_token import get_access_token, refresh_ahead
+
+        expired_ts = int(time.time()) + 100
+        db.collection("users").document("uid").set(
+            {"access_token": "old", "refresh_token": "revoked", "expired_ts": expired_ts}
+        )
+        mock_refresh.return_value = {"error": "invalid_grant"}
+
+        clock = FakeClock(expired_ts - 200)
+        scheduler = make_scheduler(clock, refresh_ahead)
+        with patch("util.access_token.refresh_scheduler", scheduler), patch.object(scheduler, "start"):
+            assert get_access_token("uid") == "old"
+            clock.now = expired_ts - 100
+            scheduler.run_once()
+
+        assert "uid" not in scheduler
+        assert scheduler.get_stats()["failed"] == 0
+        assert negative_cache.get_invalid("uid")["error"] == "invalid_grant"
+
+        # Already known to be revoked: no call to Spotify at all
+        assert refresh_ahead("uid", expired_ts) is None
+        mock_refresh.assert_called_once()
+
+    @patch("util.spotify.refresh_token")
+    def test_hit_rate_counts_inline_refreshes(self, mock_refresh, db):
+        """Test that only lookups refreshing in the request path lower the hit rate."""
+        from util.access_token import get_access_token
+
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "refresh"})
+        mock_refresh.return_value = {"access_token": "new", "expires_in": 3600}
+
+        scheduler = make_scheduler(FakeClock(), enabled=False)
+        with patch("util.access_token.refresh_scheduler", scheduler):
+            for _ in range(4):
+                get_access_token("uid")
+
+        assert scheduler.get_stats()["inline_refreshes"] == 1
+        assert scheduler.get_stats()["hit_rate"] == 0.75
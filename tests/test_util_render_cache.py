@@ -0,0 +1,69 @@
+import pytest
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.render_cache import RenderCache, make_etag, make_render_key
+
+
+ITEM = {"id": "track123", "name": "Test Song"}
+
+
+def test_key_covers_track_progress_and_options():
+    """Test which inputs produce a different render key."""
+    options = {"theme": "default", "bar_color": "53b14f"}
+    key = make_render_key("uid", ITEM, 1000, options)
+
+    assert key == make_render_key("uid", ITEM, 2000, dict(options))
+    assert key != make_render_key("uid", ITEM, 9000, options)
+    assert key != make_render_key("other", ITEM, 1000, options)
+    assert key != make_render_key("uid", {"id": "track456"}, 1000, options)
+    assert key != make_render_key("uid", ITEM, 1000, dict(options, theme="compact"))
+    assert key != make_render_key("uid", ITEM, 1000, dict(options, interchange="true"))
+    assert key != make_render_key("uid", None, None, options)
+
+
+def test_get_or_render_only_renders_once():
+    """Test that a hit returns stored bytes without rendering again."""
+    now = [1000.0]
+    cache = RenderCache(clock=lambda: now[0])
+    calls = []
+
+    def render():
+        calls.append(1)
+        return "<svg></svg>"
+
+    first = cache.get_or_render("key", render)
+    now[0] += 30
+    second = cache.get_or_render("key", render)
+
+    # The render time is kept, so Last-Modified is the same on every hit
+    assert first == second == (b"<svg></svg>", make_etag(b"<svg></svg>"), 1000.0)
+    assert len(calls) == 1
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_eviction_by_size():
+    """Test that the least recently used entries are evicted past max_bytes."""
+    cache = RenderCache(max_bytes=25)
+    cache.set("a", b"x" * 10)
+    cache.set("b", b"x" * 10)
+    cache.get("a")
+    cache.set("c", b"x" * 10)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.size == 20
+
+
+def test_oversized_body_is_not_stored():
+    """Test that a body larger than the whole cache is returned but not kept."""
+    cache = RenderCache(max_bytes=5)
+    body, etag, _ = cache.set("a", b"x" * 10)
+
+    assert body == b"x" * 10
+    assert etag.startswith('"') and etag.endswith('"')
+    assert cache.get("a") is None
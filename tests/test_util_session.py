@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """Start a local keep-alive HTTP server."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    """Give every test its own session and stats."""
+    from util import session
+
+    session.reset_session()
+    yield
+    session.reset_session()
+
+
+def test_connections_are_reused(server):
+    """Test that sequential requests share one keep-alive connection."""
+    from util import session
+
+    for _ in range(5):
+        response = session.get(server + "/v1/me")
+        assert response.json() == {"ok": True}
+
+    stats = session.get_stats()
+    assert stats["requests"] == 5
+    assert stats["connections"] == 1
+    assert stats["reuse_rate"] == pytest.approx(0.8)
+    assert stats["hosts"]["127.0.0.1"]["requests"] == 5
+
+
+def test_session_is_per_process():
+    """Test that a forked process does not reuse the parent's session."""
+    from util import session
+
+    first = session.get_session()
+    assert session.get_session() is first
+
+    with patch("util.session.os.getpid", return_value=-1):
+        assert session.get_session() is not first
+
+
+def test_default_timeout_is_applied():
+    """Test that requests get the configured timeout unless one is given."""
+    from util import session
+
+    mock_session = MagicMock()
+    with patch("util.session.get_session", return_value=mock_session):
+        session.get("https://api.spotify.com/v1/me")
+        _, kwargs = mock_session.request.call_args
+        assert kwargs["timeout"] == (session.HTTP_CONNECT_TIMEOUT, session.HTTP_READ_TIMEOUT)
+
+        session.post("https://accounts.spotify.com/api/token", timeout=2)
+        _, kwargs = mock_session.request.call_args
+        assert kwargs["timeout"] == 2
+
+
+def test_empty_stats():
+    """Test stats before any request has been made."""
+    from util import session
+
+    stats = session.get_stats()
+    assert stats["requests"] == 0
+    assert stats["reuse_rate"] == 0.0
+    assert stats["pool_waits"] == 0
+
+
+def test_spotify_calls_use_shared_session():
+    """Test that util.spotify goes through the pooled session."""
+    from util import spotify
+
+    mock_response = MagicMock(status_code=204)
+    with patch("util.session.request", return_value=mock_response) as mock_request:
+        assert spotify.get_now_playing("token") == {}
+        mock_request.assert_called_once()
+        assert mock_request.call_args[0][1] == spotify.SPOTIFY_URL_NOW_PLAYING
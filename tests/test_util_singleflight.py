@@ -0,0 +1,105 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import threading
+import time
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.singleflight import FileLock, SingleFlight
+
+
+def run_concurrently(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_calls_are_coalesced():
+    """Test that concurrent callers for one key share a single call."""
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "token"
+
+    run_concurrently(lambda: results.append(flight.do("uid", slow)), 8)
+
+    assert len(calls) == 1
+    assert results == ["token"] * 8
+    assert flight.get_stats() == {"issued": 1, "coalesced": 7}
+
+
+def test_errors_are_shared_and_not_cached():
+    """Test that waiters see the leader's error and the next call retries."""
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("refresh failed")
+
+    with pytest.raises(ValueError):
+        flight.do("uid", fail)
+
+    assert flight.do("uid", lambda: "ok") == "ok"
+    assert flight.get_stats()["issued"] == 2
+
+
+def test_file_lock_serialises_holders(tmp_path):
+    """Test that the file lock admits one holder at a time."""
+    lock = FileLock(str(tmp_path))
+    active = []
+    overlaps = []
+
+    def hold():
+        with lock.hold("refresh:uid"):
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(1)
+            time.sleep(0.02)
+            active.pop()
+
+    run_concurrently(hold, 4)
+
+    assert overlaps == []
+
+
+def test_get_access_token_refreshes_once_per_burst():
+    """Test that a burst of cold requests for one uid issues one refresh."""
+    from util import access_token, token_cache
+
+    token_cache.set_token_cache(token_cache.make_token_cache("local"))
+    access_token.refresh_flight.reset_stats()
+
+    from util.firestore_batch import BatchReader, WriteBehindQueue
+    from util.firestore_fake import FakeFirestore
+
+    db = FakeFirestore()
+    db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "refresh"})
+    writer = WriteBehindQueue(lambda: db)
+
+    def slow_refresh(refresh_token):
+        time.sleep(0.1)
+        return {"access_token": "new", "expires_in": 3600}
+
+    results = []
+    try:
+        with patch("util.firestore_batch.reader", BatchReader(lambda: db)), \
+             patch("util.firestore_batch.writer", writer), \
+             patch("util.spotify.refresh_token", side_effect=slow_refresh) as mock_refresh:
+            run_concurrently(lambda: results.append(access_token.get_access_token("uid")), 10)
+
+        assert results == ["new"] * 10
+        mock_refresh.assert_called_once()
+        assert writer.updates == 1
+        stats = access_token.get_refresh_stats()
+        assert stats["issued"] == 1
+        assert stats["coalesced"] > 0
+    finally:
+        token_cache.set_token_cache(None)
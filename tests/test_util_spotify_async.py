@@ -0,0 +1,197 @@
+import pytest
+from unittest.mock import patch
+import sys
+import os
+import asyncio
+import time
+
+import httpx
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import recent_history, snapshots, spotify_async
+from util.token_cache import MemorySharedCache
+
+TRACK = {
+    "name": "Test Song",
+    "duration_ms": 180000,
+    "album": {"images": [{"url": "https://i.scdn.co/image/big"}, {"url": "https://i.scdn.co/image/mid"}]},
+}
+
+RECENTLY_PLAYED = {"items": [{"track": dict(TRACK, name="Old Song")}]}
+
+
+class FakeSpotify:
+    def __init__(self, playing=True, delay=0.1):
+        self.playing = playing
+        self.delay = delay
+        self.paths = []
+
+    async def __call__(self, request):
+        self.paths.append(request.url.path)
+        await asyncio.sleep(self.delay)
+
+        if request.url.path.endswith("currently-playing"):
+            if not self.playing:
+                return httpx.Response(204)
+            return httpx.Response(200, json={
+                "item": dict(TRACK), "currently_playing_type": "track", "progress_ms": 1000,
+            })
+        if request.url.path.endswith("recently-played"):
+            return httpx.Response(200, json=RECENTLY_PLAYED)
+        return httpx.Response(200, content=b"cover-bytes")
+
+
+@pytest.fixture
+def fake_spotify():
+    fake = FakeSpotify()
+    spotify_async._clients.clear()
+    spotify_async.offline_history._ratios.clear()
+    recent_history.set_history_store(MemorySharedCache())
+    snapshots.set_snapshot_store(MemorySharedCache())
+    with patch("util.spotify_async.make_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(fake))):
+        yield fake
+    spotify_async._clients.clear()
+    recent_history.set_history_store(None)
+    snapshots.set_snapshot_store(None)
+
+
+def test_now_playing(fake_spotify):
+    """Test that a playing user needs a single upstream call."""
+    item, is_now_playing, progress_ms, duration_ms = spotify_async.run_sync(
+        spotify_async.get_song_info("uid", "token"))
+
+    assert item["name"] == "Test Song"
+    assert item["currently_playing_type"] == "track"
+    assert is_now_playing is True
+    assert (progress_ms, duration_ms) == (1000, 180000)
+    assert len(fake_spotify.paths) == 1
+
+
+def test_offline_user_falls_back_to_recently_played(fake_spotify):
+    """Test the sequential fallback for a user with no offline history."""
+    fake_spotify.playing = False
+
+    item, is_now_playing, _, _ = spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+
+    assert item["name"] == "Old Song"
+    assert is_now_playing is False
+    assert fake_spotify.paths[0].endswith("currently-playing")
+
+
+def test_usually_offline_user_is_fetched_concurrently(fake_spotify):
+    """Test that both calls overlap for users that are usually offline."""
+    fake_spotify.playing = False
+    for _ in range(10):
+        spotify_async.offline_history.record("uid", True)
+
+    start = time.monotonic()
+    item, _, _, _ = spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+    elapsed = time.monotonic() - start
+
+    assert item["name"] == "Old Song"
+    assert len(fake_spotify.paths) == 2
+    assert elapsed < 2 * fake_spotify.delay
+
+
+def test_stored_history_skips_recently_played(fake_spotify):
+    """Test that a fresh recently-played buffer is used instead of another call."""
+    fake_spotify.playing = False
+
+    spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+    item, _, _, _ = spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+
+    assert item["name"] == "Old Song"
+    assert sum(path.endswith("recently-played") for path in fake_spotify.paths) == 1
+
+
+def test_show_offline_skips_recently_played(fake_spotify):
+    """Test that show_offline never asks for recently played tracks."""
+    fake_spotify.playing = False
+
+    result = spotify_async.run_sync(spotify_async.get_song_info("uid", "token", show_offline=True))
+
+    assert result == (None, False, None, None)
+    assert len(fake_spotify.paths) == 1
+
+
+def test_badge_data_overlaps_cover_and_prepare(fake_spotify):
+    """Test that template preparation runs on a worker thread while the cover downloads."""
+    prepared = []
+
+    def prepare(item, is_now_playing, progress_ms):
+        prepared.append((item["name"], progress_ms))
+        time.sleep(fake_spotify.delay)
+        return "ready"
+
+    start = time.monotonic()
+    data = spotify_async.run_sync(spotify_async.get_badge_data("uid", "token", prepare=prepare))
+    elapsed = time.monotonic() - start
+
+    assert data["img"] == b"cover-bytes"
+    assert data["prepared"] == "ready"
+    assert prepared == [("Test Song", 1000)]
+    assert fake_spotify.paths[-1] == "/image/mid"
+    # Now playing, then the cover and prepare side by side
+    assert elapsed < 2.5 * fake_spotify.delay
+
+
+def test_badge_data_uses_blocking_cover_loader(fake_spotify):
+    """Test that a cover loader such as the cover cache replaces the plain download."""
+    data = spotify_async.run_sync(spotify_async.get_badge_data(
+        "uid", "token", load_cover=lambda url: url.encode()))
+
+    assert data["img"] == b"https://i.scdn.co/image/mid"
+    assert len(fake_spotify.paths) == 1
+
+
+def test_item_without_track_is_not_playing(fake_spotify):
+    """Test that an ad (no item) falls back to recently played instead of failing."""
+    with patch("util.spotify_async.get_now_playing", return_value={"item": None, "is_playing": True}):
+        item, is_now_playing, _, _ = spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+
+    assert item["name"] == "Old Song"
+    assert is_now_playing is False
+
+
+def test_cover_image_false_skips_download(fake_spotify):
+    """Test that no cover is fetched when cover_image is off."""
+    data = spotify_async.run_sync(spotify_async.get_badge_data("uid", "token", cover_image=False))
+
+    assert data["img"] is None
+    assert len(fake_spotify.paths) == 1
+
+
+def test_throttled_offline_user_is_served_from_stored_history(fake_spotify):
+    """Test that a throttled now-playing call falls back to the recently-played buffer."""
+    from util.spotify import RateLimitedError
+
+    fake_spotify.playing = False
+    spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+
+    with patch("util.spotify_async.get_now_playing", side_effect=RateLimitedError("now_playing")):
+        item, is_now_playing, _, _ = spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+        with pytest.raises(RateLimitedError):
+            spotify_async.run_sync(spotify_async.get_song_info("other", "token"))
+
+    assert item["name"] == "Old Song"
+    assert is_now_playing is False
+
+
+def test_throttled_recently_played_serves_stored_history(fake_spotify):
+    """Test that the async client keeps the stored buffer when a refresh is throttled."""
+    from util.spotify import RateLimitedError
+
+    fake_spotify.playing = False
+    spotify_async.run_sync(spotify_async.get_song_info("uid", "token"))
+    entry = recent_history.get_entry("uid")
+    stale = recent_history.get_stats()["stale"]
+
+    with patch("util.spotify_async.get_recently_play", side_effect=RateLimitedError("recently_played")):
+        items = spotify_async.run_sync(spotify_async.get_recent_items("uid", "token", entry))
+        with pytest.raises(RateLimitedError):
+            spotify_async.run_sync(spotify_async.get_recent_items("other", "token", None))
+
+    assert items == entry["items"]
+    assert recent_history.get_stats()["stale"] == stale + 1
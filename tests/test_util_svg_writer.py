@@ -0,0 +1,109 @@
+import pytest
+from unittest.mock import patch
+import sys
+import os
+from hashlib import sha1
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.render_cache import make_etag
+from util.svg_writer import COVER_PLACEHOLDER, Segments, decompress, splice
+
+
+def test_splice_shares_cover_bytes():
+    """Test that the cover is spliced in without being copied."""
+    cover = b"QUJD" * 1000
+    segments = splice(f'<svg><img src="data:image/jpeg;base64,{COVER_PLACEHOLDER}"/>ñ</svg>', cover)
+
+    assert any(part is cover for part in segments)
+    assert segments.getvalue() == '<svg><img src="data:image/jpeg;base64,'.encode() + cover + '"/>ñ</svg>'.encode()
+    assert len(segments) == len(segments.getvalue())
+
+
+def test_splice_without_cover():
+    """Test that a missing cover leaves the placeholder empty."""
+    assert splice(f"<svg>{COVER_PLACEHOLDER}</svg>").getvalue() == b"<svg></svg>"
+
+
+def test_etag_matches_joined_body():
+    """Test that the segment ETag equals the ETag of the joined bytes."""
+    segments = Segments(("<svg>", b"abc", "</svg>"))
+
+    assert make_etag(segments) == make_etag(segments.getvalue())
+    assert segments.etag() == '"{}"'.format(sha1(b"<svg>abc</svg>").hexdigest())
+
+
+def test_gzip_round_trip_is_memoized():
+    """Test gzip of the segments and that it is computed once."""
+    segments = Segments(["<svg>", "x" * 5000, "</svg>"])
+
+    body = segments.compress("gzip")
+    assert decompress(body, "gzip") == segments.getvalue()
+    assert segments.compress("gzip") is body
+
+    with pytest.raises(ValueError):
+        segments.compress("zstd")
+
+
+@patch("api.index.get_now_playing")
+def test_index_serves_gzip_when_enabled(mock_get_now_playing):
+    """Test content negotiation on the badge response."""
+    from api.index import app
+    from util.render_cache import render_cache
+    from util.swr import swr_cache
+
+    mock_get_now_playing.return_value = None
+    render_cache.clear()
+    swr_cache.clear()
+    app.config.update({"TESTING": True})
+
+    with app.test_client() as client, \
+         patch("util.svg_writer.SVG_COMPRESSION", True), \
+         patch("util.svg_writer.SVG_COMPRESS_MIN_BYTES", 0), \
+         patch("util.svg_writer.has_brotli", return_value=False):
+        plain = client.get("/api/spotify")
+        compressed = client.get("/api/spotify", headers={"Accept-Encoding": "gzip, br"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Content-Length"] == str(len(plain.data))
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Accept-Encoding"
+    assert decompress(compressed.data, "gzip") == plain.data
+
+
+@patch("api.index.get_now_playing")
+def test_index_etag_depends_on_encoding(mock_get_now_playing):
+    """Test that gzip responses get their own ETag and revalidate against it."""
+    from api.index import app
+    from util.render_cache import render_cache
+    from util.swr import swr_cache
+
+    mock_get_now_playing.return_value = {}
+    render_cache.clear()
+    swr_cache.clear()
+    app.config.update({"TESTING": True})
+
+    with app.test_client() as client, \
+         patch("util.svg_writer.SVG_COMPRESSION", True), \
+         patch("util.svg_writer.SVG_COMPRESS_MIN_BYTES", 0), \
+         patch("util.svg_writer.has_brotli", return_value=False):
+        plain = client.get("/api/spotify")
+        compressed = client.get("/api/spotify", headers={"Accept-Encoding": "gzip"})
+        revalidated = client.get("/api/spotify", headers={
+            "Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]})
+        switched = client.get("/api/spotify", headers={"If-None-Match": compressed.headers["ETag"]})
+
+    assert compressed.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == compressed.headers["ETag"]
+    assert switched.status_code == 200
+    assert switched.headers["ETag"] == plain.headers["ETag"]
+
+
+def test_get_etag():
+    """Test that only compressed encodings change the ETag."""
+    from util.svg_writer import get_etag
+
+    assert get_etag('"abc"', None) == '"abc"'
+    assert get_etag('"abc"', "br") == '"abc-br"'
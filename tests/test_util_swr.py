@@ -0,0 +1,105 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import threading
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.swr import SWRCache, make_swr_key
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    cache = SWRCache(fresh_for=5, hard_stale=60, clock=clock, enabled=True)
+    cache.get_executor = lambda: InlineExecutor()
+    return cache
+
+
+def test_fresh_entry_skips_build(cache, clock):
+    """Test that a badge inside the freshness window is served without building."""
+    build = MagicMock(return_value="v1")
+
+    assert cache.get("k", build) == ("v1", 0.0)
+    clock.now += 4
+    assert cache.get("k", build) == ("v1", 4)
+    build.assert_called_once()
+
+
+def test_stale_entry_is_served_and_refreshed(cache, clock):
+    """Test that a stale badge is returned at once while a refresh replaces it."""
+    build = MagicMock(side_effect=["v1", "v2"])
+    cache.get("k", build)
+
+    clock.now += 10
+    assert cache.get("k", build) == ("v1", 10)
+    assert cache.get("k", build) == ("v2", 0)
+    assert cache.get_stats()["refreshes"] == 1
+
+
+def test_hard_stale_entry_waits_for_build(cache, clock):
+    """Test that past the hard-stale limit the request builds the badge itself."""
+    build = MagicMock(side_effect=["v1", "v2"])
+    cache.get("k", build)
+
+    clock.now += 60
+    assert cache.get("k", build) == ("v2", 0.0)
+    assert cache.get_stats()["misses"] == 2
+
+
+def test_failed_refresh_keeps_old_badge(cache, clock):
+    """Test that a failing background refresh leaves the last badge in place."""
+    build = MagicMock(side_effect=["v1", RuntimeError("spotify down"), RuntimeError("spotify down")])
+    cache.get("k", build)
+
+    clock.now += 10
+    assert cache.get("k", build) == ("v1", 10)
+    assert cache.get("k", build) == ("v1", 10)
+    assert cache.get_stats()["refresh_errors"] == 2
+
+
+def test_one_background_refresh_per_key(clock):
+    """Test that concurrent stale hits start a single refresh."""
+    cache = SWRCache(fresh_for=5, hard_stale=60, clock=clock, enabled=True)
+    release = threading.Event()
+    calls = []
+
+    def build():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return len(calls)
+
+    cache.get("k", build)
+    clock.now += 10
+    for _ in range(5):
+        assert cache.get("k", build) == (1, 10)
+    release.set()
+    cache.get_executor().shutdown(wait=True)
+
+    assert len(calls) == 2
+
+
+def test_swr_key_covers_view_options():
+    """Test that different view options are cached separately."""
+    assert make_swr_key("uid", {"theme": "apple"}) != make_swr_key("uid", {"theme": "compact"})
+    assert make_swr_key("uid", {"theme": "apple", "unrelated": 1}) == make_swr_key("uid", {"theme": "apple"})
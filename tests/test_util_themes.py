@@ -0,0 +1,81 @@
+import pytest
+import sys
+import os
+import glob
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util import themes
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    """Start every test with an empty template registry."""
+    themes.reset()
+    yield
+    themes.reset()
+
+
+def test_registry_covers_every_template():
+    """Test that every spotify.*.html.j2 template is registered."""
+    templates = {
+        os.path.basename(path)
+        for path in glob.glob(os.path.join(themes.TEMPLATE_DIR, "spotify.*.html.j2"))
+    }
+
+    assert {theme["template"] for theme in themes.THEMES.values()} == templates
+
+
+def test_warm_up_compiles_all_themes():
+    """Test that warm_up leaves every theme compiled."""
+    themes.warm_up()
+
+    for name in themes.THEMES:
+        assert name in themes._templates
+
+
+@pytest.mark.parametrize("theme,expected_height", [
+    ("default", 445),
+    ("compact", 400),
+    ("natemoo-re", 84),
+    ("novatorem", 100),
+    ("apple", 534),
+    ("spotify-embed", 152)
+])
+def test_theme_heights(theme, expected_height):
+    """Test per-theme heights from the registry."""
+    assert themes.get_height(theme) == expected_height
+
+
+def test_unknown_theme_falls_back_to_default():
+    """Test that an unknown theme renders with the default template."""
+    assert themes.get_theme_name("nope") == "default"
+    assert themes.get_template("nope") is themes.get_template("default")
+
+
+def test_render_theme():
+    """Test rendering a theme through the registry."""
+    svg = themes.render_theme(
+        "compact",
+        height=400,
+        song_name="Test Song",
+        artist_name="Test & Artist",
+        img="",
+        cover_image=False,
+        background_color="181414",
+        css_bar="",
+    )
+
+    assert 'height="400"' in svg
+    assert "Test Song" in svg
+    # Same as Flask's render_template for *.html.j2: not autoescaped
+    assert "Test & Artist" in svg
+
+
+def test_bytecode_cache(tmp_path):
+    """Test that compiled templates are written to the bytecode cache."""
+    themes._environment = themes.make_environment(str(tmp_path))
+    themes.warm_up()
+
+    assert len(os.listdir(tmp_path)) == len(themes.THEMES)
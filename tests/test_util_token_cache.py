@@ -0,0 +1,245 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# Add the parent directory to the path to import the util module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.token_cache import (
+    FileTokenCache,
+    LocalTokenCache,
+    MemorySharedCache,
+    TwoTierTokenCache,
+    make_token_cache,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_local_cache_expires_ahead_of_token_expiry(clock):
+    """Test that entries are dropped margin seconds before the token expires."""
+    cache = LocalTokenCache(margin=60, clock=clock)
+    cache.set("uid", {"access_token": "a", "expires_in": 3600})
+
+    clock.now += 3600 - 61
+    assert cache.get("uid")["access_token"] == "a"
+
+    clock.now += 1
+    assert cache.get("uid") is None
+
+
+def test_local_cache_skips_nearly_expired_tokens(clock):
+    """Test that a token already inside the margin is never cached."""
+    cache = LocalTokenCache(margin=60, clock=clock)
+    cache.set("uid", {"access_token": "a", "expired_ts": clock.now + 30})
+
+    assert cache.get("uid") is None
+
+
+def test_local_cache_lru_eviction(clock):
+    """Test that the least recently used uid is evicted first."""
+    cache = LocalTokenCache(maxsize=2, margin=0, clock=clock)
+    cache.set("a", {"access_token": "a"})
+    cache.set("b", {"access_token": "b"})
+    cache.get("a")
+    cache.set("c", {"access_token": "c"})
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_two_tier_promotes_shared_hits(clock):
+    """Test that a shared-tier hit fills the local tier of another worker."""
+    shared = MemorySharedCache(clock=clock)
+    worker_a = TwoTierTokenCache(LocalTokenCache(margin=60, clock=clock), shared, margin=60)
+    worker_b = TwoTierTokenCache(LocalTokenCache(margin=60, clock=clock), shared, margin=60)
+
+    worker_a.set("uid", {"access_token": "a", "expires_in": 3600})
+    assert len(worker_b.local) == 0
+
+    assert worker_b.get("uid")["access_token"] == "a"
+    assert len(worker_b.local) == 1
+
+    worker_b.delete("uid")
+    worker_a.local.clear()
+    assert worker_a.get("uid") is None
+
+
+def test_file_tier_round_trip(tmp_path, clock):
+    """Test the file-backed shared tier."""
+    tier = FileTokenCache(str(tmp_path), clock=clock)
+    tier.set("uid", {"access_token": "a"}, clock.now + 10)
+
+    assert tier.get("uid") == {"access_token": "a"}
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path))
+
+    clock.now += 10
+    assert tier.get("uid") is None
+    assert tier.get("missing") is None
+
+
+def test_unknown_backend():
+    """Test that an unknown backend name is rejected."""
+    with pytest.raises(ValueError):
+        make_token_cache("memcached")
+
+
+class TestGetAccessToken:
+    @pytest.fixture(autouse=True)
+    def token_cache(self):
+        from util import negative_cache, token_cache
+
+        cache = make_token_cache("memory")
+        token_cache.set_token_cache(cache)
+        negative_cache.set_negative_store(MemorySharedCache())
+        yield cache
+        token_cache.set_token_cache(None)
+        negative_cache.set_negative_store(None)
+
+    @pytest.fixture
+    def db(self):
+        from util.firestore_batch import BatchReader, WriteBehindQueue
+        from util.firestore_fake import FakeFirestore
+
+        db = FakeFirestore()
+        with patch("util.firestore_batch.reader", BatchReader(lambda: db, window=0)), \
+             patch("util.firestore_batch.writer", WriteBehindQueue(lambda: db)):
+            yield db
+
+    @patch("util.spotify.refresh_token")
+    def test_cached_token_skips_firestore(self, mock_refresh, db, token_cache):
+        """Test that a cached token is served without Firestore or Spotify."""
+        from util.access_token import get_access_token
+
+        token_cache.set("uid", {"access_token": "cached", "expires_in": 3600})
+
+        assert get_access_token("uid") == "cached"
+        assert db.rpcs == 0
+        mock_refresh.assert_not_called()
+
+    @patch("util.spotify.refresh_token")
+    def test_expired_token_is_refreshed_and_cached(self, mock_refresh, db, token_cache):
+        """Test that an expired Firestore token is refreshed once and cached."""
+        from util import firestore_batch
+        from util.access_token import get_access_token
+
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "refresh"})
+        mock_refresh.return_value = {"access_token": "new", "expires_in": 3600}
+
+        assert get_access_token("uid") == "new"
+        assert get_access_token("uid") == "new"
+        mock_refresh.assert_called_once_with("refresh")
+
+        firestore_batch.writer.flush()
+        stored = db.collection("users").document("uid").get().to_dict()
+        assert stored["access_token"] == "new"
+        assert stored["refresh_token"] == "refresh"
+        assert stored["expired_ts"] > 0
+
+    @patch("util.spotify.refresh_token")
+    def test_invalid_refresh_token(self, mock_refresh, db):
+        """Test that a rejected refresh raises InvalidTokenError."""
+        from util.access_token import get_access_token
+        from util.spotify import InvalidTokenError
+
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "revoked"})
+        mock_refresh.return_value = {"error": "invalid_grant"}
+
+        with pytest.raises(InvalidTokenError):
+            get_access_token("uid")
+        assert db.collection("users").document("uid").get().to_dict()["access_token"] == "old"
+
+    @patch("util.spotify.refresh_token")
+    def test_revoked_uid_fails_fast(self, mock_refresh, db):
+        """Test that a rejected uid skips Firestore and Spotify until its backoff passes."""
+        from util import negative_cache
+        from util.access_token import get_access_token
+        from util.spotify import InvalidTokenError
+
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "revoked"})
+        mock_refresh.return_value = {"error": "invalid_grant"}
+
+        with pytest.raises(InvalidTokenError):
+            get_access_token("uid")
+        rpcs = db.rpcs
+
+        with pytest.raises(InvalidTokenError, match="invalid_grant"):
+            get_access_token("uid")
+        assert db.rpcs == rpcs
+        mock_refresh.assert_called_once()
+
+        # A new login clears it
+        negative_cache.clear_invalid("uid")
+        mock_refresh.return_value = {"access_token": "new", "expires_in": 3600}
+        assert get_access_token("uid") == "new"
+
+    @patch("util.spotify.refresh_token")
+    def test_new_login_in_another_process_is_picked_up(self, mock_refresh, db):
+        """Test that a process-local entry is dropped on recheck when the refresh token changed."""
+        from util import negative_cache
+        from util.access_token import get_access_token
+        from util.spotify import InvalidTokenError
+
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "revoked"})
+        mock_refresh.return_value = {"error": "invalid_grant"}
+        with pytest.raises(InvalidTokenError):
+            get_access_token("uid")
+
+        # The callback ran in another worker: this store was not cleared
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "granted"})
+        mock_refresh.return_value = {"access_token": "new", "expires_in": 3600}
+        with patch.object(negative_cache, "needs_recheck", return_value=True):
+            assert get_access_token("uid") == "new"
+        mock_refresh.assert_called_with("granted")
+
+    @pytest.mark.parametrize("error", ["invalid_client", "server_error", "temporarily_unavailable"])
+    @patch("util.spotify.refresh_token")
+    def test_other_refresh_errors_are_not_negative_cached(self, mock_refresh, db, error):
+        """Test that only invalid_grant marks a uid as revoked; other errors are retried."""
+        from util import negative_cache
+        from util.access_token import get_access_token
+        from util.spotify import TokenRefreshError
+
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "refresh"})
+        mock_refresh.return_value = {"error": error}
+
+        with pytest.raises(TokenRefreshError, match=error):
+            get_access_token("uid")
+        assert negative_cache.get_invalid("uid") is None
+
+        mock_refresh.return_value = {"access_token": "new", "expires_in": 3600}
+        assert get_access_token("uid") == "new"
+
+    @patch("util.spotify.refresh_token")
+    def test_locked_refresh_is_written_before_the_lock_is_released(self, mock_refresh, db):
+        """Test that a waiter on the cross-process lock reads the winner's token from Firestore."""
+        from util import access_token
+
+        db.collection("users").document("uid").set({"access_token": "old", "refresh_token": "refresh"})
+        mock_refresh.return_value = {"access_token": "new", "expires_in": 3600}
+
+        with patch("util.access_token.REFRESH_LOCK", "file"), \
+             patch("util.access_token.get_refresh_lock", return_value=access_token.NullLock()):
+            assert access_token.get_access_token("uid") == "new"
+
+        # Another process sees only Firestore, not this one's write-behind queue
+        assert db.collection("users").document("uid").get().to_dict()["access_token"] == "new"
+
+    def test_unknown_user(self, db):
+        """Test that a uid without a Firestore document has no token."""
+        from util.access_token import get_access_token
+
+        assert get_access_token("uid") is None
@@ -0,0 +1,202 @@
+import os
+import time
+
+from util import firestore_batch, negative_cache, spotify
+from util.refresh_scheduler import RefreshScheduler
+from util.singleflight import FileLock, NullLock, RedisLock, SingleFlight
+from util.token_cache import (
+    delete_cache_token_info,
+    get_cache_token_info,
+    get_expired_ts,
+    get_token_cache,
+    set_cache_token_info,
+)
+
+# Cross-process refresh lock: "none", "file" (one host) or "redis" (many hosts)
+REFRESH_LOCK = os.getenv("REFRESH_LOCK", "none")
+REFRESH_LOCK_PATH = os.getenv("REFRESH_LOCK_PATH")
+REFRESH_LOCK_REDIS_URL = os.getenv("REFRESH_LOCK_REDIS_URL", "redis://localhost:6379/0")
+
+refresh_flight = SingleFlight()
+_refresh_lock = None
+
+
+def get_refresh_lock():
+
+    global _refresh_lock
+
+    if _refresh_lock is None:
+        if REFRESH_LOCK == "file":
+            _refresh_lock = FileLock(REFRESH_LOCK_PATH)
+        elif REFRESH_LOCK == "redis":
+            _refresh_lock = RedisLock(REFRESH_LOCK_REDIS_URL)
+        else:
+            _refresh_lock = NullLock()
+
+    return _refresh_lock
+
+
+def get_refresh_stats():
+
+    return refresh_flight.get_stats()
+
+
+def get_scheduler_stats():
+
+    return refresh_scheduler.get_stats()
+
+
+def load_token_info(uid):
+
+    return firestore_batch.get_user(uid)
+
+
+def is_token_expired(token_info, now=None):
+
+    if now is None:
+        now = time.time()
+
+    if token_info.get("expired_ts") is None:
+        return True
+
+    return now >= token_info["expired_ts"] - get_token_cache().margin
+
+
+def refresh_access_token(uid, token_info):
+
+    new_token = spotify.refresh_token(token_info["refresh_token"])
+    if "access_token" not in new_token:
+        delete_cache_token_info(uid)
+        # Only invalid_grant means this user's authorization is gone; a bad
+        # client secret or an accounts outage must not lock every user out
+        if new_token.get("error") != "invalid_grant":
+            raise spotify.TokenRefreshError(new_token.get("error", "refresh failed"))
+        # Later requests fail fast until the backoff for this uid has passed
+        negative_cache.record_invalid(uid, new_token.get("error"), token_info["refresh_token"])
+        raise spotify.InvalidTokenError(new_token.get("error"))
+
+    update_data = {
+        "access_token": new_token["access_token"],
+        "expired_ts": get_expired_ts(new_token),
+    }
+    # Spotify only sometimes rotates the refresh token
+    if new_token.get("refresh_token"):
+        update_data["refresh_token"] = new_token["refresh_token"]
+
+    # A rotated refresh token must not be lost in the queue, write it now. With
+    # a cross-process lock the waiters re-read Firestore as soon as it is
+    # released, so the new token must be there before it is
+    urgent = "refresh_token" in update_data or REFRESH_LOCK != "none"
+    firestore_batch.update_user(uid, update_data, urgent=urgent)
+
+    token_info = dict(token_info, **update_data)
+    set_cache_token_info(uid, token_info)
+
+    return token_info
+
+
+def is_refreshed_since(latest, token_info):
+
+    return (latest.get("expired_ts") or 0) > (token_info.get("expired_ts") or 0)
+
+
+def refresh_access_token_once(uid, token_info, ahead=False):
+
+    with get_refresh_lock().hold("refresh:" + uid):
+        # Another process may have refreshed while we waited for the lock.
+        # Ahead of expiry the old token is still valid, only a newer one counts.
+        cached = get_cache_token_info(uid)
+        if cached is not None and (not ahead or is_refreshed_since(cached, token_info)):
+            return cached
+
+        if REFRESH_LOCK != "none":
+            latest = load_token_info(uid)
+            if latest is not None and not is_token_expired(latest) and (
+                not ahead or is_refreshed_since(latest, token_info)
+            ):
+                set_cache_token_info(uid, latest)
+                return latest
+            if latest is not None:
+                token_info = latest
+
+        return refresh_access_token(uid, token_info)
+
+
+def refresh_ahead(uid, expired_ts):
+
+    # None unschedules the uid: a revoked token is not retried in the background,
+    # the request path and its backoff decide when to try it again
+    if negative_cache.get_invalid(uid) is not None:
+        return None
+
+    token_info = get_cache_token_info(uid) or load_token_info(uid)
+    if token_info is None:
+        return None
+    if (token_info.get("expired_ts") or 0) > expired_ts:
+        return token_info
+
+    try:
+        return refresh_flight.do(uid, refresh_access_token_once, uid, token_info, True)
+    except spotify.InvalidTokenError:
+        return None
+
+
+refresh_scheduler = RefreshScheduler(refresh_ahead)
+
+
+def load_token_infos(uids):
+
+    token_infos = {}
+    missing = []
+    for uid in uids:
+        token_info = get_cache_token_info(uid)
+        if token_info is not None:
+            token_infos[uid] = token_info
+            continue
+        # Revoked uids are only read when their rejected grant is due a recheck
+        invalid = negative_cache.get_invalid(uid)
+        if invalid is None or negative_cache.needs_recheck(invalid):
+            missing.append(uid)
+
+    # Every cache miss is read in one batched Firestore call
+    if missing:
+        token_infos.update(firestore_batch.get_users(missing))
+
+    return token_infos
+
+
+def get_access_token(uid, token_info=None):
+
+    if token_info is None:
+        token_info = get_cache_token_info(uid)
+        if token_info is not None:
+            refresh_scheduler.record(False)
+            refresh_scheduler.touch(uid, token_info)
+            return token_info["access_token"]
+
+    invalid = negative_cache.get_invalid(uid)
+    if invalid is not None and token_info is None and not negative_cache.needs_recheck(invalid):
+        raise spotify.InvalidTokenError(invalid["error"] or "refresh failed")
+
+    if token_info is None:
+        token_info = load_token_info(uid)
+
+    # Still the grant Spotify rejected, or a new login from another process
+    if invalid is not None:
+        invalid = negative_cache.check_grant(uid, invalid, token_info)
+        if invalid is not None:
+            raise spotify.InvalidTokenError(invalid["error"] or "refresh failed")
+
+    if token_info is None:
+        return None
+
+    inline_refresh = is_token_expired(token_info)
+    if inline_refresh:
+        token_info = refresh_flight.do(uid, refresh_access_token_once, uid, token_info)
+    else:
+        set_cache_token_info(uid, token_info)
+
+    refresh_scheduler.record(inline_refresh)
+    refresh_scheduler.touch(uid, token_info)
+
+    return token_info["access_token"]
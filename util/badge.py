@@ -0,0 +1,325 @@
+import asyncio
+import random
+from html import escape
+
+from util import fragments, recent_history, snapshots, spotify, themes
+from util.cache_policy import PROGRESS_ANIMATION
+from util.cover_cache import COVER_MODE, get_cover_id, get_cover_src, load_cover, load_cover_b64_bytes
+from util.svg_writer import COVER_PLACEHOLDER, splice
+
+# Per-uid badge rendering shared by the batch endpoint and the load test:
+# pick the song (now playing, else a recently played track), then fill one of
+# the theme templates. Mirrors the single-badge view's make_svg.
+
+DEFAULT_OPTIONS = {
+    "theme": themes.DEFAULT_THEME,
+    "background_color": "181414",
+    "bar_color": "53b14f",
+    "bar_color_cover": False,
+    "cover_image": True,
+    "show_offline": False,
+    "interchange": False,
+    "mode": "light",
+    "progress_animation": PROGRESS_ANIMATION,
+    "cover_mode": COVER_MODE,
+    "profanity": False,
+}
+
+COVER_MODES = ("inline", "external")
+
+
+def parse_bool(value):
+    return value is not None and value.lower() in ("true", "1", "yes")
+
+
+def get_options(args):
+
+    options = dict(DEFAULT_OPTIONS)
+    options["theme"] = themes.get_theme_name(args.get("theme"))
+    for name in ("background_color", "bar_color", "mode"):
+        if args.get(name):
+            options[name] = args.get(name)
+    for name in ("bar_color_cover", "show_offline", "interchange", "profanity"):
+        options[name] = parse_bool(args.get(name))
+    if args.get("progress_animation") is not None:
+        options["progress_animation"] = parse_bool(args.get("progress_animation"))
+    options["cover_image"] = args.get("cover_image", "true").lower() != "false"
+    if args.get("cover_mode") in COVER_MODES:
+        options["cover_mode"] = args.get("cover_mode")
+
+    return options
+
+
+def format_time(ms):
+
+    seconds = int(ms // 1000)
+    return "{}:{:02d}".format(seconds // 60, seconds % 60)
+
+
+def get_progress_data(progress_ms, duration_ms, animated=False):
+
+    if progress_ms is None or not duration_ms:
+        return None
+
+    # animated: the template runs the bar from here to 100% over remaining_s,
+    # so a cached SVG keeps moving instead of freezing at render time
+    return {
+        "progress_percentage": min(progress_ms / duration_ms * 100, 100),
+        "current_time": format_time(progress_ms),
+        "remaining_time": "-" + format_time(max(duration_ms - progress_ms, 0)),
+        "total_time": format_time(duration_ms),
+        "remaining_s": round(max(duration_ms - progress_ms, 0) / 1000, 1),
+        "animated": animated,
+    }
+
+
+def get_playing_song(data):
+
+    # Ads (and episodes without additional_types) come back with no item
+    if not data or not data.get("item"):
+        return None
+
+    item = data["item"]
+    item["currently_playing_type"] = data.get("currently_playing_type", "track")
+
+    return item, True, data.get("progress_ms")
+
+
+def pick_recent_song(items):
+
+    if not items:
+        return None, False, None
+
+    item = dict(items[random.randint(0, len(items) - 1)]["track"])
+    item["currently_playing_type"] = "track"
+
+    return item, False, None
+
+
+def get_throttled_song(uid, show_offline=False):
+
+    # While Spotify throttles us (or is down): the last good now-playing
+    # payload, else a pick from the stored recently-played buffer
+    if uid is None:
+        return None
+
+    song = get_playing_song(snapshots.get_stale_now_playing(uid))
+    if song is not None:
+        return song
+
+    entry = recent_history.get_entry(uid)
+    if show_offline or not entry or not entry["items"]:
+        return None
+
+    return pick_recent_song(entry["items"])
+
+
+def get_rate_limit_wait(uid, show_offline=False):
+
+    # Over budget, only wait for a rate-limit token when nothing could be
+    # served instead; None is the governor's default wait
+    if get_throttled_song(uid, show_offline) is not None:
+        return 0
+
+    return None
+
+
+def get_live_now_playing(access_token, uid=None, show_offline=False):
+
+    data = spotify.get_now_playing(access_token, get_rate_limit_wait(uid, show_offline))
+    # Kept for get_throttled_song, as api/index.py does
+    if uid is not None:
+        snapshots.set_snapshot(uid, snapshots.make_snapshot(data))
+
+    return data
+
+
+def get_song(access_token, show_offline=False, uid=None):
+
+    # A fresh poller snapshot answers without a now-playing call
+    data = snapshots.get_fresh_now_playing(uid) if uid is not None else None
+    if data is None:
+        try:
+            data = get_live_now_playing(access_token, uid, show_offline)
+        except spotify.RateLimitedError:
+            song = get_throttled_song(uid, show_offline)
+            if song is None:
+                raise
+            return song
+
+    song = get_playing_song(data)
+    if song is not None:
+        return song
+
+    if show_offline:
+        return None, False, None
+
+    # Known uids pick from their stored recently-played buffer
+    if uid is not None:
+        items = recent_history.get_recent_items(uid, access_token)
+    else:
+        items = spotify.get_recently_play(access_token).get("items") or []
+
+    return pick_recent_song(items)
+
+
+def get_cover_url(item):
+
+    if item is None:
+        return None
+
+    if item.get("currently_playing_type") == "episode":
+        images = item.get("images") or []
+    else:
+        images = item.get("album", {}).get("images") or []
+
+    # Spotify lists the largest image first; the second one is 300px
+    if len(images) > 1:
+        return images[1]["url"]
+
+    return images[0]["url"] if images else None
+
+
+def get_names(item, profanity=False):
+
+    if item is None:
+        return "", ""
+
+    if item.get("currently_playing_type") == "episode":
+        artist_name = item.get("show", {}).get("publisher", "")
+    else:
+        artist_name = ", ".join(artist["name"] for artist in item.get("artists", []))
+    song_name = item.get("name", "")
+
+    if profanity:
+        from util.profanity import profanity_check
+
+        artist_name, song_name = profanity_check(artist_name), profanity_check(song_name)
+
+    return escape(artist_name), escape(song_name)
+
+
+def make_svg(artist_name, song_name, img, is_now_playing, cover_image, theme, bar_color, background_color,
+             mode, progress_ms=None, duration_ms=None, progress_animation=False, bar_key=None, img_src=None):
+
+    meta = themes.get_theme(theme)
+    num_bar = meta["num_bar"]
+
+    if is_now_playing:
+        title_text = "Now playing"
+        content_bar = fragments.get_content_bar(num_bar)
+    else:
+        title_text = "Recently played"
+        content_bar = ""
+
+    rendered_data = {
+        "height": themes.get_height(theme, cover_image),
+        "num_bar": num_bar,
+        "content_bar": content_bar,
+        "css_bar": fragments.get_css_bar(num_bar, bar_key),
+        "title_text": title_text,
+        "artist_name": artist_name,
+        "song_name": song_name,
+        "img": img,
+        "img_src": img_src,
+        "cover_image": cover_image,
+        "bar_color": bar_color,
+        "background_color": background_color,
+        "is_now_playing": is_now_playing,
+        "mode": mode,
+        "progress_data": get_progress_data(progress_ms, duration_ms, progress_animation) if meta.get("progress") else None,
+    }
+
+    return themes.render_theme(theme, **rendered_data)
+
+
+def render_badge_segments(access_token, options, song=None, uid=None):
+
+    if song is None:
+        song = get_song(access_token, options["show_offline"], uid)
+    item, is_now_playing, progress_ms = song
+
+    cover_url = get_cover_url(item)
+    cover_size = themes.get_theme(options["theme"])["cover_size"]
+    bar_color = options["bar_color"]
+    cover = None
+    img_src = None
+    if cover_url and options["cover_image"] and options.get("cover_mode") == "external":
+        img_src = get_cover_src(cover_url, cover_size)
+    if cover_url and options["cover_image"] and img_src is None:
+        cover = load_cover_b64_bytes(cover_url, cover_size)
+    if cover_url and options["bar_color_cover"]:
+        from util.palette import get_cover_palette
+
+        colors = get_cover_palette(get_cover_id(cover_url), load_cover(cover_url))["colors"]
+        if colors:
+            bar_color = "%02x%02x%02x" % tuple(colors[0][:3])
+
+    svg = make_badge_svg(item, is_now_playing, progress_ms, options, uid, bool(cover), bar_color, img_src)
+
+    # The cached base64 cover is spliced in, never copied into the template output
+    return splice(svg, cover)
+
+
+def make_badge_svg(item, is_now_playing, progress_ms, options, uid, has_cover, bar_color, img_src=None):
+
+    artist_name, song_name = get_names(item, options["profanity"])
+    if options["interchange"]:
+        artist_name, song_name = song_name, artist_name
+
+    return make_svg(
+        artist_name,
+        song_name,
+        COVER_PLACEHOLDER if has_cover else "",
+        is_now_playing,
+        options["cover_image"],
+        options["theme"],
+        bar_color,
+        options["background_color"],
+        options["mode"],
+        progress_ms,
+        item.get("duration_ms") if item else None,
+        options["progress_animation"],
+        # Same uid and track, same bar timings: the SVG and its ETag stay stable
+        "{}:{}".format(uid, item.get("id") if item else None),
+        img_src,
+    )
+
+
+async def build_badge_async(access_token, options, uid=None):
+
+    from util import spotify_async
+
+    # External covers need the variant's hash and bar_color_cover its palette
+    # before the template is filled; only an inlined cover is independent of it
+    if options["bar_color_cover"] or options.get("cover_mode") == "external":
+        data = await spotify_async.get_badge_data(uid, access_token, options["show_offline"], cover_image=False)
+        song = data["item"], data["is_now_playing"], data["progress_ms"]
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(None, render_badge_segments, access_token, options, song, uid)
+    else:
+        cover_size = themes.get_theme(options["theme"])["cover_size"]
+
+        def prepare(item, is_now_playing, progress_ms):
+            has_cover = bool(options["cover_image"] and get_cover_url(item))
+            return make_badge_svg(item, is_now_playing, progress_ms, options, uid, has_cover, options["bar_color"])
+
+        data = await spotify_async.get_badge_data(
+            uid,
+            access_token,
+            options["show_offline"],
+            options["cover_image"],
+            prepare=prepare,
+            load_cover=lambda url: load_cover_b64_bytes(url, cover_size),
+        )
+        body = splice(data["prepared"], data["img"])
+
+    # Same shape as api/index.py's build_badge, for the cache policy
+    return {
+        "body": body,
+        "is_playing": data["is_now_playing"],
+        "progress_ms": data["progress_ms"],
+        "duration_ms": data["duration_ms"],
+        "stale": data["stale"],
+        "animated": options["progress_animation"],
+    }
@@ -0,0 +1,85 @@
+import os
+import time
+from email.utils import formatdate
+
+# HTTP caching policy for rendered badges, derived from the playback state
+# instead of a blanket no-cache. While a track plays the badge can be cached
+# until the track ends (capped, since the user may skip); offline and
+# recently-played badges change rarely and get long TTLs. Badges served from
+# a stale snapshot are cached only briefly so the fresh one follows quickly.
+# Expires always carries the valid-until time of the response.
+
+CACHE_PLAYING_MAX_AGE = int(os.getenv("CACHE_PLAYING_MAX_AGE", "30"))
+CACHE_PLAYING_STALE_WHILE_REVALIDATE = int(os.getenv("CACHE_PLAYING_STALE_WHILE_REVALIDATE", "5"))
+CACHE_IDLE_MAX_AGE = int(os.getenv("CACHE_IDLE_MAX_AGE", "300"))
+CACHE_IDLE_STALE_WHILE_REVALIDATE = int(os.getenv("CACHE_IDLE_STALE_WHILE_REVALIDATE", "600"))
+CACHE_STALE_MAX_AGE = int(os.getenv("CACHE_STALE_MAX_AGE", "5"))
+# With an animated progress bar the SVG keeps moving on its own, so it can be
+# cached for longer; the cap bounds how far behind a late viewer's bar starts.
+PROGRESS_ANIMATION = os.getenv("PROGRESS_ANIMATION", "false") == "true"
+CACHE_ANIMATED_MAX_AGE = int(os.getenv("CACHE_ANIMATED_MAX_AGE", "120"))
+
+NO_CACHE = "no-cache, no-store, must-revalidate"
+
+
+def get_remaining_seconds(progress_ms, duration_ms):
+
+    if progress_ms is None or not duration_ms:
+        return None
+
+    return max(duration_ms - progress_ms, 0) / 1000
+
+
+def is_animated(value):
+
+    if value is None:
+        return PROGRESS_ANIMATION
+
+    return value.lower() == "true"
+
+
+def get_policy(is_playing, progress_ms=None, duration_ms=None, stale=False, animated=False):
+
+    if stale:
+        return CACHE_STALE_MAX_AGE, 0
+
+    if not is_playing:
+        return CACHE_IDLE_MAX_AGE, CACHE_IDLE_STALE_WHILE_REVALIDATE
+
+    # Never past the end of the track, so the next song is not hidden
+    max_age = CACHE_ANIMATED_MAX_AGE if animated else CACHE_PLAYING_MAX_AGE
+    remaining = get_remaining_seconds(progress_ms, duration_ms)
+    if remaining is not None:
+        max_age = min(max_age, int(remaining))
+
+    stale_while_revalidate = min(CACHE_PLAYING_STALE_WHILE_REVALIDATE, max_age)
+
+    return max(max_age, 1), stale_while_revalidate
+
+
+def make_cache_control(max_age, stale_while_revalidate=0):
+
+    cache_control = f"public, max-age={max_age}, s-maxage={max_age}"
+    if stale_while_revalidate:
+        cache_control += f", stale-while-revalidate={stale_while_revalidate}"
+
+    return cache_control
+
+
+def get_cache_headers(is_playing, progress_ms=None, duration_ms=None, stale=False, now=None, animated=False,
+                      last_modified=None):
+
+    if now is None:
+        now = time.time()
+
+    max_age, stale_while_revalidate = get_policy(is_playing, progress_ms, duration_ms, stale, animated)
+    headers = {
+        "Cache-Control": make_cache_control(max_age, stale_while_revalidate),
+        "Expires": formatdate(now + max_age, usegmt=True),
+    }
+
+    # When the cached render was made (render_cache), the same on every hit
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(int(last_modified), usegmt=True)
+
+    return headers
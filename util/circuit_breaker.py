@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+# One circuit breaker per upstream host (accounts.spotify.com for tokens,
+# api.spotify.com for player data). After CIRCUIT_FAILURE_THRESHOLD
+# consecutive failures (connection errors, timeouts, 5xx) the circuit opens
+# and calls to that host fail fast for CIRCUIT_RESET_TIMEOUT seconds instead
+# of each waiting out a timeout. Then it is half-open: CIRCUIT_HALF_OPEN_PROBES
+# calls go through, and a success closes it again while a failure reopens it.
+# 4xx answers, 429 included, mean the host is up and count as successes. A
+# probe that never reports back (a cancelled task) is released, and in any
+# case given up on after CIRCUIT_RESET_TIMEOUT so the circuit cannot stick.
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 half_open_probes=CIRCUIT_HALF_OPEN_PROBES, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probes = 0
+        self.probed_at = None
+        self.rejected = 0
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.probes = 0
+
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_probes:
+                    if self.clock() - self.probed_at < self.reset_timeout:
+                        self.rejected += 1
+                        return False
+                    self.probes = 0
+                self.probes += 1
+                self.probed_at = self.clock()
+
+            return True
+
+    def release(self):
+
+        # The call was abandoned without a result: its probe slot is free again
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes:
+                self.probes -= 1
+
+    def record_success(self):
+
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probes = 0
+
+    def record_failure(self):
+
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self.probes = 0
+
+    def get_stats(self):
+
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+def get_breaker(url):
+
+    host = urlparse(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host))
+
+    return breaker
+
+
+def get_stats():
+
+    return {host: breaker.get_stats() for host, breaker in list(_breakers.items())}
+
+
+def reset():
+
+    with _lock:
+        _breakers.clear()
@@ -0,0 +1,267 @@
+import os
+import tempfile
+import threading
+from base64 import b64encode
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import sha1
+from io import BytesIO
+from urllib.parse import urlparse
+
+from util import session
+from util.singleflight import SingleFlight
+
+# Cover art cache keyed by the i.scdn.co image id. Each entry is a resized,
+# re-encoded variant together with its base64 string, so a hit costs neither
+# a download nor an encode. The downloaded image is kept too (same byte
+# budget), so every size variant of a cover is derived from one fetch. An
+# optional disk tier (COVER_CACHE_PATH) survives restarts and is shared by the
+# workers on a host.
+#
+# Covers can also be referenced instead of inlined (COVER_MODE=external): the
+# badge links to /api/cover/<id>-<size>-<hash>.jpg, served by api/cover.py
+# with an immutable Cache-Control, where the hash is taken from the variant's
+# bytes so a re-encoded cover gets a new URL. Browsers do not load external
+# resources in an SVG shown through <img>, so this only suits badges embedded
+# as <object> or opened directly; GitHub READMEs need the inline default.
+
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+COVER_CACHE_PATH = os.getenv("COVER_CACHE_PATH")
+COVER_QUALITY = int(os.getenv("COVER_QUALITY", "85"))
+# Thumbnails this small hide JPEG artifacts, so they are encoded harder
+COVER_QUALITY_SMALL = int(os.getenv("COVER_QUALITY_SMALL", "70"))
+COVER_SMALL_SIZE = 120
+COVER_MODE = os.getenv("COVER_MODE", "inline")
+COVER_BASE_URL = os.getenv("COVER_BASE_URL", "").rstrip("/")
+COVER_HASH_LENGTH = 16
+
+COVER_FORMATS = {"jpeg": "jpg", "webp": "webp"}
+
+
+def get_cover_id(url):
+
+    parsed = urlparse(url)
+    if parsed.netloc.endswith("scdn.co") and parsed.path.startswith("/image/"):
+        return parsed.path.rsplit("/", 1)[-1]
+
+    return sha1(url.encode()).hexdigest()
+
+
+def get_cover_quality(size):
+
+    if size and size <= COVER_SMALL_SIZE:
+        return COVER_QUALITY_SMALL
+
+    return COVER_QUALITY
+
+
+def get_scdn_url(cover_id):
+    return f"https://i.scdn.co/image/{cover_id}"
+
+
+def resize_cover(data, size, fmt="jpeg", quality=None):
+
+    from PIL import Image
+
+    if quality is None:
+        quality = get_cover_quality(size)
+
+    image = Image.open(BytesIO(data))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if size and max(image.size) > size:
+        image.thumbnail((size, size), Image.LANCZOS)
+
+    out = BytesIO()
+    image.save(out, format=fmt.upper(), quality=quality)
+
+    return out.getvalue()
+
+
+class CoverCache:
+    def __init__(self, max_bytes=COVER_CACHE_MAX_BYTES, path=COVER_CACHE_PATH):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.flight = SingleFlight()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _filename(self, key):
+
+        cover_id, size, fmt = key
+        return os.path.join(self.path, f"{cover_id}-{size or 'orig'}.{COVER_FORMATS[fmt]}")
+
+    def _get_memory(self, key):
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _set_memory(self, key, entry):
+
+        entry_size = len(entry[0]) + len(entry[1])
+        if entry_size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0]) + len(old[1])
+
+            self._entries[key] = entry
+            self.size += entry_size
+
+            while self.size > self.max_bytes:
+                _, (data, b64) = self._entries.popitem(last=False)
+                self.size -= len(data) + len(b64)
+
+    def _read_disk(self, key):
+
+        if not self.path:
+            return None
+
+        try:
+            with open(self._filename(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+
+        if not self.path:
+            return
+
+        # Write to a temp file and rename so readers never see a partial image
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._filename(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def get(self, url, size=300, fmt="jpeg"):
+
+        key = (get_cover_id(url), size, fmt)
+
+        entry = self._get_memory(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        data = self._read_disk(key)
+        if data is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            data = resize_cover(self.get_source(url), size, fmt)
+            self._write_disk(key, data)
+
+        # base64 is kept as bytes so the SVG writer can splice it without a copy
+        entry = (data, b64encode(data))
+        self._set_memory(key, entry)
+
+        return entry
+
+    def get_source(self, url):
+
+        # One download per cover id, shared by all its sizes and concurrent misses
+        key = (get_cover_id(url), None, "source")
+        entry = self._get_memory(key)
+        if entry is None:
+            entry = self.flight.do(key, self._download, key, url)
+
+        return entry[0]
+
+    def _download(self, key, url):
+
+        self.downloads += 1
+        response = session.get(url)
+        response.raise_for_status()
+        entry = (response.content, b"")
+        self._set_memory(key, entry)
+
+        return entry
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "downloads": self.downloads,
+        }
+
+
+cover_cache = CoverCache()
+
+
+def load_cover(url, size=300, fmt="jpeg"):
+
+    return cover_cache.get(url, size, fmt)[0]
+
+
+def load_cover_b64(url, size=300, fmt="jpeg"):
+
+    return cover_cache.get(url, size, fmt)[1].decode("ascii")
+
+
+def load_cover_b64_bytes(url, size=300, fmt="jpeg"):
+
+    return cover_cache.get(url, size, fmt)[1]
+
+
+def get_cover_hash(data):
+    return sha1(data).hexdigest()[:COVER_HASH_LENGTH]
+
+
+# Memoized on the URL, not the image bytes, so the memo holds short strings
+# and no image outlives its eviction from the byte-bounded cover cache.
+# i.scdn.co ids are content-addressed, so a URL always maps to one image.
+@lru_cache(maxsize=1024)
+def get_cover_name(url, size=300):
+
+    # Only i.scdn.co covers can be fetched again from their id alone
+    cover_id = get_cover_id(url)
+    if get_scdn_url(cover_id) != url.split("?", 1)[0]:
+        return None
+
+    return f"{cover_id}-{size}-{get_cover_hash(load_cover(url, size))}.jpg"
+
+
+def parse_cover_name(name):
+
+    stem, dot, ext = name.rpartition(".")
+    parts = stem.split("-")
+    if not dot or ext != "jpg" or len(parts) < 3 or not parts[-2].isdigit():
+        return None
+
+    return "-".join(parts[:-2]), int(parts[-2]), parts[-1]
+
+
+def get_cover_src(url, size=300, base_url=COVER_BASE_URL):
+
+    name = get_cover_name(url, size)
+    if name is None:
+        return None
+
+    return f"{base_url}/api/cover/{name}"
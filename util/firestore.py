@@ -1,10 +1,50 @@
 import json
 import os
+import threading
 from base64 import b64decode
 
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+# Lazily initialised, per-process Firestore client. firebase_admin and its
+# gRPC stack are only imported on first use, so entry points that never touch
+# Firestore don't pay for them at cold start. gRPC channels must not cross a
+# fork: a process that was forked (gunicorn --preload, multiprocessing) drops
+# the inherited client and builds its own under a per-process app name.
+
+_db = None
+_db_pid = None
+_db_lock = threading.Lock()
+_credential = None
+
+
+def get_credential():
+
+    global _credential
+
+    # The decoded service account is plain data and safe to share across forks
+    if _credential is None:
+        from firebase_admin import credentials
+
+        firebase_config = os.getenv("FIREBASE")
+        if firebase_config is None:
+            raise ValueError("FIREBASE environment variable is not set. Please set the Firebase configuration.")
+        firebase_dict = json.loads(b64decode(firebase_config))
+
+        _credential = credentials.Certificate(firebase_dict)
+
+    return _credential
+
+
+def make_firestore_db():
+
+    import firebase_admin
+    from firebase_admin import firestore
+
+    name = f"spotify-github-profile-{os.getpid()}"
+    try:
+        app = firebase_admin.get_app(name)
+    except ValueError:
+        app = firebase_admin.initialize_app(get_credential(), name=name)
+
+    return firestore.client(app)
 
 
 def get_firestore_db():
@@ -12,14 +52,43 @@ def get_firestore_db():
     if os.getenv("TESTING") == "true":
         from unittest.mock import MagicMock
         return MagicMock()
-    
-    if not firebase_admin._apps:
-        firebase_config = os.getenv("FIREBASE")
-        if firebase_config is None:
-            raise ValueError("FIREBASE environment variable is not set. Please set the Firebase configuration.")
-        firebase_dict = json.loads(b64decode(firebase_config))
 
-        cred = credentials.Certificate(firebase_dict)
-        firebase_admin.initialize_app(cred)
+    # In-memory fake for load tests and local runs without Firebase
+    if os.getenv("FIRESTORE_FAKE") == "true":
+        from util.firestore_fake import get_fake_firestore
+        return get_fake_firestore()
+
+    global _db, _db_pid
+
+    pid = os.getpid()
+    if _db is None or _db_pid != pid:
+        with _db_lock:
+            if _db is None or _db_pid != pid:
+                _db = make_firestore_db()
+                _db_pid = pid
+
+    return _db
+
+
+def reset_firestore_db():
+
+    global _db, _db_pid, _db_lock
+
+    _db = None
+    _db_pid = None
+    # The lock may have been held by another thread at fork time
+    _db_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_firestore_db)
+
+
+class LazyFirestore:
+    """Module-level stand-in for a Firestore client, resolved on first use."""
+
+    def __getattr__(self, name):
+        return getattr(get_firestore_db(), name)
+
 
-    return firestore.client()
+db = LazyFirestore()
@@ -0,0 +1,206 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from util.firestore import get_firestore_db
+
+# Firestore access layer for the users collection. Concurrent reads within
+# FIRESTORE_READ_WINDOW seconds are sent as one get_all RPC, and refreshed
+# tokens are written behind the request: updates are coalesced per uid and
+# committed in batches at most FIRESTORE_FLUSH_INTERVAL seconds later.
+
+FIRESTORE_READ_WINDOW = float(os.getenv("FIRESTORE_READ_WINDOW", "0.005"))
+FIRESTORE_FLUSH_INTERVAL = float(os.getenv("FIRESTORE_FLUSH_INTERVAL", "0.5"))
+
+USERS_COLLECTION = "users"
+# Firestore limits: get_all is chunked, a write batch holds at most 500 writes
+MAX_READ_BATCH = 100
+MAX_WRITE_BATCH = 500
+
+
+class BatchReader:
+    def __init__(self, get_db=None, window=FIRESTORE_READ_WINDOW, collection=USERS_COLLECTION):
+        self.get_db = get_db or (lambda: get_firestore_db())
+        self.window = window
+        self.collection = collection
+        self.rpcs = 0
+        self.reads = 0
+        self._pending = {}
+        self._collecting = False
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+
+        with self._lock:
+            self.reads += 1
+            future = self._pending.get(uid)
+            if future is None:
+                future = Future()
+                self._pending[uid] = future
+            leader = not self._collecting
+            self._collecting = True
+
+        # The first caller waits out the window and reads for everyone
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                batch = self._pending
+                self._pending = {}
+                self._collecting = False
+            self._read(batch)
+
+        return future.result()
+
+    def get_many(self, uids):
+
+        batch = {uid: Future() for uid in uids}
+        with self._lock:
+            self.reads += len(batch)
+        self._read(batch)
+
+        return {uid: future.result() for uid, future in batch.items()}
+
+    def _read(self, batch):
+
+        uids = list(batch)
+        try:
+            db = self.get_db()
+            collection = db.collection(self.collection)
+            results = {}
+            for start in range(0, len(uids), MAX_READ_BATCH):
+                refs = [collection.document(uid) for uid in uids[start:start + MAX_READ_BATCH]]
+                self.rpcs += 1
+                for doc in db.get_all(refs):
+                    results[doc.id] = doc.to_dict() if doc.exists else None
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+
+        for uid, future in batch.items():
+            future.set_result(results.get(uid))
+
+
+class WriteBehindQueue:
+    def __init__(self, get_db=None, flush_interval=FIRESTORE_FLUSH_INTERVAL, collection=USERS_COLLECTION):
+        self.get_db = get_db or (lambda: get_firestore_db())
+        self.flush_interval = flush_interval
+        self.collection = collection
+        self.updates = 0
+        self.commits = 0
+        self.written = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def update(self, uid, data, urgent=False):
+
+        with self._lock:
+            self.updates += 1
+            self._pending.setdefault(uid, {}).update(data)
+
+        if urgent:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def pending(self, uid):
+
+        with self._lock:
+            data = self._pending.get(uid)
+            return dict(data) if data is not None else None
+
+    def flush(self):
+
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+
+        if not pending:
+            return 0
+
+        db = self.get_db()
+        collection = db.collection(self.collection)
+        items = list(pending.items())
+        try:
+            for start in range(0, len(items), MAX_WRITE_BATCH):
+                batch = db.batch()
+                for uid, data in items[start:start + MAX_WRITE_BATCH]:
+                    batch.set(collection.document(uid), data, merge=True)
+                batch.commit()
+                self.commits += 1
+                self.written += len(items[start:start + MAX_WRITE_BATCH])
+        except Exception:
+            # Put the writes back unless a newer value arrived meanwhile
+            with self._lock:
+                for uid, data in items:
+                    self._pending[uid] = dict(data, **self._pending.get(uid, {}))
+            raise
+
+        return len(items)
+
+    def _ensure_thread(self):
+
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+
+        with self._lock:
+            if self._thread is None or self._pid != pid:
+                self._pid = pid
+                self._thread = threading.Thread(target=self._run, name="firestore-write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                time.sleep(self.flush_interval)
+
+
+reader = BatchReader()
+writer = WriteBehindQueue()
+
+
+@atexit.register
+def flush_on_exit():
+
+    try:
+        writer.flush()
+    except Exception:
+        pass
+
+
+def get_user(uid):
+
+    data = reader.get(uid)
+
+    # Read-your-writes for updates still waiting in the queue
+    pending = writer.pending(uid)
+    if pending is not None and data is not None:
+        data = dict(data, **pending)
+
+    return data
+
+
+def get_users(uids):
+
+    users = reader.get_many(uids)
+
+    for uid, data in users.items():
+        pending = writer.pending(uid)
+        if pending is not None and data is not None:
+            users[uid] = dict(data, **pending)
+
+    return users
+
+
+def update_user(uid, data, urgent=False):
+
+    writer.update(uid, data, urgent)
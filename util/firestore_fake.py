@@ -0,0 +1,142 @@
+import copy
+import threading
+
+# In-memory stand-in for the subset of the Firestore client used here:
+# collection/document get, set, update, get_all, batch and stream. Used by the
+# tests and the load-test harness (FIRESTORE_FAKE=true). For the real wire
+# protocol run the Firestore emulator and set FIRESTORE_EMULATOR_HOST.
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self):
+
+        self._collection._db.rpcs += 1
+        self._collection._db.reads += 1
+        return self._collection._snapshot(self.id)
+
+    def set(self, data, merge=False):
+
+        self._collection._db.rpcs += 1
+        self._collection._db.writes += 1
+        self._collection._set(self.id, data, merge)
+
+    def update(self, data):
+
+        self._collection._db.rpcs += 1
+        self._collection._db.writes += 1
+        if self._collection._get(self.id) is None:
+            raise KeyError(f"No document to update: {self.id}")
+        self._collection._set(self.id, data, merge=True)
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self._db = db
+        self.name = name
+        self._docs = {}
+
+    def document(self, doc_id):
+        return FakeDocument(self, doc_id)
+
+    def _get(self, doc_id):
+
+        with self._db._lock:
+            return self._docs.get(doc_id)
+
+    def _snapshot(self, doc_id):
+        return FakeSnapshot(doc_id, self._get(doc_id))
+
+    def _set(self, doc_id, data, merge):
+
+        with self._db._lock:
+            if merge and doc_id in self._docs:
+                self._docs[doc_id].update(copy.deepcopy(data))
+            else:
+                self._docs[doc_id] = copy.deepcopy(data)
+
+    def stream(self):
+
+        with self._db._lock:
+            doc_ids = list(self._docs)
+        self._db.rpcs += 1
+        self._db.reads += len(doc_ids)
+
+        return [self._snapshot(doc_id) for doc_id in doc_ids]
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._writes.append((doc_ref, data, merge))
+
+    def update(self, doc_ref, data):
+        self._writes.append((doc_ref, data, True))
+
+    def commit(self):
+
+        self._db.rpcs += 1
+        self._db.commits += 1
+        for doc_ref, data, merge in self._writes:
+            self._db.writes += 1
+            doc_ref._collection._set(doc_ref.id, data, merge)
+        self._writes = []
+
+
+class FakeFirestore:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.rpcs = 0
+        self.commits = 0
+
+    def collection(self, name):
+
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(self, name)
+            return self._collections[name]
+
+    def get_all(self, references):
+
+        self.rpcs += 1
+        for doc_ref in references:
+            self.reads += 1
+            yield doc_ref._collection._snapshot(doc_ref.id)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+_fake_db = None
+
+
+def get_fake_firestore():
+
+    global _fake_db
+
+    if _fake_db is None:
+        _fake_db = FakeFirestore()
+
+    return _fake_db
@@ -0,0 +1,86 @@
+import os
+import random
+import threading
+import zlib
+
+# Precomputed pieces of the bar themes. generate_css_bar used to draw fresh
+# random animation timings on every render; instead each bar count gets a
+# pool of CSS_BAR_POOL_SIZE variants built once per worker, and a badge picks
+# one by uid and track, so the same song renders the same bytes (stable ETag)
+# while different badges still animate differently.
+
+CSS_BAR_POOL_SIZE = int(os.getenv("CSS_BAR_POOL_SIZE", "16"))
+CSS_BAR_SEED = 1
+
+_lock = threading.Lock()
+_css_bar_pools = {}
+_content_bars = {}
+
+
+def generate_css_bar(num_bar=75, rng=random):
+
+    css_bar = ""
+    left = 1
+    for i in range(1, num_bar + 1):
+        anim = rng.randint(350, 500)
+        css_bar += ".bar:nth-child({})  {{ left: {}px; animation-duration: {}ms; }}".format(i, left, anim)
+        left += 4
+
+    return css_bar
+
+
+def make_css_bar_pool(num_bar, size=CSS_BAR_POOL_SIZE, seed=CSS_BAR_SEED):
+
+    rng = random.Random(seed * 1000003 + num_bar)
+
+    return tuple(generate_css_bar(num_bar, rng) for _ in range(size))
+
+
+def get_css_bar_pool(num_bar):
+
+    pool = _css_bar_pools.get(num_bar)
+    if pool is None:
+        with _lock:
+            pool = _css_bar_pools.get(num_bar)
+            if pool is None:
+                pool = make_css_bar_pool(num_bar)
+                _css_bar_pools[num_bar] = pool
+
+    return pool
+
+
+def get_css_bar(num_bar, key=None):
+
+    if not num_bar:
+        return ""
+
+    pool = get_css_bar_pool(num_bar)
+    if key is None:
+        return random.choice(pool)
+
+    return pool[zlib.crc32(key.encode()) % len(pool)]
+
+
+def get_content_bar(num_bar):
+
+    content_bar = _content_bars.get(num_bar)
+    if content_bar is None:
+        content_bar = "".join(["<div class='bar'></div>" for _ in range(num_bar)])
+        _content_bars[num_bar] = content_bar
+
+    return content_bar
+
+
+def warm_up(bar_counts):
+
+    for num_bar in set(bar_counts):
+        if num_bar:
+            get_css_bar_pool(num_bar)
+            get_content_bar(num_bar)
+
+
+def reset():
+
+    with _lock:
+        _css_bar_pools.clear()
+        _content_bars.clear()
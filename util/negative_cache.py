@@ -0,0 +1,132 @@
+import os
+import tempfile
+import time
+from hashlib import sha256
+
+from util.token_cache import FileTokenCache, MemorySharedCache, RedisTokenCache
+
+# Negative results for uids whose refresh token Spotify rejected (revoked
+# access, deleted app authorization). While an entry is active the uid fails
+# fast with InvalidTokenError, without reading Firestore or calling
+# accounts.spotify.com. Each new rejection doubles the backoff, so abandoned
+# badges cost one refresh attempt a day instead of one per view. A new login
+# (callback) clears the entry.
+#
+# The entry also remembers which grant was rejected (a hash of the refresh
+# token). The callback only clears the store of its own process, so with the
+# default memory backend other workers would keep failing a re-authorized uid
+# until the backoff ends: every NEGATIVE_CACHE_RECHECK seconds they read the
+# uid's token once and drop the entry when the refresh token has changed.
+
+NEGATIVE_CACHE_BACKEND = os.getenv("NEGATIVE_CACHE_BACKEND", "memory")
+NEGATIVE_CACHE_BASE_TTL = int(os.getenv("NEGATIVE_CACHE_BASE_TTL", "60"))
+NEGATIVE_CACHE_MAX_TTL = int(os.getenv("NEGATIVE_CACHE_MAX_TTL", "86400"))
+NEGATIVE_CACHE_RECHECK = int(os.getenv("NEGATIVE_CACHE_RECHECK", "60"))
+NEGATIVE_CACHE_PATH = os.getenv(
+    "NEGATIVE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "spotify-negative-cache")
+)
+NEGATIVE_CACHE_REDIS_URL = os.getenv("NEGATIVE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+
+def make_negative_store(backend=NEGATIVE_CACHE_BACKEND):
+
+    if backend == "memory":
+        return MemorySharedCache()
+    if backend == "file":
+        return FileTokenCache(NEGATIVE_CACHE_PATH)
+    if backend == "redis":
+        return RedisTokenCache(NEGATIVE_CACHE_REDIS_URL, prefix="spotify:invalid:")
+
+    raise ValueError(f"Unknown NEGATIVE_CACHE_BACKEND: {backend}")
+
+
+_store = None
+
+
+def get_negative_store():
+
+    global _store
+
+    if _store is None:
+        _store = make_negative_store()
+
+    return _store
+
+
+def set_negative_store(store):
+
+    global _store
+
+    _store = store
+
+
+def get_backoff(failures, base_ttl=NEGATIVE_CACHE_BASE_TTL, max_ttl=NEGATIVE_CACHE_MAX_TTL):
+
+    return min(base_ttl * (2 ** max(failures - 1, 0)), max_ttl)
+
+
+def get_invalid(uid, now=None):
+
+    if now is None:
+        now = time.time()
+
+    entry = get_negative_store().get(uid)
+    if entry is None or now >= entry["until"]:
+        return None
+
+    return entry
+
+
+def get_grant_id(refresh_token):
+
+    # Only a hash is stored: file and redis stores are shared with other hosts
+    if not refresh_token:
+        return None
+
+    return sha256(refresh_token.encode("utf-8")).hexdigest()[:16]
+
+
+def record_invalid(uid, error=None, refresh_token=None, now=None):
+
+    if now is None:
+        now = time.time()
+
+    # Kept past its backoff so the next rejection knows how many came before
+    previous = get_negative_store().get(uid)
+    failures = (previous["failures"] if previous else 0) + 1
+    until = now + get_backoff(failures)
+    entry = {"error": error, "failures": failures, "until": until,
+             "grant": get_grant_id(refresh_token), "checked": now}
+    get_negative_store().set(uid, entry, until + NEGATIVE_CACHE_MAX_TTL)
+
+    return entry
+
+
+def needs_recheck(entry, now=None, recheck=NEGATIVE_CACHE_RECHECK):
+
+    if now is None:
+        now = time.time()
+
+    return now >= entry.get("checked", 0) + recheck
+
+
+def check_grant(uid, entry, token_info, now=None):
+
+    if now is None:
+        now = time.time()
+
+    # A new login stored another refresh token: the rejection no longer applies
+    refresh_token = token_info.get("refresh_token") if token_info else None
+    if refresh_token is None or get_grant_id(refresh_token) != entry.get("grant"):
+        clear_invalid(uid)
+        return None
+
+    entry = dict(entry, checked=now)
+    get_negative_store().set(uid, entry, entry["until"] + NEGATIVE_CACHE_MAX_TTL)
+
+    return entry
+
+
+def clear_invalid(uid):
+
+    get_negative_store().delete(uid)
@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import tempfile
+import threading
+from io import BytesIO
+
+# Dominant colours for bar_color_cover. extract_colors is a vectorized port of
+# colorgram.extract (same bucketing, same ordering, same integer rounding),
+# run on a downsampled thumbnail instead of the full-size cover. Results are
+# memoized per cover id, optionally in a persistent on-disk index.
+
+PALETTE_THUMBNAIL_SIZE = int(os.getenv("PALETTE_THUMBNAIL_SIZE", "64"))
+PALETTE_INDEX_PATH = os.getenv("PALETTE_INDEX_PATH")
+PALETTE_NUMBER_OF_COLORS = 5
+
+
+def isLightOrDark(rgbColor=[0, 128, 255], threshold=127.5):
+
+    # https://alienryderflex.com/hsp.html
+    [r, g, b] = rgbColor[:3]
+    hsp = math.sqrt(0.299 * (r * r) + 0.587 * (g * g) + 0.114 * (b * b))
+
+    return "light" if hsp > threshold else "dark"
+
+
+def load_pixels(image):
+
+    import numpy as np
+
+    if image.mode not in ("RGB", "RGBA", "RGBa"):
+        image = image.convert("RGB")
+
+    pixels = np.asarray(image, dtype=np.int64)
+
+    return pixels[..., :3].reshape(-1, 3)
+
+
+def extract_colors(image, number_of_colors=PALETTE_NUMBER_OF_COLORS):
+
+    import numpy as np
+    from colorgram import Color
+
+    pixels = load_pixels(image)
+    r, g, b = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+
+    # colorgram.hsl, including its tie-breaking between channels
+    most = np.maximum(np.maximum(r, g), b)
+    least = np.minimum(np.minimum(r, g), b)
+    l = (most + least) >> 1
+
+    diff = most - least
+    safe_diff = np.where(diff == 0, 1, diff)
+    h_r = (g - b) * 255 // safe_diff + np.where(g < b, 1530, 0)
+    h_g = (b - r) * 255 // safe_diff + 510
+    h_b = (r - g) * 255 // safe_diff + 1020
+    h = np.where(most == r, h_r, np.where(most == g, h_g, h_b)) // 6
+    h = np.where(diff == 0, 0, h)
+
+    y = (r * 0.2126 + g * 0.7152 + b * 0.0722).astype(np.int64)
+
+    top_two_bits = 0b11000000
+    packed = ((y & top_two_bits) << 4) | ((h & top_two_bits) << 2) | (l & top_two_bits)
+
+    cubes = 4 ** 7
+    counts = np.bincount(packed, minlength=cubes)
+    sums = [np.bincount(packed, weights=channel, minlength=cubes) for channel in (r, g, b)]
+
+    used = np.nonzero(counts)[0]
+    used = used[np.argsort(-counts[used], kind="stable")][:number_of_colors]
+
+    total = counts[used].sum()
+    colors = []
+    for index in used:
+        count = int(counts[index])
+        color = Color(*(int(s[index]) // count for s in sums), count)
+        color.proportion = count / total
+        colors.append(color)
+
+    return colors
+
+
+def make_thumbnail(image, size=PALETTE_THUMBNAIL_SIZE):
+
+    from PIL import Image
+
+    if max(image.size) <= size:
+        return image
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((size, size), Image.BILINEAR)
+
+    return thumbnail
+
+
+def get_palette(data, number_of_colors=PALETTE_NUMBER_OF_COLORS):
+
+    from PIL import Image
+
+    image = make_thumbnail(Image.open(BytesIO(data)))
+    colors = extract_colors(image, number_of_colors)
+
+    return {
+        "colors": [list(color.rgb) + [color.proportion] for color in colors],
+        "mode": isLightOrDark(colors[0].rgb) if colors else "dark",
+    }
+
+
+class PaletteIndex:
+    def __init__(self, path=PALETTE_INDEX_PATH):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _filename(self, cover_id):
+        return os.path.join(self.path, cover_id + ".json")
+
+    def get(self, cover_id):
+
+        palette = self._entries.get(cover_id)
+        if palette is not None or not self.path:
+            return palette
+
+        try:
+            with open(self._filename(cover_id)) as f:
+                palette = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        with self._lock:
+            self._entries[cover_id] = palette
+
+        return palette
+
+    def set(self, cover_id, palette):
+
+        with self._lock:
+            self._entries[cover_id] = palette
+
+        if not self.path:
+            return
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(palette, f)
+            os.replace(tmp, self._filename(cover_id))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def get_or_extract(self, cover_id, data):
+
+        palette = self.get(cover_id)
+        if palette is None:
+            palette = get_palette(data)
+            self.set(cover_id, palette)
+
+        return palette
+
+
+palette_index = PaletteIndex()
+
+
+def get_cover_palette(cover_id, data):
+
+    return palette_index.get_or_extract(cover_id, data)
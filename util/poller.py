@@ -0,0 +1,163 @@
+import heapq
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from util import spotify
+from util.access_token import get_access_token
+from util.firestore import get_firestore_db
+from util.snapshots import delete_snapshot, get_progress, make_snapshot, set_snapshot
+
+# Background poller keeping a now-playing snapshot fresh for every connected
+# user, so Spotify API usage scales with users instead of badge views: the
+# badge paths serve a fresh snapshot and only call Spotify when there is none.
+# The poller and the badge processes must share SNAPSHOT_BACKEND (file/redis).
+#
+#   python -m util.poller
+#
+# Users are polled often while playing, again just after the current track
+# should end, and with a growing interval while idle.
+
+POLL_PLAYING_INTERVAL = float(os.getenv("POLL_PLAYING_INTERVAL", "15"))
+POLL_IDLE_INTERVAL = float(os.getenv("POLL_IDLE_INTERVAL", "60"))
+POLL_IDLE_MAX_INTERVAL = float(os.getenv("POLL_IDLE_MAX_INTERVAL", "300"))
+POLL_TRACK_END_SLACK = float(os.getenv("POLL_TRACK_END_SLACK", "1"))
+POLL_DISCOVER_INTERVAL = float(os.getenv("POLL_DISCOVER_INTERVAL", "300"))
+POLL_WORKERS = int(os.getenv("POLL_WORKERS", "8"))
+
+logger = logging.getLogger(__name__)
+
+
+def next_poll_delay(snapshot, idle_polls=0):
+
+    data = snapshot["now_playing"]
+    if not data or not data.get("is_playing", True) or not data.get("item"):
+        return min(POLL_IDLE_INTERVAL * (2 ** idle_polls), POLL_IDLE_MAX_INTERVAL)
+
+    duration_ms = data["item"].get("duration_ms")
+    progress_ms = get_progress(snapshot, snapshot["fetched_at"])
+    if duration_ms is None or progress_ms is None:
+        return POLL_PLAYING_INTERVAL
+
+    # Poll right after the track should end to pick up the next one
+    remaining = max(0.0, (duration_ms - progress_ms) / 1000)
+
+    return min(POLL_PLAYING_INTERVAL, remaining + POLL_TRACK_END_SLACK)
+
+
+class Poller:
+    def __init__(self, clock=time.time, get_now_playing=None):
+        self.clock = clock
+        self.get_now_playing = get_now_playing or spotify.get_now_playing
+        self._heap = []
+        self._due = {}
+        self._idle_polls = {}
+        self.polls = 0
+
+    def schedule(self, uid, delay):
+
+        due = self.clock() + delay
+        self._due[uid] = due
+        heapq.heappush(self._heap, (due, uid))
+
+    def add(self, uid):
+
+        if uid not in self._due:
+            self.schedule(uid, 0)
+
+    def remove(self, uid):
+
+        self._due.pop(uid, None)
+        self._idle_polls.pop(uid, None)
+
+    def __contains__(self, uid):
+        return uid in self._due
+
+    def pop_due(self):
+
+        now = self.clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, uid = heapq.heappop(self._heap)
+            # Skip entries superseded by a later schedule() or remove()
+            if self._due.get(uid) == when:
+                due.append(uid)
+
+        return due
+
+    def next_due_in(self):
+
+        if not self._heap:
+            return POLL_DISCOVER_INTERVAL
+
+        return max(0.0, self._heap[0][0] - self.clock())
+
+    def poll(self, uid):
+
+        try:
+            access_token = get_access_token(uid)
+            if access_token is None:
+                self.remove(uid)
+                return None
+            snapshot = make_snapshot(self.get_now_playing(access_token), self.clock())
+        except spotify.InvalidTokenError:
+            delete_snapshot(uid)
+            self.remove(uid)
+            return None
+
+        self.polls += 1
+        idle_polls = self._idle_polls.get(uid, 0)
+        delay = next_poll_delay(snapshot, idle_polls)
+        # Badges serve it without calling Spotify until the next poll is due
+        snapshot = make_snapshot(snapshot["now_playing"], snapshot["fetched_at"], delay)
+        set_snapshot(uid, snapshot)
+
+        if snapshot["now_playing"].get("item") and snapshot["now_playing"].get("is_playing", True):
+            self._idle_polls[uid] = 0
+        else:
+            self._idle_polls[uid] = idle_polls + 1
+
+        self.schedule(uid, delay)
+        return snapshot
+
+    def poll_due(self, executor=None):
+
+        due = self.pop_due()
+        if executor is None:
+            for uid in due:
+                self._poll_safely(uid)
+        else:
+            list(executor.map(self._poll_safely, due))
+
+        return due
+
+    def _poll_safely(self, uid):
+
+        try:
+            return self.poll(uid)
+        except Exception:
+            logger.exception("Polling %s failed", uid)
+            self.schedule(uid, POLL_IDLE_INTERVAL)
+
+    def discover(self):
+
+        for doc in get_firestore_db().collection("users").stream():
+            self.add(doc.id)
+
+    def run_forever(self):
+
+        next_discover = 0
+        with ThreadPoolExecutor(POLL_WORKERS) as executor:
+            while True:
+                if self.clock() >= next_discover:
+                    self.discover()
+                    next_discover = self.clock() + POLL_DISCOVER_INTERVAL
+
+                self.poll_due(executor)
+                time.sleep(min(self.next_due_in(), max(0.0, next_discover - self.clock()), 1.0))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    Poller().run_forever()
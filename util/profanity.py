@@ -1,11 +1,155 @@
-from profanityfilter import ProfanityFilter
+import os
+import re
+from collections import deque
+from functools import lru_cache
 
-pf = ProfanityFilter()
+# Artist and song names are censored with profanityfilter's wordlist, but not
+# with its engine: ProfanityFilter.censor compiles and runs one regex per word
+# (about 800 with plurals) on every name. The list is compiled once into an
+# Aho-Corasick automaton instead, so a name is scanned in a single pass and
+# the censored string is built from the matches of that pass. The output is
+# the same: matches are case-insensitive, \b is applied on the sides of a
+# word that are word characters, and overlaps go to the longer word. Names
+# repeat heavily across users, so results are kept in an LRU as well.
 
+PROFANITY_CACHE_SIZE = int(os.getenv("PROFANITY_CACHE_SIZE", "4096"))
 
-def profanity_check(name):
+RE_ESCAPED_CHAR = re.compile(r"\\(.)")
+
+_filter = None
+_matcher = None
+
+
+def get_filter():
+
+    global _filter
+
+    # Loaded on the first name that needs checking, not at import
+    if _filter is None:
+        from profanityfilter import ProfanityFilter
+
+        _filter = ProfanityFilter()
+
+    return _filter
+
+
+def fold(char):
+
+    # re.IGNORECASE also matches pairs like s/ſ and k/K (Kelvin sign)
+    folded = char.upper().lower()
+    return folded if len(folded) == 1 else char
+
+
+def is_word_char(char):
+
+    return char.isalnum() or char == "_"
+
+
+class ProfanityMatcher:
+    def __init__(self, words, censor_char="*"):
+        # words are regex-escaped, as ProfanityFilter.get_profane_words returns them
+        self.censor_char = censor_char
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for word in words:
+            literal = RE_ESCAPED_CHAR.sub(r"\1", word)
+            if not literal:
+                continue
+            # Same rules as ProfanityFilter.censor for adding \b
+            start_boundary = is_word_char(word[0])
+            end_boundary = len(word) > 1 and word[-2] != "\\" and is_word_char(word[-1])
+            self._add("".join(fold(char) for char in literal), (len(literal), start_boundary, end_boundary))
+
+        self._link()
+
+    def _add(self, literal, output):
 
-    if pf.is_clean(name):
-        return name
+        state = 0
+        for char in literal:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = next_state
+
+        if output not in self._out[state]:
+            self._out[state] += (output,)
+
+    def _link(self):
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def find(self, text):
+
+        matches = []
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for end, char in enumerate(text, 1):
+            char = fold(char)
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, start_boundary, end_boundary in out[state]:
+                start = end - length
+                if start_boundary and start > 0 and is_word_char(text[start - 1]):
+                    continue
+                if end_boundary and end < len(text) and is_word_char(text[end]):
+                    continue
+                matches.append((start, end))
+
+        return matches
+
+    def censor(self, text):
+
+        matches = self.find(text)
+        if not matches:
+            return text
+
+        # ProfanityFilter replaces the longest words first, each one left to
+        # right, so a match is dropped when it overlaps one already taken
+        taken = bytearray(len(text))
+        spans = []
+        for start, end in sorted(matches, key=lambda match: (match[0] - match[1], match[0])):
+            if not any(taken[start:end]):
+                taken[start:end] = b"\x01" * (end - start)
+                spans.append((start, end))
+
+        parts = []
+        position = 0
+        for start, end in sorted(spans):
+            parts.append(text[position:start])
+            parts.append(self.censor_char * (end - start))
+            position = end
+        parts.append(text[position:])
+
+        return "".join(parts)
+
+
+def get_matcher():
+
+    global _matcher
+
+    if _matcher is None:
+        _matcher = ProfanityMatcher(get_filter().get_profane_words())
+
+    return _matcher
+
+
+@lru_cache(maxsize=PROFANITY_CACHE_SIZE)
+def profanity_check(name):
 
-    return pf.censor(name)
+    return get_matcher().censor(name)
@@ -0,0 +1,233 @@
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Token-bucket governor for calls to the Spotify Web API. Every endpoint has
+# its own budget on top of a global one, low-priority endpoints (recently
+# played) leave RATE_LIMIT_RESERVE tokens of the global budget to now-playing,
+# and a 429 from Spotify pauses every call until its Retry-After has passed.
+# A call over budget first waits for a token, up to RATE_LIMIT_MAX_WAIT
+# seconds of its request's time, and is only deferred (RateLimitedError,
+# served from a snapshot by the badge paths) when none would come in time.
+# With RATE_LIMIT_BACKEND=file the buckets are shared by all workers on a host.
+#
+# The default budgets are deliberately conservative: Spotify does not publish
+# its limit (a rolling 30 s window per app), and 20 calls/s keeps a
+# development-mode app clear of 429s. They cap the whole deployment, not each
+# uid, so a cold start faster than that fails the uids that have no snapshot
+# yet: benchmarks/load_test.py --target badge --requests 1000 runs at about
+# 80 req/s against 20 now-playing calls/s and defers ~300 of its 1000 cold
+# requests. Apps with an extended quota should raise RATE_LIMIT_GLOBAL and
+# RATE_LIMIT_NOW_PLAYING to match it.
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv(
+    "RATE_LIMIT_PATH", os.path.join(tempfile.gettempdir(), "spotify-rate-limit.json")
+)
+RATE_LIMIT_RESERVE = float(os.getenv("RATE_LIMIT_RESERVE", "5"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "0.5"))
+DEFAULT_RETRY_AFTER = 1
+
+# endpoint: (tokens per second, burst capacity)
+BUDGETS = {
+    "global": (float(os.getenv("RATE_LIMIT_GLOBAL", "20")), 40),
+    "now_playing": (float(os.getenv("RATE_LIMIT_NOW_PLAYING", "20")), 40),
+    "recently_played": (float(os.getenv("RATE_LIMIT_RECENTLY_PLAYED", "5")), 10),
+    "token": (float(os.getenv("RATE_LIMIT_TOKEN", "10")), 20),
+    "profile": (float(os.getenv("RATE_LIMIT_PROFILE", "5")), 10),
+}
+
+LOW_PRIORITY = {"recently_played"}
+
+
+def refill(bucket, rate, capacity, now):
+
+    tokens = bucket.get("tokens", capacity)
+    updated = bucket.get("updated", now)
+    bucket["tokens"] = min(capacity, tokens + (now - updated) * rate)
+    bucket["updated"] = now
+
+
+def try_acquire(state, endpoint, now, budgets=BUDGETS, reserve=RATE_LIMIT_RESERVE):
+
+    if now < state.get("blocked_until", 0):
+        return False
+
+    buckets = state.setdefault("buckets", {})
+    names = ["global"] + ([endpoint] if endpoint in budgets else [])
+    for name in names:
+        refill(buckets.setdefault(name, {}), *budgets[name], now)
+
+    needed = 1 + (reserve if endpoint in LOW_PRIORITY else 0)
+    if buckets["global"]["tokens"] < needed:
+        return False
+    if endpoint in budgets and buckets[endpoint]["tokens"] < 1:
+        return False
+
+    for name in names:
+        buckets[name]["tokens"] -= 1
+
+    return True
+
+
+def get_wait(state, endpoint, now, budgets=BUDGETS, reserve=RATE_LIMIT_RESERVE):
+
+    # Seconds until try_acquire could succeed; the buckets are refilled already
+    waits = [state.get("blocked_until", 0) - now]
+    buckets = state.get("buckets", {})
+    needed = 1 + (reserve if endpoint in LOW_PRIORITY else 0)
+    waits.append((needed - buckets["global"]["tokens"]) / budgets["global"][0])
+    if endpoint in budgets:
+        waits.append((1 - buckets[endpoint]["tokens"]) / budgets[endpoint][0])
+
+    return max(max(waits), 0.0)
+
+
+def acquire_or_wait(state, endpoint, now, budgets=BUDGETS, reserve=RATE_LIMIT_RESERVE):
+
+    if try_acquire(state, endpoint, now, budgets, reserve):
+        return 0.0
+
+    # While blocked the buckets were not refilled; refill them for get_wait
+    for name in ["global"] + ([endpoint] if endpoint in budgets else []):
+        refill(state.setdefault("buckets", {}).setdefault(name, {}), *budgets[name], now)
+
+    # Never 0, so the caller can tell a wait from a granted token
+    return max(get_wait(state, endpoint, now, budgets, reserve), 1e-3)
+
+
+def parse_retry_after(value):
+
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class MemoryRateState:
+    def __init__(self):
+        self.state = {}
+        self._lock = threading.Lock()
+
+    def update(self, fn):
+
+        with self._lock:
+            return fn(self.state)
+
+
+class FileRateState:
+    def __init__(self, path=RATE_LIMIT_PATH):
+        self.path = path
+
+    def update(self, fn):
+
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                result = fn(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateGovernor:
+    def __init__(self, state=None, clock=time.time, budgets=BUDGETS, reserve=RATE_LIMIT_RESERVE,
+                 max_wait=RATE_LIMIT_MAX_WAIT, sleep=time.sleep):
+        self.state = state if state is not None else MemoryRateState()
+        self.clock = clock
+        self.budgets = budgets
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.sleep = sleep
+        self.metrics = {"allowed": 0, "deferred": 0, "throttled": 0, "waited": 0}
+
+    def take(self, endpoint, waited=0.0, max_wait=None):
+
+        # 0 once a token is taken; otherwise the wait before trying again, or
+        # None when that would run past max_wait and the call is deferred
+        if max_wait is None:
+            max_wait = self.max_wait
+
+        now = self.clock()
+        wait = self.state.update(lambda state: acquire_or_wait(state, endpoint, now, self.budgets, self.reserve))
+        if wait == 0:
+            self.metrics["allowed"] += 1
+            if waited:
+                self.metrics["waited"] += 1
+            return 0.0
+        if waited + wait > max_wait:
+            self.metrics["deferred"] += 1
+            return None
+
+        return wait
+
+    def acquire(self, endpoint, max_wait=None):
+
+        waited = 0.0
+        while True:
+            wait = self.take(endpoint, waited, max_wait)
+            if wait is None:
+                return False
+            if wait == 0:
+                return True
+            self.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, endpoint, max_wait=None):
+
+        # Same as acquire, without blocking the event loop while waiting
+        waited = 0.0
+        while True:
+            wait = self.take(endpoint, waited, max_wait)
+            if wait is None:
+                return False
+            if wait == 0:
+                return True
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def backoff(self, retry_after=None):
+
+        until = self.clock() + parse_retry_after(retry_after)
+
+        def block(state):
+            state["blocked_until"] = max(state.get("blocked_until", 0), until)
+
+        self.state.update(block)
+        self.metrics["throttled"] += 1
+
+    def blocked_for(self):
+
+        until = self.state.update(lambda state: state.get("blocked_until", 0))
+
+        return max(0.0, until - self.clock())
+
+    def get_metrics(self):
+
+        return dict(self.metrics)
+
+
+def make_governor(backend=RATE_LIMIT_BACKEND):
+
+    if backend == "memory":
+        return RateGovernor()
+    if backend == "file":
+        return RateGovernor(FileRateState())
+
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+governor = make_governor()
@@ -0,0 +1,163 @@
+import os
+import tempfile
+import time
+
+from util import spotify
+from util.token_cache import FileTokenCache, MemorySharedCache, RedisTokenCache
+
+# Per-uid ring buffer of the last RECENT_HISTORY_SIZE recently-played items,
+# used for offline badges instead of asking Spotify for the same ten tracks on
+# every view. The buffer is served as is for RECENT_HISTORY_TTL seconds;
+# after that only plays newer than the stored cursor are fetched (the API's
+# `after` parameter) and merged in, newest first. A full page of new plays
+# may skip some, so the buffer is then refetched whole. While Spotify is
+# throttling us, or the host is down, the stored buffer is served at any age.
+# The fetch sequence is a generator (fetch_steps) so the sync and the async
+# client drive the same logic with their own HTTP calls.
+
+RECENT_HISTORY_BACKEND = os.getenv("RECENT_HISTORY_BACKEND", "memory")
+RECENT_HISTORY_SIZE = int(os.getenv("RECENT_HISTORY_SIZE", "10"))
+RECENT_HISTORY_TTL = int(os.getenv("RECENT_HISTORY_TTL", "300"))
+RECENT_HISTORY_MAX_AGE = int(os.getenv("RECENT_HISTORY_MAX_AGE", str(7 * 24 * 3600)))
+RECENT_HISTORY_PATH = os.getenv(
+    "RECENT_HISTORY_PATH", os.path.join(tempfile.gettempdir(), "spotify-recent-history")
+)
+RECENT_HISTORY_REDIS_URL = os.getenv("RECENT_HISTORY_REDIS_URL", "redis://localhost:6379/0")
+
+
+def make_history_store(backend=RECENT_HISTORY_BACKEND):
+
+    if backend == "memory":
+        return MemorySharedCache()
+    if backend == "file":
+        return FileTokenCache(RECENT_HISTORY_PATH)
+    if backend == "redis":
+        return RedisTokenCache(RECENT_HISTORY_REDIS_URL, prefix="spotify:recent:")
+
+    raise ValueError(f"Unknown RECENT_HISTORY_BACKEND: {backend}")
+
+
+_store = None
+_stats = {"hits": 0, "fetches": 0, "incremental": 0, "stale": 0}
+
+
+def get_history_store():
+
+    global _store
+
+    if _store is None:
+        _store = make_history_store()
+
+    return _store
+
+
+def set_history_store(store):
+
+    global _store
+
+    _store = store
+
+
+def get_stats():
+
+    return dict(_stats)
+
+
+def get_entry(uid):
+
+    return get_history_store().get(uid)
+
+
+def is_fresh(entry, now=None):
+
+    if entry is None:
+        return False
+
+    if now is None:
+        now = time.time()
+
+    return now - entry["fetched_at"] < RECENT_HISTORY_TTL
+
+
+def merge_items(new_items, old_items, size=RECENT_HISTORY_SIZE):
+
+    # Newest first; ISO 8601 played_at strings sort chronologically
+    merged = []
+    seen = set()
+    for item in sorted(new_items + old_items, key=lambda item: item.get("played_at") or "", reverse=True):
+        key = (item.get("played_at"), (item.get("track") or {}).get("id"))
+        if key not in seen:
+            seen.add(key)
+            merged.append(item)
+
+    return merged[:size]
+
+
+def get_cursor(entry):
+
+    return entry.get("cursor") if entry else None
+
+
+def update(uid, entry, response, incremental, now=None):
+
+    if now is None:
+        now = time.time()
+
+    new_items = response.get("items") or []
+    old_items = entry["items"] if entry and incremental else []
+    cursor = (response.get("cursors") or {}).get("after") or get_cursor(entry)
+
+    entry = {"items": merge_items(new_items, old_items), "cursor": cursor, "fetched_at": now}
+    get_history_store().set(uid, entry, now + RECENT_HISTORY_MAX_AGE)
+
+    return entry["items"]
+
+
+def fetch_steps(uid, entry, now=None):
+
+    # Yields the `after` cursor of each recently-played call (None for a full
+    # page) and is sent back its response; returns the updated items
+    if now is None:
+        now = time.time()
+
+    _stats["fetches"] += 1
+    cursor = get_cursor(entry)
+    if cursor is not None:
+        _stats["incremental"] += 1
+        response = yield cursor
+        if len(response.get("items") or []) < RECENT_HISTORY_SIZE:
+            return update(uid, entry, response, True, now)
+
+    response = yield None
+    return update(uid, entry, response, False, now)
+
+
+def get_stale_items(entry, error):
+
+    # Throttled or circuit open: any stored buffer beats an error badge
+    if entry is None:
+        raise error
+
+    _stats["stale"] += 1
+    return entry["items"]
+
+
+def get_recent_items(uid, access_token, now=None):
+
+    if now is None:
+        now = time.time()
+
+    entry = get_entry(uid)
+    if is_fresh(entry, now):
+        _stats["hits"] += 1
+        return entry["items"]
+
+    steps = fetch_steps(uid, entry, now)
+    try:
+        after = next(steps)
+        while True:
+            after = steps.send(spotify.get_recently_play(access_token, RECENT_HISTORY_SIZE, after=after))
+    except StopIteration as done:
+        return done.value
+    except spotify.RateLimitedError as e:
+        return get_stale_items(entry, e)
@@ -0,0 +1,201 @@
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Refresh-ahead for access tokens. Every uid seen by get_access_token is put
+# on a min-heap ordered by when its token should be refreshed: REFRESH_AHEAD_LEAD
+# seconds (plus up to REFRESH_AHEAD_JITTER, so a burst of logins does not
+# refresh in one burst) before Spotify expires it. A background thread pops
+# due uids and refreshes those still seen within REFRESH_AHEAD_ACTIVE_WINDOW
+# on a small pool, so active users never pay a refresh inside a badge
+# request. The lead must exceed TOKEN_CACHE_EXPIRY_MARGIN, otherwise the
+# cache drops the token and a request refreshes it first.
+#
+# Off by default: serverless functions do not keep background threads.
+
+REFRESH_AHEAD = os.getenv("REFRESH_AHEAD", "false") == "true"
+REFRESH_AHEAD_LEAD = float(os.getenv("REFRESH_AHEAD_LEAD", "120"))
+REFRESH_AHEAD_JITTER = float(os.getenv("REFRESH_AHEAD_JITTER", "60"))
+REFRESH_AHEAD_ACTIVE_WINDOW = float(os.getenv("REFRESH_AHEAD_ACTIVE_WINDOW", "900"))
+REFRESH_AHEAD_WORKERS = int(os.getenv("REFRESH_AHEAD_WORKERS", "4"))
+REFRESH_AHEAD_MAX_USERS = int(os.getenv("REFRESH_AHEAD_MAX_USERS", "10000"))
+REFRESH_AHEAD_RETRY = float(os.getenv("REFRESH_AHEAD_RETRY", "15"))
+REFRESH_AHEAD_MAX_SLEEP = 30
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    def __init__(self, refresh, enabled=REFRESH_AHEAD, lead=REFRESH_AHEAD_LEAD, jitter=REFRESH_AHEAD_JITTER,
+                 active_window=REFRESH_AHEAD_ACTIVE_WINDOW, workers=REFRESH_AHEAD_WORKERS,
+                 max_users=REFRESH_AHEAD_MAX_USERS, retry=REFRESH_AHEAD_RETRY, clock=time.time, rng=None):
+        self.refresh = refresh
+        self.enabled = enabled
+        self.lead = lead
+        self.jitter = jitter
+        self.active_window = active_window
+        self.workers = workers
+        self.max_users = max_users
+        self.retry = retry
+        self.clock = clock
+        self.random = rng or random.Random()
+        self.requests = 0
+        self.inline_refreshes = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._heap = []
+        self._due = {}
+        self._seen = {}
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._pid = None
+
+    def record(self, inline_refresh):
+
+        with self._lock:
+            self.requests += 1
+            if inline_refresh:
+                self.inline_refreshes += 1
+
+    def touch(self, uid, token_info):
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if uid not in self._seen and len(self._seen) >= self.max_users:
+                return
+            self._seen[uid] = self.clock()
+            scheduled = self._schedule(uid, token_info)
+
+        if scheduled:
+            self.start()
+            self._wakeup.set()
+
+    def _schedule(self, uid, token_info):
+
+        # Called with the lock held
+        expired_ts = token_info.get("expired_ts")
+        entry = self._due.get(uid)
+        if expired_ts is None or uid in self._inflight or (entry is not None and entry[1] == expired_ts):
+            return False
+
+        self._push(uid, expired_ts - self.lead - self.random.uniform(0, self.jitter), expired_ts)
+
+        return True
+
+    def _push(self, uid, due, expired_ts):
+
+        self._due[uid] = (due, expired_ts)
+        heapq.heappush(self._heap, (due, uid))
+
+    def __contains__(self, uid):
+        return uid in self._due
+
+    def pop_due(self):
+
+        now = self.clock()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, uid = heapq.heappop(self._heap)
+                entry = self._due.get(uid)
+                # Skip entries superseded by a later schedule
+                if entry is None or entry[0] != when:
+                    continue
+                del self._due[uid]
+
+                if now - self._seen.get(uid, 0) > self.active_window:
+                    self._seen.pop(uid, None)
+                    self.dropped += 1
+                    continue
+
+                self._inflight.add(uid)
+                due.append((uid, entry[1]))
+
+        return due
+
+    def next_due_in(self):
+
+        with self._lock:
+            if not self._heap:
+                return REFRESH_AHEAD_MAX_SLEEP
+            return max(0.0, self._heap[0][0] - self.clock())
+
+    def refresh_one(self, uid, expired_ts):
+
+        token_info = None
+        failed = False
+        try:
+            token_info = self.refresh(uid, expired_ts)
+        except Exception as e:
+            logger.warning("Refreshing the token of %s ahead of expiry failed: %r", uid, e)
+            failed = True
+
+        with self._lock:
+            self._inflight.discard(uid)
+            if failed:
+                self.failed += 1
+                # Held back until the retry, so touches do not reschedule it at once;
+                # past the expiry the request path refreshes as before
+                self._push(uid, self.clock() + self.retry, expired_ts)
+            elif token_info is not None:
+                self.refreshed += 1
+                self._schedule(uid, token_info)
+
+        return token_info
+
+    def run_once(self, executor=None):
+
+        due = self.pop_due()
+        for uid, expired_ts in due:
+            if executor is None:
+                self.refresh_one(uid, expired_ts)
+            else:
+                executor.submit(self.refresh_one, uid, expired_ts)
+
+        return [uid for uid, _ in due]
+
+    def _run(self):
+
+        while True:
+            self.run_once(self._executor)
+            self._wakeup.wait(min(self.next_due_in(), REFRESH_AHEAD_MAX_SLEEP))
+            self._wakeup.clear()
+
+    def start(self):
+
+        # Threads do not survive a fork; the heap does, and is picked up again
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._inflight.clear()
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="refresh-ahead")
+            self._thread = threading.Thread(target=self._run, name="refresh-scheduler", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def get_stats(self):
+
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "inline_refreshes": self.inline_refreshes,
+                # Share of token lookups that did not refresh in the request path
+                "hit_rate": 1 - self.inline_refreshes / self.requests if self.requests else None,
+                "scheduled": len(self._due),
+                "refreshed": self.refreshed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+            }
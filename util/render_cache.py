@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+
+# Cache of rendered badges. The key covers everything that changes the SVG
+# (uid, track, a coarse progress bucket and the view query options), so a
+# repeated request for an unchanged badge skips template rendering and
+# cover encoding entirely. Each entry keeps its ETag and the time it was
+# rendered, its Last-Modified.
+
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RENDER_PROGRESS_BUCKET_MS = int(os.getenv("RENDER_PROGRESS_BUCKET_MS", "5000"))
+
+# Query params that change the rendered SVG
+VIEW_OPTIONS = (
+    "theme",
+    "background_color",
+    "bar_color",
+    "bar_color_cover",
+    "mode",
+    "cover_image",
+    "interchange",
+    "show_offline",
+    "profanity",
+    "progress_animation",
+    "cover_mode",
+)
+
+
+def get_item_id(item):
+
+    if not item:
+        return "offline"
+
+    return item.get("id") or item.get("uri") or item.get("name", "")
+
+
+def get_progress_bucket(progress_ms):
+
+    if progress_ms is None:
+        return None
+
+    return int(progress_ms) // RENDER_PROGRESS_BUCKET_MS
+
+
+def make_render_key(uid, item, progress_ms, options):
+
+    option_values = tuple((name, options.get(name)) for name in VIEW_OPTIONS)
+
+    return (uid, get_item_id(item), get_progress_bucket(progress_ms), option_values)
+
+
+def make_etag(body):
+
+    if isinstance(body, (bytes, bytearray)):
+        return '"{}"'.format(sha1(body).hexdigest())
+
+    # svg_writer.Segments
+    return body.etag()
+
+
+class RenderCache:
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES, clock=time.time):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body):
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        entry = (body, make_etag(body), self.clock())
+        if len(body) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+
+            self._entries[key] = entry
+            self.size += len(body)
+
+            while self.size > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+        return entry
+
+    def get_or_render(self, key, render):
+
+        entry = self.get(key)
+        if entry is None:
+            entry = self.set(key, render())
+
+        return entry
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def is_not_modified(request, etag, last_modified=None):
+
+    # Strong comparison: only an exact match of our own ETag counts
+    if request.if_none_match:
+        return request.if_none_match.contains(etag.strip('"'))
+
+    # If-Modified-Since is only consulted without If-None-Match (RFC 9110)
+    if last_modified is not None and request.if_modified_since is not None:
+        return request.if_modified_since.timestamp() >= int(last_modified)
+
+    return False
+
+
+render_cache = RenderCache()
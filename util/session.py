@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# Shared, per-process HTTP client for every call to accounts.spotify.com and
+# api.spotify.com. Connections are kept alive and reused between badge renders
+# instead of paying a new TCP+TLS handshake on every request.
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "false").lower() == "true"
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.2"))
+
+# A checkout slower than this is counted as a wait on an exhausted pool
+POOL_WAIT_THRESHOLD = 0.001
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_pool_waits = 0
+_pool_wait_seconds = 0.0
+# host -> [connections, requests] of the async httpx client (util/spotify_async.py)
+_client_hosts = {}
+
+
+def _record_pool_wait(waited):
+
+    global _pool_waits, _pool_wait_seconds
+
+    if waited < POOL_WAIT_THRESHOLD:
+        return
+
+    with _lock:
+        _pool_waits += 1
+        _pool_wait_seconds += waited
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    def _get_conn(self, timeout=None):
+        start = time.monotonic()
+        conn = super()._get_conn(timeout)
+        _record_pool_wait(time.monotonic() - start)
+        return conn
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    def _get_conn(self, timeout=None):
+        start = time.monotonic()
+        conn = super()._get_conn(timeout)
+        _record_pool_wait(time.monotonic() - start)
+        return conn
+
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def make_retry():
+
+    # Only idempotent reads are retried on 5xx; 429 is left to the caller so
+    # Retry-After is not silently slept through inside a request.
+    return Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+
+
+def make_session():
+
+    adapter = PooledAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=HTTP_POOL_BLOCK,
+        max_retries=make_retry(),
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def get_session():
+
+    global _session, _session_pid
+
+    # Sockets must not be shared with a forked gunicorn worker, so a new pid
+    # always gets its own pool.
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = make_session()
+                _session_pid = pid
+
+    return _session
+
+
+def reset_session():
+
+    global _session, _session_pid, _pool_waits, _pool_wait_seconds
+
+    with _lock:
+        if _session is not None and _session_pid == os.getpid():
+            _session.close()
+        _session = None
+        _session_pid = None
+        _pool_waits = 0
+        _pool_wait_seconds = 0.0
+        _client_hosts.clear()
+
+
+def record_client_request(host, new_connection):
+
+    with _lock:
+        counts = _client_hosts.setdefault(host, [0, 0])
+        counts[0] += int(new_connection)
+        counts[1] += 1
+
+
+def request(method, url, **kwargs):
+
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+
+    return request("POST", url, **kwargs)
+
+
+def get_stats():
+
+    hosts = {}
+    total_connections = 0
+    total_requests = 0
+
+    session = _session if _session_pid == os.getpid() else None
+    if session is not None:
+        adapters = {id(a): a for a in session.adapters.values()}
+        for adapter in adapters.values():
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                hosts[pool.host] = {
+                    "connections": pool.num_connections,
+                    "requests": pool.num_requests,
+                }
+                total_connections += pool.num_connections
+                total_requests += pool.num_requests
+
+    with _lock:
+        client_hosts = {host: list(counts) for host, counts in _client_hosts.items()}
+    for host, (connections, requests_made) in client_hosts.items():
+        stats = hosts.setdefault(host, {"connections": 0, "requests": 0})
+        stats["connections"] += connections
+        stats["requests"] += requests_made
+        total_connections += connections
+        total_requests += requests_made
+
+    reuse_rate = 0.0
+    if total_requests:
+        reuse_rate = max(0.0, 1 - total_connections / total_requests)
+
+    return {
+        "requests": total_requests,
+        "connections": total_connections,
+        "reuse_rate": reuse_rate,
+        "pool_waits": _pool_waits,
+        "pool_wait_seconds": _pool_wait_seconds,
+        "hosts": hosts,
+    }
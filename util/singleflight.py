@@ -0,0 +1,120 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import sha1
+
+# Request coalescing: concurrent callers asking for the same key share one
+# call of the underlying function instead of each issuing their own.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.issued = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.issued += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def get_stats(self):
+
+        return {"issued": self.issued, "coalesced": self.coalesced}
+
+    def reset_stats(self):
+
+        with self._lock:
+            self.issued = 0
+            self.coalesced = 0
+
+
+# Advisory lock shared by every process on the host, one lock file per key.
+class FileLock:
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), "spotify-locks")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def hold(self, key):
+
+        filename = os.path.join(self.path, sha1(key.encode()).hexdigest() + ".lock")
+        with open(filename, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class NullLock:
+    @contextmanager
+    def hold(self, key):
+        yield
+
+
+# Lock shared across hosts through any server speaking the Redis protocol.
+class RedisLock:
+    def __init__(self, url="redis://localhost:6379/0", prefix="spotify:lock:", ttl=10, client=None):
+        if client is None:
+            # Optional dependency, only needed when this lock is selected
+            import redis
+
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @contextmanager
+    def hold(self, key):
+
+        name = self.prefix + key
+        token = os.urandom(8).hex()
+        # The lock expires on its own so a crashed holder cannot wedge the key
+        while not self.client.set(name, token, nx=True, ex=self.ttl):
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if self.client.get(name) in (token, token.encode()):
+                self.client.delete(name)
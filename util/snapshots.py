@@ -0,0 +1,136 @@
+import os
+import tempfile
+import time
+
+from util.token_cache import FileTokenCache, MemorySharedCache, RedisTokenCache
+
+# Per-uid now-playing snapshots written by the poller (util/poller.py) and
+# read by the badge paths (util/badge.py, util/spotify_async.py) before any
+# now-playing call. The poller marks each snapshot fresh until its next poll
+# is due (plus SNAPSHOT_GRACE); past that, or once the track it shows has
+# ended, badges fetch live again, so a stopped poller degrades to live
+# fetches instead of a frozen badge. Older snapshots, up to SNAPSHOT_MAX_AGE,
+# are only served while Spotify is throttling us.
+
+SNAPSHOT_BACKEND = os.getenv("SNAPSHOT_BACKEND", "memory")
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "600"))
+SNAPSHOT_GRACE = float(os.getenv("SNAPSHOT_GRACE", "5"))
+SNAPSHOT_PATH = os.getenv(
+    "SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "spotify-snapshots")
+)
+SNAPSHOT_REDIS_URL = os.getenv("SNAPSHOT_REDIS_URL", "redis://localhost:6379/0")
+
+
+def make_snapshot_store(backend=SNAPSHOT_BACKEND):
+
+    if backend == "memory":
+        return MemorySharedCache()
+    if backend == "file":
+        return FileTokenCache(SNAPSHOT_PATH)
+    if backend == "redis":
+        return RedisTokenCache(SNAPSHOT_REDIS_URL, prefix="spotify:snapshot:")
+
+    raise ValueError(f"Unknown SNAPSHOT_BACKEND: {backend}")
+
+
+_store = None
+
+
+def get_snapshot_store():
+
+    global _store
+
+    if _store is None:
+        _store = make_snapshot_store()
+
+    return _store
+
+
+def set_snapshot_store(store):
+
+    global _store
+
+    _store = store
+
+
+def make_snapshot(now_playing, now=None, fresh_for=None):
+
+    if now is None:
+        now = time.time()
+
+    snapshot = {"now_playing": now_playing or {}, "fetched_at": now}
+    # Only the poller, which knows when it polls next, vouches for freshness
+    if fresh_for is not None:
+        snapshot["fresh_until"] = now + fresh_for + SNAPSHOT_GRACE
+
+    return snapshot
+
+
+def get_snapshot(uid):
+
+    return get_snapshot_store().get(uid)
+
+
+def set_snapshot(uid, snapshot):
+
+    get_snapshot_store().set(uid, snapshot, snapshot["fetched_at"] + SNAPSHOT_MAX_AGE)
+
+
+def delete_snapshot(uid):
+
+    get_snapshot_store().delete(uid)
+
+
+def get_progress(snapshot, now=None):
+
+    data = snapshot["now_playing"]
+    if not data or data.get("progress_ms") is None:
+        return None
+
+    if not data.get("is_playing", True):
+        return data["progress_ms"]
+
+    if now is None:
+        now = time.time()
+
+    return data["progress_ms"] + int((now - snapshot["fetched_at"]) * 1000)
+
+
+def get_fresh_now_playing(uid, now=None):
+
+    # Now-playing payload (empty when offline) with its progress moved
+    # forward, or None when the caller has to ask Spotify
+    if now is None:
+        now = time.time()
+
+    snapshot = get_snapshot(uid)
+    if snapshot is None or now >= snapshot.get("fresh_until", 0):
+        return None
+
+    data = dict(snapshot["now_playing"])
+    progress_ms = get_progress(snapshot, now)
+    if progress_ms is not None:
+        duration_ms = (data.get("item") or {}).get("duration_ms")
+        # The next track is unknown until the poller's post-track poll
+        if duration_ms is not None and progress_ms >= duration_ms:
+            return None
+        data["progress_ms"] = progress_ms
+
+    return data
+
+
+def get_stale_now_playing(uid, now=None):
+
+    # Last good now-playing payload, served while Spotify is throttling us
+    snapshot = get_snapshot(uid)
+    if snapshot is None or not snapshot["now_playing"]:
+        return None
+
+    data = dict(snapshot["now_playing"])
+    progress_ms = get_progress(snapshot, now)
+    if progress_ms is not None:
+        duration_ms = (data.get("item") or {}).get("duration_ms")
+        data["progress_ms"] = min(progress_ms, duration_ms) if duration_ms else progress_ms
+    data["stale"] = True
+
+    return data
@@ -4,11 +4,13 @@ from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
-import requests
 import json
 import os
 import random
 
+from util import circuit_breaker, session
+from util.rate_limit import governor
+
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_SECRET_ID = os.getenv("SPOTIFY_SECRET_ID")
 BASE_URL = os.getenv("BASE_URL")
@@ -21,6 +23,7 @@ SPOTIFY_URL_NOW_PLAYING = "https://api.spotify.com/v1/me/player/currently-playin
 SPOTIFY_URL_RECENTLY_PLAY = (
     "https://api.spotify.com/v1/me/player/recently-played?limit=10"
 )
+SPOTIFY_URL_RECENTLY_PLAY_BASE = "https://api.spotify.com/v1/me/player/recently-played"
 
 SPOTIFY_URL_GENERATE_TOKEN = "https://accounts.spotify.com/api/token"
 SPOTIFY_URL_USER_INFO = "https://api.spotify.com/v1/me"
@@ -28,6 +31,47 @@ SPOTIFY_URL_USER_INFO = "https://api.spotify.com/v1/me"
 class InvalidTokenError(Exception):
     pass
 
+# Any other refresh failure (invalid_client, server_error, ...): nothing says
+# the user's grant is gone, so it is retried instead of negative-cached
+class TokenRefreshError(Exception):
+    pass
+
+class RateLimitedError(Exception):
+    pass
+
+# A RateLimitedError, so callers serving a stale snapshot when throttled do
+# the same while the host is down
+class CircuitOpenError(RateLimitedError):
+    pass
+
+def request_spotify(endpoint, method, url, max_wait=None, **kwargs):
+
+    # Deferred locally when over budget (after waiting up to max_wait for a
+    # token), and every caller backs off once Spotify answers 429
+    if not governor.acquire(endpoint, max_wait):
+        raise RateLimitedError(endpoint)
+
+    breaker = circuit_breaker.get_breaker(url)
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+
+    try:
+        response = session.request(method, url, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    if response.status_code == 429:
+        governor.backoff(response.headers.get("Retry-After"))
+        raise RateLimitedError(endpoint)
+
+    return response
+
 def get_authorization():
 
     return b64encode(f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_SECRET_ID}".encode()).decode(
@@ -44,7 +88,7 @@ def generate_token(authorization_code):
 
     headers = {"Authorization": f"Basic {get_authorization()}"}
 
-    response = requests.post(SPOTIFY_URL_GENERATE_TOKEN, data=data, headers=headers)
+    response = request_spotify("token", "POST", SPOTIFY_URL_GENERATE_TOKEN, data=data, headers=headers)
     response_json = response.json()
 
     return response_json
@@ -58,7 +102,7 @@ def refresh_token(refresh_token):
 
     headers = {"Authorization": f"Basic {get_authorization()}"}
 
-    response = requests.post(SPOTIFY_URL_REFRESH_TOKEN, data=data, headers=headers)
+    response = request_spotify("token", "POST", SPOTIFY_URL_REFRESH_TOKEN, data=data, headers=headers)
     response_json = response.json()
 
     return response_json
@@ -67,16 +111,28 @@ def get_user_profile(access_token):
 
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    response = requests.get(SPOTIFY_URL_USER_INFO, headers=headers)
+    response = request_spotify("profile", "GET", SPOTIFY_URL_USER_INFO, headers=headers)
     response_json = response.json()
 
     return response_json
 
-def get_recently_play(access_token):
+def get_recently_play_url(limit=10, after=None):
+
+    # after: unix ms cursor, only plays newer than it are returned
+    if limit == 10 and after is None:
+        return SPOTIFY_URL_RECENTLY_PLAY
+
+    url = f"{SPOTIFY_URL_RECENTLY_PLAY_BASE}?limit={int(limit)}"
+    if after is not None:
+        url += f"&after={int(after)}"
+
+    return url
+
+def get_recently_play(access_token, limit=10, after=None):
 
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    response = requests.get(SPOTIFY_URL_RECENTLY_PLAY, headers=headers)
+    response = request_spotify("recently_played", "GET", get_recently_play_url(limit, after), headers=headers)
 
     if response.status_code == 204:
         return {}
@@ -84,11 +140,11 @@ def get_recently_play(access_token):
     response_json = response.json()
     return response_json
 
-def get_now_playing(access_token):
+def get_now_playing(access_token, max_wait=None):
 
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    response = requests.get(SPOTIFY_URL_NOW_PLAYING, headers=headers)
+    response = request_spotify("now_playing", "GET", SPOTIFY_URL_NOW_PLAYING, max_wait, headers=headers)
 
     if response.status_code == 204:
         return {}
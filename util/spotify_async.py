@@ -0,0 +1,280 @@
+import asyncio
+import os
+import threading
+
+import httpx
+
+from util import badge, circuit_breaker, recent_history, session, snapshots, spotify
+from util.rate_limit import governor
+
+# Async counterpart of the view's Spotify calls. For uids that are usually
+# offline, now-playing and recently-played are requested together instead of
+# one after the other, and the cover download runs while the caller prepares
+# the template on a worker thread. run_sync() bridges coroutines into the
+# synchronous Flask/WSGI app (api/batch.py, api/index.py) through one event
+# loop thread per process.
+
+# Fraction of recent lookups that found the user offline before speculating
+OFFLINE_SPECULATION_THRESHOLD = float(os.getenv("OFFLINE_SPECULATION_THRESHOLD", "0.5"))
+OFFLINE_HISTORY_WEIGHT = 0.2
+OFFLINE_HISTORY_MAXSIZE = 10000
+
+
+class OfflineHistory:
+    def __init__(self, threshold=OFFLINE_SPECULATION_THRESHOLD, weight=OFFLINE_HISTORY_WEIGHT):
+        self.threshold = threshold
+        self.weight = weight
+        self._ratios = {}
+
+    def record(self, uid, is_offline):
+
+        if len(self._ratios) >= OFFLINE_HISTORY_MAXSIZE and uid not in self._ratios:
+            self._ratios.pop(next(iter(self._ratios)))
+
+        previous = self._ratios.get(uid, 0.0)
+        self._ratios[uid] = previous + self.weight * (float(is_offline) - previous)
+
+    def is_usually_offline(self, uid):
+
+        return self._ratios.get(uid, 0.0) >= self.threshold
+
+
+offline_history = OfflineHistory()
+
+_clients = {}
+_make_transport = None
+
+
+def make_limits():
+
+    return httpx.Limits(
+        max_connections=session.HTTP_POOL_MAXSIZE,
+        max_keepalive_connections=session.HTTP_POOL_MAXSIZE,
+    )
+
+
+def make_client():
+
+    timeout = httpx.Timeout(session.HTTP_READ_TIMEOUT, connect=session.HTTP_CONNECT_TIMEOUT)
+    if _make_transport is not None:
+        return httpx.AsyncClient(transport=_make_transport(), timeout=timeout)
+
+    return httpx.AsyncClient(limits=make_limits(), timeout=timeout)
+
+
+def set_transport_factory(make_transport):
+
+    global _make_transport
+
+    # Each loop's client gets its own transport (benchmarks/fake_spotify.py)
+    _make_transport = make_transport
+    _clients.clear()
+
+
+def get_client():
+
+    # An AsyncClient is bound to the loop it was first used on
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = make_client()
+        _clients[loop] = client
+
+    return client
+
+
+async def get_json(endpoint, url, access_token, max_wait=None):
+
+    if not await governor.acquire_async(endpoint, max_wait):
+        raise spotify.RateLimitedError(endpoint)
+
+    breaker = circuit_breaker.get_breaker(url)
+    if not breaker.allow():
+        raise spotify.CircuitOpenError(breaker.name)
+
+    headers = {"Authorization": f"Bearer {access_token}"}
+    connected = []
+
+    async def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            connected.append(True)
+
+    try:
+        response = await get_client().get(url, headers=headers, extensions={"trace": trace})
+        # Counted with the requests session's pools, for one reuse rate
+        session.record_client_request(breaker.name, bool(connected))
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled (get_song_info drops a recently-played task it no longer needs)
+        breaker.release()
+        raise
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    if response.status_code == 429:
+        governor.backoff(response.headers.get("Retry-After"))
+        raise spotify.RateLimitedError(endpoint)
+
+    if response.status_code == 204:
+        return {}
+
+    return response.json()
+
+
+async def get_now_playing(access_token, max_wait=None):
+
+    return await get_json("now_playing", spotify.SPOTIFY_URL_NOW_PLAYING, access_token, max_wait)
+
+
+async def get_recently_play(access_token, limit=10, after=None):
+
+    return await get_json("recently_played", spotify.get_recently_play_url(limit, after), access_token)
+
+
+async def load_image(url):
+
+    response = await get_client().get(url)
+
+    return response.content
+
+
+async def get_recent_items(uid, access_token, entry):
+
+    # Same cursor and fallback logic as the sync client, see recent_history.fetch_steps
+    steps = recent_history.fetch_steps(uid, entry)
+    try:
+        after = next(steps)
+        while True:
+            response = await get_recently_play(access_token, recent_history.RECENT_HISTORY_SIZE, after=after)
+            after = steps.send(response)
+    except StopIteration as done:
+        return done.value
+    except spotify.RateLimitedError as e:
+        return recent_history.get_stale_items(entry, e)
+
+
+async def get_song_info(uid, access_token, show_offline=False):
+
+    item, is_now_playing, progress_ms, duration_ms, _ = await get_song_state(uid, access_token, show_offline)
+
+    return item, is_now_playing, progress_ms, duration_ms
+
+
+# get_song_info plus whether the song came from a throttled fallback, which the
+# cache policy serves as stale
+async def get_song_state(uid, access_token, show_offline=False):
+
+    # A fresh stored buffer needs no recently-played call at all
+    entry = recent_history.get_entry(uid)
+    recent_items = entry["items"] if recent_history.is_fresh(entry) else None
+
+    # A fresh poller snapshot answers without a now-playing call
+    data = snapshots.get_fresh_now_playing(uid) if uid is not None else None
+
+    recently_task = None
+    if data is None and not show_offline and recent_items is None and offline_history.is_usually_offline(uid):
+        recently_task = asyncio.ensure_future(get_recent_items(uid, access_token, entry))
+
+    if data is None:
+        try:
+            data = await get_now_playing(access_token, badge.get_rate_limit_wait(uid, show_offline))
+        except BaseException as e:
+            if recently_task is not None:
+                recently_task.cancel()
+            if not isinstance(e, spotify.RateLimitedError):
+                raise
+            song = badge.get_throttled_song(uid, show_offline)
+            if song is None:
+                raise
+            item, is_now_playing, progress_ms = song
+            return item, is_now_playing, progress_ms, item.get("duration_ms") if item else None, True
+        # Kept for get_throttled_song, as api/index.py does
+        if uid is not None:
+            snapshots.set_snapshot(uid, snapshots.make_snapshot(data))
+
+    # Ads (and episodes without additional_types) come back with no item
+    is_playing = bool(data and data.get("item"))
+    offline_history.record(uid, not is_playing)
+
+    if is_playing:
+        if recently_task is not None:
+            recently_task.cancel()
+
+        item = data["item"]
+        item["currently_playing_type"] = data.get("currently_playing_type", "track")
+        return item, True, data.get("progress_ms"), item.get("duration_ms"), False
+
+    if show_offline:
+        return None, False, None, None, False
+
+    if recent_items is None:
+        if recently_task is None:
+            recently_task = asyncio.ensure_future(get_recent_items(uid, access_token, entry))
+        recent_items = await recently_task
+
+    item, is_now_playing, progress_ms = badge.pick_recent_song(recent_items)
+    return item, is_now_playing, progress_ms, None, False
+
+
+async def get_badge_data(uid, access_token, show_offline=False, cover_image=True, prepare=None, load_cover=None):
+
+    item, is_now_playing, progress_ms, duration_ms, stale = await get_song_state(uid, access_token, show_offline)
+
+    # load_cover: blocking loader (the cover cache) used instead of a plain download
+    loop = asyncio.get_running_loop()
+    cover_url = badge.get_cover_url(item) if cover_image else None
+    cover_task = None
+    if cover_url and load_cover is not None:
+        cover_task = loop.run_in_executor(None, load_cover, cover_url)
+    elif cover_url:
+        cover_task = asyncio.ensure_future(load_image(cover_url))
+
+    # Template preparation is CPU work: it runs on a worker thread, overlapping
+    # the cover download, and never blocks the other coroutines on the loop
+    prepared = None
+    if prepare is not None:
+        prepared = await loop.run_in_executor(None, prepare, item, is_now_playing, progress_ms)
+    img = await cover_task if cover_task is not None else None
+
+    return {
+        "item": item,
+        "is_now_playing": is_now_playing,
+        "progress_ms": progress_ms,
+        "duration_ms": duration_ms,
+        "stale": stale,
+        "img": img,
+        "prepared": prepared,
+    }
+
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+
+    global _loop, _loop_pid
+
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                _loop = asyncio.new_event_loop()
+                _loop_pid = os.getpid()
+                _clients.clear()
+                thread = threading.Thread(target=_loop.run_forever, name="spotify-async", daemon=True)
+                thread.start()
+
+    return _loop
+
+
+def run_sync(coro, timeout=None):
+
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+    return future.result(timeout)
@@ -0,0 +1,150 @@
+import gzip
+import os
+import zlib
+from hashlib import sha1
+
+# Badge bodies as a list of pre-encoded byte segments instead of one big
+# string. The cover is rendered as a placeholder and the cached base64 bytes
+# are spliced in at write time, so the largest part of a badge is never
+# copied into the template output, re-encoded or joined. The segments are
+# returned as the WSGI iterable and written one after the other (WSGI servers
+# require bytes, so these are bytes objects shared with the caches rather
+# than memoryviews). Optional gzip/brotli (SVG_COMPRESSION) is computed once
+# per cached body and served under its own ETag (get_etag).
+
+SVG_COMPRESSION = os.getenv("SVG_COMPRESSION", "false") == "true"
+SVG_COMPRESS_MIN_BYTES = int(os.getenv("SVG_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8"?>'
+# Passed to the template as img; never valid in a base64 string or a name
+COVER_PLACEHOLDER = "\x00cover\x00"
+
+
+class Segments:
+    def __init__(self, parts=()):
+        self._parts = []
+        self._compressed = {}
+        self.size = 0
+        for part in parts:
+            self.append(part)
+
+    def append(self, part):
+
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        if len(part):
+            self._parts.append(part)
+            self.size += len(part)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self._parts)
+
+    def getvalue(self):
+        return b"".join(self._parts)
+
+    def etag(self):
+
+        digest = sha1()
+        for part in self._parts:
+            digest.update(part)
+
+        return '"{}"'.format(digest.hexdigest())
+
+    def compress(self, encoding):
+
+        body = self._compressed.get(encoding)
+        if body is None:
+            if encoding == "br":
+                import brotli
+
+                compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+                body = b"".join([compressor.process(part) for part in self._parts] + [compressor.finish()])
+            elif encoding == "gzip":
+                compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                body = b"".join([compressor.compress(part) for part in self._parts] + [compressor.flush()])
+            else:
+                raise ValueError(f"Unknown content encoding: {encoding}")
+            self._compressed[encoding] = body
+
+        return body
+
+
+def splice(rendered, cover=None):
+
+    # Each piece of template output is encoded once; the cover goes in as is
+    segments = Segments()
+    pieces = rendered.split(COVER_PLACEHOLDER)
+    for i, piece in enumerate(pieces):
+        if i and cover is not None:
+            segments.append(cover)
+        segments.append(piece)
+
+    return segments
+
+
+def has_brotli():
+
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+def negotiate_encoding(accept_encodings, size):
+
+    if not SVG_COMPRESSION or size < SVG_COMPRESS_MIN_BYTES:
+        return None
+
+    if accept_encodings["br"] and has_brotli():
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+
+    return None
+
+
+def get_etag(etag, encoding):
+
+    # A compressed body is a different representation, so it gets its own
+    # strong ETag; a cache must not answer a br request with identity bytes
+    if encoding is None:
+        return etag
+
+    return '{}-{}"'.format(etag[:-1], encoding)
+
+
+def make_body(segments, request, headers):
+
+    encoding = negotiate_encoding(request.accept_encodings, len(segments))
+    headers["Vary"] = "Accept-Encoding"
+
+    if encoding is None:
+        headers["Content-Length"] = str(len(segments))
+        return segments
+
+    body = segments.compress(encoding)
+    headers["Content-Encoding"] = encoding
+    if "ETag" in headers:
+        headers["ETag"] = get_etag(headers["ETag"], encoding)
+    headers["Content-Length"] = str(len(body))
+
+    return body
+
+
+def decompress(body, encoding):
+
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br":
+        import brotli
+
+        return brotli.decompress(body)
+
+    return body
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from util.render_cache import VIEW_OPTIONS
+from util.singleflight import SingleFlight
+
+# Stale-while-revalidate for rendered badges. The last badge built for a uid
+# and set of view options is served as is for SWR_FRESH_FOR seconds. Until
+# SWR_HARD_STALE it is still served at once, while one background refresh per
+# key (coalesced with any synchronous build) fetches Spotify and renders the
+# next one. Past the hard-stale limit, or on the first request, the request
+# builds the badge itself. A slow Spotify then only delays the refresh, not
+# the README load. Failed refreshes are logged and the old badge is kept.
+
+SWR_ENABLED = os.getenv("SWR_ENABLED", "true") == "true"
+SWR_FRESH_FOR = float(os.getenv("SWR_FRESH_FOR", "5"))
+SWR_HARD_STALE = float(os.getenv("SWR_HARD_STALE", "60"))
+SWR_MAXSIZE = int(os.getenv("SWR_MAXSIZE", "4096"))
+SWR_WORKERS = int(os.getenv("SWR_WORKERS", "4"))
+
+logger = logging.getLogger(__name__)
+
+
+def make_swr_key(uid, options):
+
+    return (uid,) + tuple((name, options.get(name)) for name in VIEW_OPTIONS)
+
+
+class SWRCache:
+    def __init__(self, fresh_for=SWR_FRESH_FOR, hard_stale=SWR_HARD_STALE, maxsize=SWR_MAXSIZE,
+                 workers=SWR_WORKERS, enabled=SWR_ENABLED, clock=time.monotonic):
+        self.fresh_for = fresh_for
+        self.hard_stale = hard_stale
+        self.maxsize = maxsize
+        self.workers = workers
+        self.enabled = enabled
+        self.clock = clock
+        self.fresh = 0
+        self.stale = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.flight = SingleFlight()
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def get(self, key, build):
+
+        # Returns the value and its age in seconds
+        if not self.enabled:
+            return build(), 0.0
+
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None:
+            value, built_at = entry
+            age = now - built_at
+            if age < self.fresh_for:
+                self.fresh += 1
+                return value, age
+            if age < self.hard_stale:
+                self.stale += 1
+                self.revalidate(key, build)
+                return value, age
+
+        self.misses += 1
+        return self.flight.do(key, self._build, key, build), 0.0
+
+    def _build(self, key, build):
+
+        value = build()
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def revalidate(self, key, build):
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        self.get_executor().submit(self._refresh, key, build)
+
+    def _refresh(self, key, build):
+
+        try:
+            self.flight.do(key, self._build, key, build)
+            self.refreshes += 1
+        except Exception:
+            logger.exception("Background refresh of %s failed", key[0])
+            self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_executor(self):
+
+        # Worker threads do not survive a fork
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="swr")
+                    self._executor_pid = os.getpid()
+                    self._refreshing.clear()
+
+        return self._executor
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+
+        return {
+            "entries": len(self._entries),
+            "fresh": self.fresh,
+            "stale": self.stale,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+swr_cache = SWRCache()
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+# Registry of the spotify.*.html.j2 themes. Templates are compiled once per
+# worker (warm_up, called from gunicorn's post_fork) and optionally loaded from
+# a bytecode cache directory (THEME_BYTECODE_CACHE), so no request pays the
+# parse/compile cost. Per-theme layout lives here instead of in if/else
+# branches of the render path.
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "api", "templates")
+THEME_BYTECODE_CACHE = os.getenv("THEME_BYTECODE_CACHE")
+
+DEFAULT_THEME = "default"
+
+THEMES = {
+    "default": {
+        "template": "spotify.default.html.j2",
+        "width": 320,
+        "height": 445,
+        "height_no_cover": 145,
+        "num_bar": 75,
+        "cover_size": 300,
+        "params": ("background_color", "bar_color", "bar_color_cover", "cover_image", "show_offline", "interchange"),
+    },
+    "compact": {
+        "template": "spotify.compact.html.j2",
+        "width": 320,
+        "height": 400,
+        "height_no_cover": 100,
+        "num_bar": 75,
+        "cover_size": 300,
+        "params": ("background_color", "cover_image", "show_offline", "interchange"),
+    },
+    "natemoo-re": {
+        "template": "spotify.natemoo-re.html.j2",
+        "width": 320,
+        "height": 84,
+        "height_no_cover": 84,
+        "num_bar": 100,
+        "cover_size": 64,
+        "params": ("bar_color", "bar_color_cover", "cover_image", "show_offline", "interchange"),
+    },
+    "novatorem": {
+        "template": "spotify.novatorem.html.j2",
+        "width": 320,
+        "height": 100,
+        "height_no_cover": 100,
+        "num_bar": 100,
+        "cover_size": 80,
+        "params": ("bar_color", "bar_color_cover", "cover_image", "show_offline", "interchange"),
+    },
+    "karaoke": {
+        "template": "spotify.karaoke.html.j2",
+        "width": 320,
+        "height": 445,
+        "height_no_cover": 145,
+        "num_bar": 75,
+        "cover_size": 300,
+        "params": ("background_color", "cover_image", "show_offline", "interchange"),
+    },
+    "apple": {
+        "template": "spotify.apple.html.j2",
+        "width": 345,
+        "height": 534,
+        "height_no_cover": 534,
+        "num_bar": 0,
+        "cover_size": 288,
+        "params": ("mode", "cover_image", "show_offline", "interchange"),
+        "progress": True,
+    },
+    "spotify-embed": {
+        "template": "spotify.spotify-embed.html.j2",
+        "width": 460,
+        "height": 152,
+        "height_no_cover": 152,
+        "num_bar": 0,
+        "cover_size": 120,
+        "params": ("mode", "cover_image", "show_offline", "interchange"),
+        "progress": True,
+    },
+}
+
+_lock = threading.Lock()
+_environment = None
+_templates = {}
+
+
+def get_theme(name):
+
+    return THEMES.get(name, THEMES[DEFAULT_THEME])
+
+
+def get_theme_name(name):
+
+    return name if name in THEMES else DEFAULT_THEME
+
+
+def get_height(name, cover_image=True):
+
+    theme = get_theme(name)
+
+    return theme["height"] if cover_image else theme["height_no_cover"]
+
+
+def make_environment(bytecode_cache_dir=THEME_BYTECODE_CACHE):
+
+    bytecode_cache = None
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+
+    # Same settings Flask uses for these templates: *.html.j2 is not
+    # autoescaped, the view escapes names itself.
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=False,
+        bytecode_cache=bytecode_cache,
+        auto_reload=False,
+    )
+
+
+def get_environment():
+
+    global _environment
+
+    if _environment is None:
+        with _lock:
+            if _environment is None:
+                _environment = make_environment()
+
+    return _environment
+
+
+def get_template(name):
+
+    name = get_theme_name(name)
+    template = _templates.get(name)
+    if template is None:
+        template = get_environment().get_template(THEMES[name]["template"])
+        _templates[name] = template
+
+    return template
+
+
+def render_theme(name, **rendered_data):
+
+    return get_template(name).render(**rendered_data)
+
+
+def warm_up():
+
+    start = time.monotonic()
+    for name in THEMES:
+        get_template(name)
+
+    return time.monotonic() - start
+
+
+def reset():
+
+    global _environment
+
+    with _lock:
+        _environment = None
+        _templates.clear()
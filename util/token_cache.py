@@ -0,0 +1,280 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+
+# Access tokens are cached in two tiers: a small in-process LRU in front of an
+# optional tier shared by every worker on the host (file) or every host
+# (Redis protocol). Entries are dropped TOKEN_CACHE_EXPIRY_MARGIN seconds
+# before Spotify expires the token, so a cached token is always usable for
+# the rest of the request.
+
+TOKEN_CACHE_BACKEND = os.getenv("TOKEN_CACHE_BACKEND", "local")
+TOKEN_CACHE_MAXSIZE = int(os.getenv("TOKEN_CACHE_MAXSIZE", "1024"))
+TOKEN_CACHE_EXPIRY_MARGIN = int(os.getenv("TOKEN_CACHE_EXPIRY_MARGIN", "60"))
+TOKEN_CACHE_PATH = os.getenv(
+    "TOKEN_CACHE_PATH", os.path.join(tempfile.gettempdir(), "spotify-token-cache")
+)
+TOKEN_CACHE_REDIS_URL = os.getenv("TOKEN_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+DEFAULT_EXPIRES_IN = 3600
+
+
+def get_expired_ts(token_info, now=None):
+
+    if token_info.get("expired_ts") is not None:
+        return int(token_info["expired_ts"])
+
+    if now is None:
+        now = time.time()
+
+    return int(now) + int(token_info.get("expires_in", DEFAULT_EXPIRES_IN))
+
+
+class LocalTokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_MAXSIZE, margin=TOKEN_CACHE_EXPIRY_MARGIN, clock=time.time):
+        self.maxsize = maxsize
+        self.margin = margin
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return None
+
+            deadline, token_info = entry
+            if self.clock() >= deadline:
+                del self._entries[uid]
+                return None
+
+            self._entries.move_to_end(uid)
+            return token_info
+
+    def set(self, uid, token_info):
+
+        deadline = get_expired_ts(token_info, self.clock()) - self.margin
+        if self.clock() >= deadline:
+            return
+
+        with self._lock:
+            self._entries[uid] = (deadline, token_info)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, uid):
+
+        with self._lock:
+            self._entries.pop(uid, None)
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Process-local stand-in for a shared tier, used in tests.
+class MemorySharedCache:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return None
+            deadline, token_info = entry
+            if self.clock() >= deadline:
+                del self._entries[uid]
+                return None
+            return dict(token_info)
+
+    def set(self, uid, token_info, deadline):
+
+        with self._lock:
+            self._entries[uid] = (deadline, dict(token_info))
+
+    def delete(self, uid):
+
+        with self._lock:
+            self._entries.pop(uid, None)
+
+
+# Shared tier for workers on one host, one JSON file per uid.
+class FileTokenCache:
+    def __init__(self, path=TOKEN_CACHE_PATH, clock=time.time):
+        self.path = path
+        self.clock = clock
+        os.makedirs(path, exist_ok=True)
+
+    def _filename(self, uid):
+        return os.path.join(self.path, sha1(uid.encode()).hexdigest() + ".json")
+
+    def get(self, uid):
+
+        try:
+            with open(self._filename(uid)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.clock() >= entry["deadline"]:
+            self.delete(uid)
+            return None
+
+        return entry["token_info"]
+
+    def set(self, uid, token_info, deadline):
+
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"deadline": deadline, "token_info": token_info}, f)
+            os.replace(tmp, self._filename(uid))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def delete(self, uid):
+
+        try:
+            os.unlink(self._filename(uid))
+        except OSError:
+            pass
+
+
+# Shared tier for several hosts, for any server speaking the Redis protocol.
+class RedisTokenCache:
+    def __init__(self, url=TOKEN_CACHE_REDIS_URL, prefix="spotify:token:", clock=time.time, client=None):
+        if client is None:
+            # Optional dependency, only needed when this backend is selected
+            import redis
+
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+        self.prefix = prefix
+        self.clock = clock
+
+    def get(self, uid):
+
+        value = self.client.get(self.prefix + uid)
+        if value is None:
+            return None
+
+        return json.loads(value)
+
+    def set(self, uid, token_info, deadline):
+
+        ttl = int(deadline - self.clock())
+        if ttl <= 0:
+            return
+
+        self.client.set(self.prefix + uid, json.dumps(token_info), ex=ttl)
+
+    def delete(self, uid):
+
+        self.client.delete(self.prefix + uid)
+
+
+class TwoTierTokenCache:
+    def __init__(self, local=None, shared=None, margin=TOKEN_CACHE_EXPIRY_MARGIN):
+        self.local = local if local is not None else LocalTokenCache(margin=margin)
+        self.shared = shared
+        self.margin = margin
+
+    def get(self, uid):
+
+        token_info = self.local.get(uid)
+        if token_info is not None or self.shared is None:
+            return token_info
+
+        token_info = self.shared.get(uid)
+        if token_info is not None:
+            self.local.set(uid, token_info)
+
+        return token_info
+
+    def set(self, uid, token_info):
+
+        token_info = dict(token_info)
+        token_info["expired_ts"] = get_expired_ts(token_info, self.local.clock())
+
+        self.local.set(uid, token_info)
+        if self.shared is not None:
+            self.shared.set(uid, token_info, token_info["expired_ts"] - self.margin)
+
+    def delete(self, uid):
+
+        self.local.delete(uid)
+        if self.shared is not None:
+            self.shared.delete(uid)
+
+    def clear(self):
+
+        self.local.clear()
+
+
+def make_token_cache(backend=TOKEN_CACHE_BACKEND):
+
+    if backend == "local":
+        shared = None
+    elif backend == "memory":
+        shared = MemorySharedCache()
+    elif backend == "file":
+        shared = FileTokenCache()
+    elif backend == "redis":
+        shared = RedisTokenCache()
+    else:
+        raise ValueError(f"Unknown TOKEN_CACHE_BACKEND: {backend}")
+
+    return TwoTierTokenCache(shared=shared)
+
+
+_token_cache = None
+
+
+def get_token_cache():
+
+    global _token_cache
+
+    if _token_cache is None:
+        _token_cache = make_token_cache()
+
+    return _token_cache
+
+
+def set_token_cache(cache):
+
+    global _token_cache
+
+    _token_cache = cache
+
+
+def get_cache_token_info(uid):
+
+    return get_token_cache().get(uid)
+
+
+def set_cache_token_info(uid, token_info):
+
+    get_token_cache().set(uid, token_info)
+
+
+def delete_cache_token_info(uid):
+
+    get_token_cache().delete(uid)